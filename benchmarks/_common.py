@@ -0,0 +1,135 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Shared helpers for the nusex benchmarks.
+
+These scripts are not part of the test suite. Run them directly from
+the repository root, i.e. ``python benchmarks/nsx_read.py``.
+"""
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, f"{Path(__file__).parent.parent}")
+
+WORDS = (
+    b"import",
+    b"def",
+    b"return",
+    b"PROJECTNAME",
+    b"self",
+    b"class",
+    b"value",
+    b"data",
+    b"for",
+    b"in",
+    b"if",
+    b"else",
+    b"PROJECTAUTHOR",
+    b"None",
+    b"True",
+    b"False",
+    b"print",
+    b"with",
+    b"open",
+    b"path",
+)
+
+
+# Source for a ``peak_rss()`` function, for use in probe scripts run in
+# a fresh interpreter. ru_maxrss survives exec on Linux, so the fresh
+# high water mark is preferred where available.
+PEAK_RSS = """
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            rss = [int(l.split()[1]) for l in f if l.startswith("VmHWM")][0]
+    except OSError:
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            rss = float("nan")
+    return rss / 1024
+"""
+
+
+def make_body(size, rng):
+    """Generate a text-like body of roughly ``size`` bytes."""
+    out = bytearray()
+    while len(out) < size:
+        out += b" ".join(rng.choice(WORDS) for _ in range(12)) + b"\n"
+    return bytes(out[:size])
+
+
+def make_files(count, *, avg_size=1024, binary_ratio=0.0, seed=0):
+    """Generate a synthetic ``data["files"]`` mapping."""
+    rng = random.Random(seed)
+    files = {}
+    for i in range(count):
+        size = max(1, int(rng.expovariate(1 / avg_size)))
+        name = f"pkg{i % 97}/sub{i % 13}/module_{i}.py"
+        if rng.random() < binary_ratio:
+            files[name.replace(".py", ".bin")] = os.urandom(size)
+        else:
+            files[name] = make_body(size, rng)
+    return files
+
+
+def make_data(count, **kwargs):
+    return {
+        "files": make_files(count, **kwargs),
+        "installs": ["analytix", "nusex"],
+        "as_addon_for": "",
+        "language": "python",
+    }
+
+
+def best_of(func, repeat=3):
+    """Return the best wall time of ``repeat`` calls, and the result of
+    the last call."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(title, rows, headers):
+    widths = [
+        max(len(f"{r[i]}") for r in (headers, *rows))
+        for i in range(len(headers))
+    ]
+    print(f"\n{title}")
+    print("  ".join(f"{h:>{w}}" for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(f"{c:>{w}}" for c, w in zip(row, widths)))
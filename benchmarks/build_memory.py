@@ -0,0 +1,139 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Measure peak RSS when building a template from a directory.
+
+The legacy pipeline reads every file into a dictionary, runs the
+blueprint over all of them, and then serialises the result; the
+streaming pipeline processes and writes one file at a time. Each
+measurement runs in a fresh interpreter.
+"""
+
+import os
+import random
+import subprocess as sp
+import sys
+import tempfile
+
+from _common import PEAK_RSS, make_body, report
+
+PROBE = (
+    PEAK_RSS
+    + """
+import os, sys, time
+sys.path.insert(0, {root!r})
+from pathlib import Path
+from nusex import Template
+from nusex.blueprints import PythonBlueprint
+from nusex.spec import NSXSpecIO
+
+start = time.perf_counter()
+if {streaming}:
+    t = Template.from_dir("__bench_build__", {src!r})
+    t.save()
+    t.delete()
+else:
+    files = Template("__bench_build__").get_file_listing({src!r})
+    nparts = len(Path({src!r}).resolve().parts)
+    data = NSXSpecIO().defaults
+    data["files"] = {{
+        "/".join(f"{{f.resolve()}}".split(os.sep)[nparts:]): f.read_bytes()
+        for f in files
+    }}
+    data = PythonBlueprint("bench", data)().data
+    NSXSpecIO().write({out!r}, data)
+elapsed = time.perf_counter() - start
+print(elapsed, peak_rss())
+"""
+)
+
+
+def make_tree(root, count, avg_size, largest):
+    rng = random.Random(0)
+    for i in range(count):
+        path = os.path.join(root, f"pkg{i % 37}", f"module_{i}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = max(1, int(rng.expovariate(1 / avg_size)))
+        with open(path, "wb") as f:
+            f.write(make_body(size, rng))
+
+    with open(os.path.join(root, "big.lock"), "wb") as f:
+        f.write(make_body(largest, rng))
+
+
+def probe(src, out, streaming):
+    code = PROBE.format(
+        root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        src=src,
+        out=out,
+        streaming=streaming,
+    )
+    stdout = sp.run(
+        [sys.executable, "-c", code], capture_output=True, check=True
+    ).stdout.split()
+    return float(stdout[0]), float(stdout[1])
+
+
+def main():
+    rows = []
+
+    for count, avg_size in ((2_000, 10_240), (5_000, 40_960)):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            make_tree(src, count, avg_size, 4 << 20)
+            mb = sum(
+                os.path.getsize(os.path.join(d, f))
+                for d, _, fs in os.walk(src)
+                for f in fs
+            )
+            mb /= 1_000_000
+
+            for streaming in (False, True):
+                secs, rss = min(
+                    probe(src, os.path.join(tmp, "out.nsx"), streaming)
+                    for _ in range(3)
+                )
+                rows.append(
+                    (
+                        f"{count + 1:,}",
+                        f"{mb:,.1f}",
+                        "streaming" if streaming else "legacy",
+                        f"{secs * 1000:,.1f}",
+                        f"{rss:,.1f}",
+                    )
+                )
+
+    report(
+        "Template build (largest file 4 MiB)",
+        rows,
+        ("files", "MB", "pipeline", "ms", "peak RSS (MB)"),
+    )
+
+
+if __name__ == "__main__":
+    main()
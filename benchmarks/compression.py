@@ -0,0 +1,105 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Report the compression ratio of NSX templates against the time it
+costs to build (write) and deploy (stream out) them."""
+
+import os
+import random
+import tempfile
+
+from _common import best_of, make_body, make_files, report
+
+from nusex.spec import NSXReader, NSXSpecIO
+
+
+def make_data(seed=0):
+    rng = random.Random(seed)
+    files = make_files(2_000, avg_size=4_096, binary_ratio=0.1, seed=seed)
+    # A couple of large, repetitive lockfiles.
+    for i in range(2):
+        files[f"lock{i}.json"] = make_body(4_000_000, rng)
+    # Some already-compressed assets.
+    for i in range(10):
+        files[f"assets/image{i}.png"] = os.urandom(200_000)
+    return {
+        "files": files,
+        "installs": [],
+        "as_addon_for": "",
+        "language": "python",
+    }
+
+
+def deploy(path, dest):
+    with NSXReader(path) as r:
+        for name in r:
+            target = os.path.join(dest, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                for chunk in r.iter_chunks(name):
+                    f.write(chunk)
+
+
+def main():
+    data = make_data()
+    raw_size = sum(len(v) for v in data["files"].values())
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for compress in (False, True):
+            path = os.path.join(tmp, f"bench_{compress}.nsx")
+            build, _ = best_of(
+                lambda: NSXSpecIO().write(path, data, compress=compress)
+            )
+            dest = os.path.join(tmp, f"out_{compress}")
+            deploy_secs, _ = best_of(lambda: deploy(path, dest))
+            size = os.path.getsize(path)
+
+            with NSXReader(path) as r:
+                packed = sum(1 for e in r.entries.values() if e.flags)
+
+            rows.append(
+                (
+                    "compressed" if compress else "raw",
+                    f"{size / 1_000_000:,.2f}",
+                    f"{raw_size / size:,.2f}x",
+                    f"{packed:,}/{len(data['files']):,}",
+                    f"{build * 1000:,.0f}",
+                    f"{deploy_secs * 1000:,.0f}",
+                )
+            )
+
+    report(
+        f"NSX compression ({raw_size / 1_000_000:,.1f} MB of files)",
+        rows,
+        ("mode", "MB", "ratio", "packed", "build ms", "deploy ms"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare serial and parallel template deployment, and direct writes
+with staged (atomic) ones.
+
+The template holds many small source files spread over a few hundred
+directories. Gains are largest on network and overlay filesystems;
+point TMPDIR at one to measure them, i.e.
+``TMPDIR=/mnt/nfs python benchmarks/deploy.py``.
+"""
+
+import os
+import shutil
+import tempfile
+
+from _common import best_of, make_data, report
+
+from nusex import Template
+from nusex.spec import NSXSpecIO
+
+
+def main():
+    rows = []
+    template = Template("__bench_deploy__")
+    NSXSpecIO().write(template.path, make_data(5_000, avg_size=2_048))
+    template.load()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for jobs in (1, 8):
+                for mode, kwargs in (
+                    ("direct", {"atomic": False}),
+                    ("atomic", {}),
+                    ("atomic+fsync", {"fsync": True}),
+                ):
+                    dest = os.path.join(tmp, "my_app")
+
+                    def deploy():
+                        shutil.rmtree(dest, ignore_errors=True)
+                        template.deploy(destination=dest, jobs=jobs, **kwargs)
+
+                    secs, _ = best_of(deploy, 5)
+                    rows.append(
+                        ("5,000", f"{jobs}", mode, f"{secs * 1000:,.1f}")
+                    )
+    finally:
+        template.delete()
+
+    report("Template deploy", rows, ("files", "jobs", "mode", "ms"))
+
+
+if __name__ == "__main__":
+    main()
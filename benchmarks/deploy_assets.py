@@ -0,0 +1,88 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare writing placeholder-free files out through Python with
+copying them straight from the NSX file in the kernel.
+
+The template holds binary assets (200 files of 1 MiB by default, as
+with fonts, images, and wheels). Pass a different file count as the
+first argument, i.e. ``python benchmarks/deploy_assets.py 50``.
+"""
+
+import os
+import sys
+import tempfile
+
+from _common import best_of, report
+
+from nusex.spec import NSXReader, NSXWriter
+
+
+def chunked(reader, dest):
+    # The deploy implementation prior to 1.4.
+    for name in reader:
+        with open(os.path.join(dest, name), "wb") as f:
+            for data in reader.iter_chunks(name):
+                f.write(data)
+
+
+def extracted(reader, dest):
+    for name in reader:
+        reader.extract(name, os.path.join(dest, name))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = 1 << 20
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.nsx")
+        with NSXWriter(path) as w:
+            for i in range(count):
+                w.add(f"asset_{i}.bin", os.urandom(size), placeholders=[])
+
+        with NSXReader(path) as r:
+            for mode, func in (("chunked", chunked), ("extract", extracted)):
+                dest = os.path.join(tmp, mode)
+                os.makedirs(dest)
+                secs, _ = best_of(lambda: func(r, dest))
+                mbs = count * size / 1_000_000 / secs
+                rows.append(
+                    (f"{count:,}", mode, f"{secs * 1000:,.1f}", f"{mbs:,.0f}")
+                )
+
+    report(
+        "Deploy of placeholder-free files (1 MiB each)",
+        rows,
+        ("files", "mode", "ms", "MB/s"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare serial and concurrent asset downloads, and fresh downloads
+with repeated ones where nothing has changed. Repeats are measured
+both with conditional requests for each file, and with an asset index.
+
+Files are served from a local server which waits a little before each
+response, to stand in for the round trip to GitHub.
+"""
+
+import functools
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from _common import best_of, report
+
+from nusex.utils import Downloader, downloader
+
+FILES = 50
+LATENCY = 0.05
+REPEAT = 3
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    sent = 0
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        super().do_GET()
+
+    def copyfile(self, source, outputfile):
+        data = source.read()
+        SlowHandler.sent += len(data)
+        outputfile.write(data)
+
+    def log_message(self, *args):
+        ...
+
+
+def main():
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        remote = Path(tmp) / "remote"
+        remote.mkdir()
+        files, assets = [], []
+        for i in range(FILES):
+            name = f"license_{i}.txt"
+            data = f"{i}".encode().ljust(65536, b"x")
+            (remote / name).write_bytes(data)
+            files.append(name)
+            assets.append(
+                {
+                    "name": name,
+                    "url": name,
+                    "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+            )
+        (remote / "licenses.json").write_text(
+            json.dumps({"format": 1, "assets": assets})
+        )
+
+        handler = functools.partial(SlowHandler, directory=f"{remote}")
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        downloader.RAW_URL = f"http://127.0.0.1:{httpd.server_port}"
+        downloader.MANIFEST_DIR = Path(tmp) / "manifests"
+        local = Path(tmp) / "local"
+
+        try:
+            for jobs in (1, 4, 8, 16):
+                dl = Downloader("licenses", jobs=jobs)
+                dl.directory = local
+                dl.files = files
+
+                def fresh():
+                    shutil.rmtree(local, ignore_errors=True)
+                    shutil.rmtree(downloader.MANIFEST_DIR, ignore_errors=True)
+                    local.mkdir()
+                    dl.download()
+
+                def indexed():
+                    dl = Downloader(
+                        "licenses", jobs=jobs, mirror=downloader.RAW_URL
+                    )
+                    dl.directory = local
+                    dl.download()
+
+                for mode, func in (
+                    ("fresh", fresh),
+                    ("repeat", dl.download),
+                    ("indexed repeat", indexed),
+                ):
+                    SlowHandler.sent = 0
+                    secs, _ = best_of(func, REPEAT)
+                    kb = SlowHandler.sent / REPEAT / 1024
+                    rows.append(
+                        (
+                            f"{FILES}",
+                            f"{jobs}",
+                            mode,
+                            f"{secs * 1000:,.1f}",
+                            f"{kb:,.0f}",
+                        )
+                    )
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    report(
+        f"Asset download ({LATENCY * 1000:.0f}ms latency)",
+        rows,
+        ("files", "jobs", "mode", "ms", "KiB sent"),
+    )
+
+
+if __name__ == "__main__":
+    main()
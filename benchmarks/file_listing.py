@@ -0,0 +1,136 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare the rglob-based file listing with the scandir walker.
+
+The tree is a small project with a large virtualenv (200,000 files by
+default) and a .git directory in it, both of which are ignored by the
+default build settings. Pass a different virtualenv size as the first
+argument, i.e. ``python benchmarks/file_listing.py 20000``.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from _common import best_of, report
+
+from nusex.utils import walk_files
+
+IGNORE_EXTS = {"pyc", "pyd", "pyo"}
+IGNORE_DIRS = {
+    ".direnv",
+    ".eggs",
+    ".git",
+    ".hg",
+    ".mypy_cache",
+    ".nox",
+    ".tox",
+    ".venv",
+    "venv",
+    ".svn",
+    "_build",
+    "build",
+    "dist",
+    "buck-out",
+    ".pytest_cache",
+    ".coverage",
+    ".nusexmeta",
+    "*.egg-info",
+}
+
+
+def rglob_listing(root_dir, ignore_exts, ignore_dirs):
+    # The listing implementation prior to 1.4.
+    wild = set(filter(lambda x: x.startswith("*"), ignore_dirs))
+    true = ignore_dirs - wild
+
+    def is_valid(path):
+        return (
+            path.is_file()
+            and all(i not in path.parts for i in true)
+            and all(i[1:] not in f"{path}" for i in wild)
+            and all(i != path.suffix[1:] for i in ignore_exts)
+        )
+
+    return list(filter(lambda p: is_valid(p), Path(root_dir).rglob("*")))
+
+
+def make_tree(root, venv_files):
+    def touch(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("x")
+
+    for i in range(300):
+        touch(os.path.join(root, "pkg", f"sub{i % 10}", f"module_{i}.py"))
+    for i in range(2_000):
+        touch(os.path.join(root, ".git", "objects", f"{i % 256:02x}", f"{i}"))
+    for i in range(venv_files):
+        touch(
+            os.path.join(
+                root,
+                ".venv",
+                "lib",
+                "site-packages",
+                f"dist{i // 500}",
+                f"mod{i % 20}",
+                f"file_{i}.py",
+            )
+        )
+
+
+def main():
+    venv_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tree(tmp, venv_files)
+        rows = []
+        results = []
+
+        for name, func in (("rglob", rglob_listing), ("scandir", walk_files)):
+            secs, files = best_of(
+                lambda: func(
+                    tmp, ignore_exts=IGNORE_EXTS, ignore_dirs=IGNORE_DIRS
+                )
+            )
+            results.append(files)
+            rows.append((name, f"{len(files):,}", f"{secs * 1000:,.1f}"))
+
+        assert results[0] == results[1]
+
+    report(
+        f"File listing ({venv_files:,} files in .venv)",
+        rows,
+        ("walker", "files", "ms"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare full and incremental rebuilds after a single file changes."""
+
+import datetime as dt
+import os
+import random
+import tempfile
+import time
+
+from _common import make_body, report
+
+from nusex import Template
+
+
+def make_tree(root, count, avg_size):
+    rng = random.Random(0)
+    stale = (dt.datetime.now() - dt.timedelta(minutes=1)).timestamp()
+    for i in range(count):
+        path = os.path.join(root, f"pkg{i % 37}", f"module_{i}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = max(1, int(rng.expovariate(1 / avg_size)))
+        with open(path, "wb") as f:
+            f.write(make_body(size, rng))
+        os.utime(path, (stale, stale))
+
+
+def timed_build(src, **kwargs):
+    start = time.perf_counter()
+    t = Template.from_dir("__bench_incr__", src, **kwargs)
+    t.save()
+    return time.perf_counter() - start, t
+
+
+def main():
+    rows = []
+
+    for count, avg_size in ((2_000, 10_240), (10_000, 10_240)):
+        with tempfile.TemporaryDirectory() as tmp:
+            make_tree(tmp, count, avg_size)
+            timed_build(tmp)
+
+            with open(os.path.join(tmp, "pkg0", "module_0.py"), "ab") as f:
+                f.write(b"# Changed.\n")
+
+            full, _ = timed_build(tmp)
+            incr, t = timed_build(tmp, incremental=True)
+            t.delete()
+
+            mb = count * avg_size / 1_000_000
+            for mode, secs in (("full", full), ("incremental", incr)):
+                rows.append(
+                    (f"{count:,}", f"{mb:,.1f}", mode, f"{secs * 1000:,.1f}")
+                )
+
+    report(
+        "Rebuild after changing one file",
+        rows,
+        ("files", "~MB", "mode", "ms"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Measure resolving a license name with a cold, saved, and warm
+license index.
+
+A cold index has to read every license file, as every resolution did
+before the index existed. A saved index is read from disk, as happens
+once per process. A warm index is already in memory.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from _common import report
+
+from nusex import LICENSE_DIR
+from nusex.utils import LicenseIndex
+
+QUERY = "BSD Zero Clause License"
+
+
+def main():
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        licenses = os.path.join(tmp, "licenses")
+        shutil.copytree(LICENSE_DIR, licenses)
+        path = os.path.join(tmp, "index.json")
+        count = len(os.listdir(licenses))
+        warm = LicenseIndex(directory=licenses, path=path)
+        warm.refresh()
+
+        def cold():
+            os.remove(path)
+            return LicenseIndex(directory=licenses, path=path)
+
+        def saved():
+            return LicenseIndex(directory=licenses, path=path)
+
+        for mode, make in (
+            ("cold", cold),
+            ("saved", saved),
+            ("warm", lambda: warm),
+        ):
+            best = float("inf")
+            for _ in range(20):
+                index = make()
+                start = time.perf_counter()
+                assert index.resolve(QUERY) == "0bsd"
+                best = min(best, time.perf_counter() - start)
+            rows.append((f"{count}", mode, f"{best * 1e6:,.1f}"))
+
+    report("License resolution", rows, ("licenses", "index", "µs"))
+
+
+if __name__ == "__main__":
+    main()
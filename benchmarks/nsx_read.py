@@ -0,0 +1,192 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare the buffered NSX readers against the original byte-at-a-time
+parser on synthetic templates, in both the version 1 (stream) and
+version 2 (indexed) formats."""
+
+import os
+import tempfile
+
+from _common import best_of, make_data, report
+
+from nusex.errors import UnsupportedFile
+from nusex.spec import NSXReader, NSXSpecIO
+from nusex.spec.nsx import SPEC_ID
+
+
+class LegacyNSXSpecIO:
+    """The NSX v1 reader and writer as they were before the buffered
+    rewrite."""
+
+    def _process_files(self, f, data):
+        key = True
+        name = b""
+
+        while True:
+            if key:
+                chunk = f.read(1)
+
+                if chunk == b"\x97":
+                    key = False
+                    continue
+
+                if chunk == b"\x98":
+                    return data
+
+                name += chunk
+
+            else:
+                size = int(f.read(8).decode().strip(), base=16)
+                chunk = f.read(size)
+                data["files"].update({name.decode(): chunk})
+                name = b""
+                key = True
+
+    def _process_installs(self, f, data):
+        inst = b""
+        while True:
+            b = f.read(1)
+            if b == b"\x98":
+                return data
+
+            if b == b"\x97":
+                data["installs"].append(inst.decode())
+                inst = b""
+                continue
+
+            inst += b
+
+    def read(self, path):
+        data = {
+            "files": {},
+            "installs": [],
+            "as_addon_for": "",
+            "language": "python",
+        }
+        with open(path, "rb") as f:
+            if f.read(2) != SPEC_ID:
+                raise UnsupportedFile("Not a valid NSX file")
+
+            if f.read(1) == b"\x01":
+                data["as_addon_for"] = f.read(24).decode().strip()
+
+            if f.read(1) == b"\x01":
+                data["language"] = f.read(12).decode().strip()
+
+            f.read(8)
+
+            while f.peek(1):
+                data = {
+                    b"\x01": self._process_files,
+                    b"\x02": self._process_installs,
+                }[f.read(1)](f, data)
+
+        return data
+
+    def write(self, path, data):
+        with open(path, "wb") as f:
+            f.write(SPEC_ID)
+            f.write(b"\x00\x01")
+            f.write(data["language"].ljust(12).encode())
+            f.write(b"\x00" * 8)
+
+            f.write(b"\x01")
+            for k, v in data["files"].items():
+                f.write(k.encode())
+                f.write(b"\x97")
+                f.write(hex(len(v))[2:].ljust(8).encode())
+                f.write(v)
+            f.write(b"\x98")
+
+            f.write(b"\x02")
+            for i in data["installs"]:
+                f.write(i.encode())
+                f.write(b"\x97")
+            f.write(b"\x98")
+
+
+def main():
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in (10, 1_000, 50_000):
+            data = make_data(count)
+            v1 = os.path.join(tmp, f"bench_{count}_v1.nsx")
+            v2 = os.path.join(tmp, f"bench_{count}_v2.nsx")
+            LegacyNSXSpecIO().write(v1, data)
+            NSXSpecIO().write(v2, data)
+
+            for label, path, reader in (
+                ("legacy (v1)", v1, LegacyNSXSpecIO()),
+                ("buffered (v1)", v1, NSXSpecIO()),
+                ("buffered (v2)", v2, NSXSpecIO()),
+            ):
+                mb = os.path.getsize(path) / 1_000_000
+                secs, result = best_of(lambda: reader.read(path))
+                assert result == data
+                rows.append(
+                    (
+                        f"{count:,}",
+                        label,
+                        f"{mb:,.2f}",
+                        f"{secs * 1000:,.1f}",
+                        f"{mb / secs:,.1f}",
+                        f"{count / secs:,.0f}",
+                    )
+                )
+
+            # Random access to a single entry in the middle.
+            name = list(data["files"])[count // 2]
+
+            def read_one():
+                with NSXReader(v2) as r:
+                    return r.read(name)
+
+            secs, body = best_of(read_one)
+            assert body == data["files"][name]
+            rows.append(
+                (
+                    f"{count:,}",
+                    "single (v2)",
+                    f"{len(body) / 1_000_000:,.2f}",
+                    f"{secs * 1000:,.1f}",
+                    "-",
+                    "-",
+                )
+            )
+
+    report(
+        "NSX read throughput",
+        rows,
+        ("files", "reader", "MB", "ms", "MB/s", "entries/s"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compare chained bytes.replace calls with the single-pass placeholder
+substitution engine used by Template.deploy, and with splicing values
+in at offsets indexed when the template was built.
+
+Each row is 1,000 text bodies of 10 KiB, with one placeholder roughly
+every N words. Real templates usually sit towards the sparse end.
+"""
+
+import random
+
+from _common import WORDS, best_of, report
+
+from nusex.utils import Substituter
+
+VAR_MAPPING = {
+    b"PROJECTNAME": "my_app",
+    b"PROJECTVERSION": "0.1.0",
+    b"PROJECTDESCRIPTION": "My project, created using nusex",
+    b"PROJECTURL": "https://github.com/janedoe/my_app",
+    b"PROJECTAUTHOREMAIL": "jane@example.com",
+    b"PROJECTAUTHOR": "Jane Doe",
+    b"PROJECTLICENSE": "BSD 3-Clause",
+    b"LICENSEBODY": "Redistribution and use in source and binary forms...",
+    b"PROJECTYEAR": "2021",
+    b"PROJECTBASEEXC": "MyAppError",
+}
+PLAIN_WORDS = [w for w in WORDS if w not in VAR_MAPPING]
+
+
+def make_body(size, every, rng):
+    placeholders = list(VAR_MAPPING)
+    out = bytearray()
+    while len(out) < size:
+        out += (
+            b" ".join(
+                rng.choice(placeholders)
+                if rng.random() < 1 / every
+                else rng.choice(PLAIN_WORDS)
+                for _ in range(12)
+            )
+            + b"\n"
+        )
+    return bytes(out[:size])
+
+
+def chained_replace(bodies):
+    # The substitution implementation prior to 1.4.
+    out = []
+    for data in bodies:
+        for k, v in VAR_MAPPING.items():
+            data = data.replace(k, v.encode())
+        out.append(data)
+    return out
+
+
+def single_pass(bodies):
+    sub = Substituter(VAR_MAPPING)
+    return [sub.sub(data) for data in bodies]
+
+
+def indexed(bodies, matches):
+    sub = Substituter(VAR_MAPPING)
+    return [b"".join(sub.splice((d,), m)) for d, m in zip(bodies, matches)]
+
+
+def main():
+    rows = []
+
+    for every in (10, 100, 1_000, 10_000):
+        rng = random.Random(0)
+        bodies = [make_body(10_240, every, rng) for _ in range(1_000)]
+
+        old_secs, old = best_of(lambda: chained_replace(bodies))
+        new_secs, new = best_of(lambda: single_pass(bodies))
+        matches = [Substituter(VAR_MAPPING).find(d) for d in bodies]
+        idx_secs, idx = best_of(lambda: indexed(bodies, matches))
+        assert old == new == idx, "outputs differ"
+
+        for impl, secs in (
+            ("chained", old_secs),
+            ("single-pass", new_secs),
+            ("indexed", idx_secs),
+        ):
+            rows.append((f"{every:,}", impl, f"{secs * 1000:,.1f}"))
+
+    report(
+        "Placeholder substitution (1,000 x 10 KiB bodies)",
+        rows,
+        ("words per placeholder", "impl", "ms"),
+    )
+
+
+if __name__ == "__main__":
+    main()
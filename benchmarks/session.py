@@ -0,0 +1,107 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Compare deploying many small projects one at a time, as a script
+calling ``Template(name).deploy()`` would, with deploying them through
+a session, serially and from several threads.
+
+Loading the template and profile is paid once per project without a
+session, and once in total with one.
+"""
+
+import itertools
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import best_of, make_data, report
+
+from nusex import Session, Template
+from nusex.spec import NSXSpecIO
+
+PROJECTS = 200
+
+
+def main():
+    rows = []
+    template = Template("__bench_session__")
+    NSXSpecIO().write(template.path, make_data(20, avg_size=2_048))
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            runs = itertools.count()
+
+            def plain(root):
+                for i in range(PROJECTS):
+                    Template("__bench_session__").deploy(
+                        destination=f"{root}/{i}"
+                    )
+
+            def serial(root):
+                with Session() as session:
+                    for i in range(PROJECTS):
+                        session.deploy("__bench_session__", f"{root}/{i}")
+
+            def threaded(root):
+                with Session() as session, ThreadPoolExecutor(8) as pool:
+                    list(
+                        pool.map(
+                            lambda i: session.deploy(
+                                "__bench_session__", f"{root}/{i}"
+                            ),
+                            range(PROJECTS),
+                        )
+                    )
+
+            for mode, func in (
+                ("Template", plain),
+                ("Session", serial),
+                ("Session, 8 threads", threaded),
+            ):
+                secs, _ = best_of(
+                    lambda: func(os.path.join(tmp, f"{next(runs)}")), 3
+                )
+                rows.append(
+                    (
+                        f"{PROJECTS}",
+                        mode,
+                        f"{secs * 1000:,.1f}",
+                        f"{secs / PROJECTS * 1000:,.2f}",
+                    )
+                )
+    finally:
+        template.delete()
+
+    report(
+        "Repeated deploys",
+        rows,
+        ("projects", "mode", "total ms", "ms/project"),
+    )
+
+
+if __name__ == "__main__":
+    main()
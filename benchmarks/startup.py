@@ -0,0 +1,88 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Measure CLI cold-start time for each subcommand.
+
+Each run starts a fresh interpreter with ``-X importtime`` and asks for
+the subcommand's help, so nothing is read or written. Import time only
+counts modules nusex imports itself, while wall time covers the whole
+process, including interpreter startup.
+"""
+
+import os
+import subprocess as sp
+import sys
+import time
+
+from _common import report
+
+from nusex.cli.cli import COMMANDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe(*args):
+    start = time.perf_counter()
+    err = sp.run(
+        [sys.executable, "-X", "importtime", "-m", "nusex", *args],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+    ).stderr.decode()
+    elapsed = time.perf_counter() - start
+
+    # Top-level imports are the only ones without indented names, and
+    # their cumulative times cover everything beneath them. Modules
+    # imported while the interpreter starts up come before encodings
+    # and site, and are left out.
+    usec = 0
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        usec += int(cumulative)
+        if name.strip() == "site":
+            usec = 0
+
+    return usec / 1000, elapsed * 1000
+
+
+def main():
+    rows = []
+
+    for args in (("-V",), ("-h",), *((c, "-h") for c in COMMANDS)):
+        imports, wall = min(probe(*args) for _ in range(5))
+        rows.append((" ".join(args), f"{imports:,.1f}", f"{wall:,.1f}"))
+
+    report("CLI startup", rows, ("command", "import ms", "wall ms"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Measure load time and peak RSS of eager and lazy template loading.
+
+Each measurement runs in a fresh interpreter so peak RSS figures are
+not polluted by earlier runs. Peak RSS is only reported on Unix-like
+systems.
+"""
+
+import os
+import subprocess as sp
+import sys
+import tempfile
+
+from _common import PEAK_RSS, make_data, report
+
+from nusex.spec import NSXSpecIO
+
+PROBE = (
+    PEAK_RSS
+    + """
+import sys, time
+sys.path.insert(0, {root!r})
+from nusex.spec import NSXSpecIO
+start = time.perf_counter()
+data = NSXSpecIO().read({path!r}, lazy={lazy})
+names = list(data["files"])
+elapsed = time.perf_counter() - start
+print(elapsed, peak_rss(), len(names))
+"""
+)
+
+
+def probe(path, lazy):
+    code = PROBE.format(
+        root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        path=path,
+        lazy=lazy,
+    )
+    out = sp.run(
+        [sys.executable, "-c", code], capture_output=True, check=True
+    ).stdout.split()
+    return float(out[0]), float(out[1]), int(out[2])
+
+
+def main():
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count, avg_size in ((1_000, 1_024), (10_000, 10_240)):
+            path = os.path.join(tmp, f"bench_{count}.nsx")
+            NSXSpecIO().write(path, make_data(count, avg_size=avg_size))
+            mb = os.path.getsize(path) / 1_000_000
+
+            for lazy in (False, True):
+                secs, rss, n = min(probe(path, lazy) for _ in range(3))
+                assert n == count
+                rows.append(
+                    (
+                        f"{count:,}",
+                        f"{mb:,.1f}",
+                        "lazy" if lazy else "eager",
+                        f"{secs * 1000:,.1f}",
+                        f"{rss:,.1f}",
+                    )
+                )
+
+    report(
+        "Template load (metadata only)",
+        rows,
+        ("files", "MB", "mode", "ms", "peak RSS (MB)"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -38,5 +38,41 @@ __bugtracker__ = "https://github.com/nusex/nusex/issues"
 __ci__ = "https://github.com/nusex/nusex/actions"
 
 from .constants import *
-from .profile import Profile
-from .template import Template
+from .lazy import attach
+
+__all__ = (
+    "BLOB_DIR",
+    "BLUEPRINT_MAPPING",
+    "CONFIG_DIR",
+    "CONFIG_FILE",
+    "INVALID_NAME_PATTERN",
+    "LICENSE_DIR",
+    "LICENSE_INDEX_FILE",
+    "MANIFEST_DIR",
+    "PROFILE_DIR",
+    "TEMPLATE_DIR",
+    "TEMP_DIR",
+    "VERSION_PATTERN",
+    "Profile",
+    "Session",
+    "Template",
+    "blueprints",
+    "constants",
+    "errors",
+    "helpers",
+    "profile",
+    "spec",
+    "template",
+)
+
+# Profile, Session, and Template pull in most of nusex, so they are
+# only imported when first used. This keeps CLI startup fast. Star
+# imports still get them, as they are listed in __all__.
+__getattr__, __dir__ = attach(
+    __name__,
+    {
+        "Profile": ".profile",
+        "Session": ".session",
+        "Template": ".template",
+    },
+)
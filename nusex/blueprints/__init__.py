@@ -29,13 +29,19 @@
 import re
 
 
+def _apply(func, blueprint, input):
+    lines = input.decode().split("\n")
+    output = func(blueprint, lines)
+    return output.encode()
+
+
 def with_files(*exprs):
+    pattern = re.compile("|".join(exprs))
+
     def decorator(func):
         def wrapper(blueprint):
             files = [
-                file
-                for file in blueprint.data["files"]
-                if re.match("|".join(exprs), file)
+                file for file in blueprint.data["files"] if pattern.match(file)
             ]
 
             for file in files:
@@ -44,11 +50,12 @@ def with_files(*exprs):
                 if not input:
                     continue
 
-                input = input.decode()
-                lines = input.split("\n")
-                output = func(blueprint, lines)
-                blueprint.data["files"][file] = output.encode()
+                blueprint.data["files"][file] = _apply(func, blueprint, input)
 
+        # These allow files to be modified one at a time. See
+        # Blueprint.process.
+        wrapper.pattern = pattern
+        wrapper.func = func
         return wrapper
 
     return decorator
@@ -28,6 +28,8 @@
 
 from types import MethodType
 
+from nusex.blueprints import _apply
+
 
 class Blueprint:
     def __init__(self, project_name, data):
@@ -40,7 +42,7 @@ class Blueprint:
 
     def __call__(self):
         for name in dir(self):
-            if name.startswith("_"):
+            if name.startswith("_") or hasattr(Blueprint, name):
                 continue
 
             attr = getattr(self, name)
@@ -48,3 +50,29 @@ class Blueprint:
                 attr()
 
         return self
+
+    def process(self, key, data):
+        """Run a single file through this blueprint. This gives the
+        same result as calling the blueprint with the file in the
+        template data, but without needing every other file in memory.
+        Only methods decorated with ``with_files`` are applied.
+
+        Args:
+            key (:obj:`str`): The name of the file within the template.
+            data (:obj:`bytes`): The file's data.
+
+        Returns:
+            :obj:`bytes`: The modified data.
+
+        .. versionadded:: 1.4
+        """
+        for name in dir(self):
+            if name.startswith("_") or hasattr(Blueprint, name):
+                continue
+
+            attr = getattr(self, name)
+            pattern = getattr(attr, "pattern", None)
+            if data and pattern and pattern.match(key):
+                data = _apply(attr.func, self, data)
+
+        return data
@@ -27,53 +27,67 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
-import datetime as dt
-import logging
-import platform
 import sys
-import traceback
 from importlib import import_module
-from pathlib import Path
-from urllib import request
-from urllib.error import HTTPError
 
 from nusex import CONFIG_DIR, CONFIG_FILE, __description__, __version__
 from nusex.errors import NusexError, NusexUserError
 from nusex.helpers import cprint
-from nusex.spec import NSCSpecIO
-from nusex.utils import Downloader
 
-LAST_UPDATE_URL = (
-    "https://raw.githubusercontent.com/nusex/downloads/main/lastupdate.txt"
+# Each command lives in a module of the same name in
+# nusex.cli.commands, which is only imported once it is chosen.
+COMMANDS = (
+    "build",
+    "config",
+    "delete",
+    "deploy",
+    "download",
+    "init",
+    "list",
+    "migrate",
+    "profile",
+    "rename",
 )
-COMMAND_MAPPING = {
-    p.stem: import_module(f".cli.commands.{p.stem}", package="nusex")
-    for p in Path(__file__).parent.glob("commands/*.py")
-    if p.stem != "__init__"
-}
-
-parser = argparse.ArgumentParser(description=__description__)
-parser.add_argument(
-    "-v",
-    "--verbose",
-    help="emit logging messages",
-    action="store_true",
-)
-parser.add_argument(
-    "-V",
-    "--version",
-    help="show nusex's version and exit",
-    action="store_true",
-)
-parser.add_argument(
-    "-i",
-    "--info",
-    help="show detailed information for nusex and exit",
-    action="store_true",
-)
-subparsers = parser.add_subparsers(dest="subparser")
-for module in COMMAND_MAPPING.values():
-    subparsers = module.setup(subparsers)  # type: ignore
+
+
+def _load_command(name):
+    return import_module(f"nusex.cli.commands.{name}")
+
+
+def _make_parser(command=None):
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="emit logging messages",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-V",
+        "--version",
+        help="show nusex's version and exit",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-i",
+        "--info",
+        help="show detailed information for nusex and exit",
+        action="store_true",
+    )
+    subparsers = parser.add_subparsers(dest="subparser")
+
+    # Commands other than the chosen one only get a stub, so their
+    # modules need not be imported.
+    for name in COMMANDS:
+        if name == command:
+            subparsers = _load_command(name).setup(subparsers)
+        else:
+            subparsers.add_parser(name, add_help=False)
+
+    return parser
+
+
+parser = _make_parser()
 
 
 def _check_config(subcommand):
@@ -99,45 +113,38 @@ def _check_for_updates():
     if not CONFIG_FILE.exists():
         return
 
-    data = NSCSpecIO().read()
-    last_checked = data["last_update"]
-    auto_update = data["auto_update"]
-
-    try:
-        last_checked = dt.datetime.strptime(last_checked, "%y%m%d").date()
-    except ValueError:
-        # Probably some old config.
-        last_checked = dt.date.min
+    from nusex.cli import updates
+    from nusex.spec import NSCSpecIO
 
-    if last_checked == dt.date.today():
-        return
-
-    try:
-        with request.urlopen(LAST_UPDATE_URL) as r:
-            last_update = dt.datetime.strptime(
-                r.readlines()[0].strip().decode(), "%y%m%d"
-            ).date()
-    except HTTPError:
-        return
+    data = NSCSpecIO().read()
 
-    if last_checked < last_update:
-        if auto_update:
-            cprint(
-                "inf", "nusex is automatically downloading asset updates..."
-            )
-            Downloader("templates").download(display_progress=True)
-            Downloader("licenses").download(display_progress=True)
+    # Report what the last background check found. If downloading the
+    # updates failed recently, the flag is kept, and the download is
+    # tried again once it is due.
+    if data["update_available"] and not data["auto_update"]:
+        cprint(
+            "inf",
+            "nusex has asset updates. Use `nusex download` to get them.",
+        )
+        data["update_available"] = False
+        NSCSpecIO().write(data)
+    elif data["update_available"] and updates.download_due():
+        cprint("inf", "nusex is automatically downloading asset updates...")
+        try:
+            updates.download()
+        except (NusexError, OSError) as exc:
+            cprint("war", f"Could not download asset updates: {exc}.")
         else:
-            cprint(
-                "inf",
-                "nusex has asset updates. Use `nusex download` to get them.",
-            )
+            data["update_available"] = False
+            NSCSpecIO().write(data)
 
-    data["last_update"] = dt.date.today().strftime("%y%m%d")
-    NSCSpecIO().write(data)
+    if updates.due(data):
+        updates.start()
 
 
 def _display_info():
+    import platform
+
     py_impl = platform.python_implementation()
     py_ver = platform.python_version()
     py_comp = platform.python_compiler()
@@ -164,8 +171,11 @@ def _display_info():
     )
 
 
-def main():
-    args = parser.parse_args()
+def main(argv=None):
+    # Work out which command was chosen first, then parse everything
+    # again with that command's real arguments.
+    args, _ = parser.parse_known_args(argv)
+    args = _make_parser(args.subparser).parse_args(argv)
 
     if args.version:
         return print(__version__)
@@ -177,6 +187,8 @@ def main():
         return parser.parse_args(("-h",))
 
     if args.verbose:
+        import logging
+
         logging.basicConfig(
             level=logging.DEBUG,
             format="[%(levelname)s] %(name)s: %(message)s",
@@ -190,7 +202,7 @@ def main():
 
     # Command runs.
     try:
-        COMMAND_MAPPING[args.subparser].run(
+        _load_command(args.subparser).run(
             **{
                 k: v
                 for k, v in args.__dict__.items()
@@ -206,6 +218,8 @@ def main():
     except KeyboardInterrupt:
         sys.exit(130)
     except Exception:
+        import traceback
+
         cprint(
             "err",
             f"Oh no! Something went wrong.\n\n{traceback.format_exc()}",
@@ -32,6 +32,7 @@ import os
 from nusex import BLUEPRINT_MAPPING, TEMPLATE_DIR, Template
 from nusex.errors import AlreadyExists, DoesNotExist
 from nusex.helpers import cprint, options_as_list, options_as_set
+from nusex.spec import NSCSpecIO
 
 log = logging.getLogger(__name__)
 
@@ -75,6 +76,10 @@ def run(
     extend_ignore_exts,
     ignore_dirs,
     extend_ignore_dirs,
+    compress,
+    dedupe,
+    jobs,
+    incremental,
 ):
     log.debug(
         (
@@ -91,7 +96,11 @@ def run(
             f"{ignore_exts=}; "
             f"{extend_ignore_exts=}; "
             f"{ignore_dirs=}; "
-            f"{extend_ignore_dirs=}"
+            f"{extend_ignore_dirs=}; "
+            f"{compress=}; "
+            f"{dedupe=}; "
+            f"{jobs=}; "
+            f"{incremental=}"
         )
     )
 
@@ -102,6 +111,7 @@ def run(
 
     ignore_exts = ignore_exts.union(extend_ignore_exts)
     ignore_dirs = ignore_dirs.union(extend_ignore_dirs)
+    use_ignore_files = NSCSpecIO().read()["use_wildmatch_ignore"]
 
     if with_requirements_file:
         with open(with_requirements_file) as f:
@@ -130,6 +140,9 @@ def run(
             as_addon_for=as_addon_for,
             ignore_exts=ignore_exts,
             ignore_dirs=ignore_dirs,
+            use_ignore_files=use_ignore_files,
+            jobs=jobs,
+            incremental=incremental,
         )
     else:
         template = Template.from_cwd(
@@ -140,12 +153,16 @@ def run(
             as_addon_for=as_addon_for,
             ignore_exts=ignore_exts,
             ignore_dirs=ignore_dirs,
+            use_ignore_files=use_ignore_files,
+            jobs=jobs,
+            incremental=incremental,
         )
 
     if check:
-        return _check(template)
+        _check(template)
+        return template.close()
 
-    template.save()
+    template.save(compress=compress, dedupe=dedupe)
     cprint("aok", f"Template '{name}' built successfully!")
 
 
@@ -268,4 +285,30 @@ def setup(subparsers):
         default="",
         type=options_as_set,
     )
+    s.add_argument(
+        "-z",
+        "--compress",
+        help="compress files in the template where worthwhile",
+        action="store_true",
+    )
+    s.add_argument(
+        "-d",
+        "--dedupe",
+        help="store files in the blob store shared between templates",
+        action="store_true",
+    )
+    s.add_argument(
+        "-j",
+        "--jobs",
+        help="the number of files to read and process at once (default: 1)",
+        metavar="N",
+        default=1,
+        type=int,
+    )
+    s.add_argument(
+        "-u",
+        "--incremental",
+        help="only process files that have changed since the last build",
+        action="store_true",
+    )
     return subparsers
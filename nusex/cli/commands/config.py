@@ -30,8 +30,9 @@ from nusex.helpers import cprint
 from nusex.spec import NSCSpecIO
 
 
-def run(auto_update):
+def run(use_wildmatch_ignore, auto_update):
     data = NSCSpecIO().read()
+    data["use_wildmatch_ignore"] = use_wildmatch_ignore
     data["auto_update"] = auto_update
     NSCSpecIO().write(data)
 
@@ -42,6 +43,15 @@ def setup(subparsers):
     s = subparsers.add_parser(
         "config", description="Update your nusex configuration."
     )
+    s.add_argument(
+        "-w",
+        "--use-wildmatch-ignore",
+        help=(
+            "respect .gitignore and .nusexignore files when building "
+            "templates (omitting this flag will deactivate this)"
+        ),
+        action="store_true",
+    )
     s.add_argument(
         "-u",
         "--auto-update",
@@ -37,14 +37,16 @@ from nusex.helpers import cprint
 log = logging.getLogger(__name__)
 
 
-def run(name, project_name, force, no_installs):
+def run(name, project_name, force, no_installs, jobs, fsync):
     log.debug(
         (
             f"Using CLI values: "
             f"{name=}; "
             f"{project_name=}; "
             f"{force=}; "
-            f"{no_installs=}"
+            f"{no_installs=}; "
+            f"{jobs=}; "
+            f"{fsync=}"
         )
     )
 
@@ -67,7 +69,7 @@ def run(name, project_name, force, no_installs):
         if os.path.isfile(".nusexmeta") and not force:
             raise DeploymentError("A template has already been deployed here")
 
-    template.deploy(project_name=project_name)
+    template.deploy(project_name=project_name, jobs=jobs, fsync=fsync)
     if not no_installs:
         template.install_dependencies()
 
@@ -100,4 +102,17 @@ def setup(subparsers):
         help="deploy the template without installing dependencies",
         action="store_true",
     )
+    s.add_argument(
+        "-j",
+        "--jobs",
+        help="the number of files to write at once (default: 1)",
+        metavar="N",
+        default=1,
+        type=int,
+    )
+    s.add_argument(
+        "--fsync",
+        help="flush files to disk before moving them into place",
+        action="store_true",
+    )
     return subparsers
@@ -30,20 +30,41 @@ import datetime as dt
 
 from nusex.helpers import cprint
 from nusex.spec import NSCSpecIO
-from nusex.utils import Downloader
+from nusex.utils import Downloader, export_bundle
 
 
-def run():
+def run(jobs, export):
     for dl in ("templates", "licenses"):
-        Downloader(dl).download(display_progress=True)
+        Downloader(dl, jobs=jobs).download(display_progress=True)
 
     data = NSCSpecIO().read()
-    data["auto_update"] = dt.date.today().strftime("%y%m%d")
+    data["last_update"] = dt.date.today().strftime("%y%m%d")
+    data["update_available"] = False
     NSCSpecIO().write(data)
 
     cprint("aok", "Download complete!")
 
+    if export:
+        count = export_bundle(export)
+        cprint("aok", f"Exported {count:,} asset(s) to {export}!")
+
 
 def setup(subparsers):
-    subparsers.add_parser("download", description="Download nusex assets.")
+    s = subparsers.add_parser("download", description="Download nusex assets.")
+    s.add_argument(
+        "-j",
+        "--jobs",
+        help="the number of files to download at once (default: 8)",
+        metavar="N",
+        default=8,
+        type=int,
+    )
+    s.add_argument(
+        "--export",
+        help=(
+            "export the downloaded assets to a bundle, for use on machines "
+            "without internet access"
+        ),
+        metavar="PATH",
+    )
     return subparsers
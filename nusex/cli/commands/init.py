@@ -33,12 +33,12 @@ import sys
 from nusex import CONFIG_DIR, CONFIG_FILE, Profile
 from nusex.helpers import cprint
 from nusex.spec import NSCSpecIO
-from nusex.utils import Downloader
+from nusex.utils import Downloader, import_bundle
 
 DIRS = ("licenses", "profiles", "templates")
 
 
-def run():
+def run(from_bundle):
     if os.path.isfile(CONFIG_FILE):
         cprint("err", "You've already initialised nusex!")
         sys.exit(2)
@@ -46,9 +46,17 @@ def run():
     for d in DIRS:
         os.makedirs(CONFIG_DIR / d, exist_ok=True)
 
-    for t in ("templates", "licenses"):
-        if not os.listdir(CONFIG_DIR / t):
-            Downloader(t).download(display_progress=True)
+    if from_bundle:
+        counts = import_bundle(from_bundle)
+        cprint(
+            "inf",
+            f"Imported {counts['templates']:,} template(s) and "
+            f"{counts['licenses']:,} license(s)",
+        )
+    else:
+        for t in ("templates", "licenses"):
+            if not os.listdir(CONFIG_DIR / t):
+                Downloader(t).download(display_progress=True)
 
     profile_name = input(f"🎤 Profile name [default]: ").strip() or "default"
     profile = Profile(profile_name)
@@ -66,5 +74,13 @@ def run():
 
 
 def setup(subparsers):
-    subparsers.add_parser("init", description="Initialise nusex.")
+    s = subparsers.add_parser("init", description="Initialise nusex.")
+    s.add_argument(
+        "--from-bundle",
+        help=(
+            "import assets from a bundle (a path or URL) instead of "
+            "downloading them"
+        ),
+        metavar="SOURCE",
+    )
     return subparsers
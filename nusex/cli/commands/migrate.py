@@ -78,12 +78,27 @@ def _migrate():
     NSCSpecIO().write(settings)
 
 
+def _upgrade_templates():
+    count = 0
+
+    for file in sorted(TEMPLATE_DIR.glob("*.nsx")):
+        if NSXSpecIO().upgrade(file):
+            cprint("prc", f"Upgraded template '{file.stem}'")
+            count += 1
+
+    return count
+
+
 def _revert():
     shutil.rmtree(CONFIG_DIR)
     shutil.move(f"{CONFIG_DIR}-old", CONFIG_DIR)
 
 
-def run(revert):
+def run(revert, upgrade_templates):
+    if upgrade_templates:
+        count = _upgrade_templates()
+        return cprint("aok", f"Successfully upgraded {count:,} templates!")
+
     if revert:
         if not (CONFIG_DIR.parent / f"{CONFIG_DIR}-old").exists():
             raise MigrationError("No old configurations to revert to")
@@ -115,4 +130,13 @@ def setup(subparsers):
         help="revert back to a 0.x config, if possible",
         action="store_true",
     )
+    s.add_argument(
+        "-u",
+        "--upgrade-templates",
+        help=(
+            "upgrade existing templates to the latest NSX format in place "
+            "(this can be done at any time)"
+        ),
+        action="store_true",
+    )
     return subparsers
@@ -0,0 +1,181 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Background checks for asset updates.
+
+Checks are run in a detached process, so commands never wait on the
+network. The result is stored in the config, and reported the next
+time nusex is run.
+"""
+
+import datetime as dt
+import os
+import subprocess as sp
+import sys
+import time
+
+from nusex import CONFIG_DIR
+from nusex.spec import NSCSpecIO
+
+LAST_UPDATE_URL = (
+    "https://raw.githubusercontent.com/nusex/downloads/main/lastupdate.txt"
+)
+# Checks are given up on if they take longer than this (in seconds).
+CHECK_TIMEOUT = 5
+# Failed checks are retried after this long (in seconds).
+RETRY_AFTER = 3600
+STAMP_FILE = CONFIG_DIR / ".update-check"
+DOWNLOAD_STAMP_FILE = CONFIG_DIR / ".update-download"
+
+
+def _parse_date(date):
+    try:
+        return dt.datetime.strptime(date, "%y%m%d").date()
+    except ValueError:
+        # Probably some old config.
+        return dt.date.min
+
+
+def _expired(stamp):
+    try:
+        return time.time() - os.stat(stamp).st_mtime >= RETRY_AFTER
+    except FileNotFoundError:
+        return True
+
+
+def due(data):
+    """Whether a check should be started.
+
+    Checks are due once a day. So that checks which cannot reach the
+    network do not pile up, none are started within
+    :obj:`RETRY_AFTER` seconds of the last.
+
+    Args:
+        data (:obj:`dict`): The current config.
+
+    Returns:
+        :obj:`bool`
+    """
+    if _parse_date(data["last_update"]) >= dt.date.today():
+        return False
+
+    return _expired(STAMP_FILE)
+
+
+def start():
+    """Start a check in a detached process. This returns immediately,
+    and the process outlives nusex if need be."""
+    # Record the attempt first, so nothing else starts one.
+    STAMP_FILE.touch()
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = (
+            sp.DETACHED_PROCESS | sp.CREATE_NEW_PROCESS_GROUP
+        )
+    else:
+        kwargs["start_new_session"] = True
+
+    sp.Popen(
+        (sys.executable, "-m", "nusex.cli.updates"),
+        stdin=sp.DEVNULL,
+        stdout=sp.DEVNULL,
+        stderr=sp.DEVNULL,
+        close_fds=True,
+        **kwargs,
+    )
+
+
+def download_due():
+    """Whether asset updates should be downloaded automatically. So
+    that commands are not held up while offline, no download is
+    attempted within :obj:`RETRY_AFTER` seconds of one that failed.
+
+    Returns:
+        :obj:`bool`
+    """
+    return _expired(DOWNLOAD_STAMP_FILE)
+
+
+def download():
+    """Download asset updates. Commands wait on this, so requests are
+    not retried, and are given up on after :obj:`CHECK_TIMEOUT`
+    seconds.
+
+    Raises:
+        :obj:`NusexError`: The download failed.
+        :obj:`OSError`: The download failed.
+    """
+    from nusex.utils import Downloader
+
+    # Record the attempt first, so a failed one is not repeated until
+    # RETRY_AFTER has passed.
+    DOWNLOAD_STAMP_FILE.touch()
+    for of_type in ("templates", "licenses"):
+        Downloader(of_type, retries=0, timeout=CHECK_TIMEOUT).download(
+            display_progress=True
+        )
+
+    try:
+        os.remove(DOWNLOAD_STAMP_FILE)
+    except FileNotFoundError:
+        ...
+
+
+def check(timeout=CHECK_TIMEOUT):
+    """Check whether there are asset updates, and store the result in
+    the config. Failed checks are ignored; they will be retried later.
+
+    Args:
+        timeout (:obj:`float`): How long to wait for a response before
+            giving up (in seconds). Defaults to :obj:`CHECK_TIMEOUT`.
+
+    Returns:
+        :obj:`bool`: Whether the check succeeded.
+    """
+    from urllib import request
+
+    try:
+        with request.urlopen(LAST_UPDATE_URL, timeout=timeout) as r:
+            date = r.readline().strip().decode()
+        last_update = dt.datetime.strptime(date, "%y%m%d").date()
+    except (OSError, ValueError):
+        # Covers HTTP and connection errors, and timeouts.
+        return False
+
+    # The config could have changed while waiting on the network.
+    data = NSCSpecIO().read()
+    if _parse_date(data["last_update"]) < last_update:
+        data["update_available"] = True
+    data["last_update"] = dt.date.today().strftime("%y%m%d")
+    NSCSpecIO().write(data)
+    return True
+
+
+if __name__ == "__main__":
+    check()
@@ -52,8 +52,11 @@ else:
     CONFIG_DIR = Path.home() / f".config/{_suffix()}"
     TEMP_DIR = Path(f"/tmp/{_suffix()}")
 
+BLOB_DIR = CONFIG_DIR / "blobs"
 CONFIG_FILE = CONFIG_DIR / "config.nsc"
 LICENSE_DIR = CONFIG_DIR / "licenses"
+LICENSE_INDEX_FILE = CONFIG_DIR / "licenses.json"
+MANIFEST_DIR = CONFIG_DIR / "manifests"
 PROFILE_DIR = CONFIG_DIR / "profiles"
 TEMPLATE_DIR = CONFIG_DIR / "templates"
 
@@ -0,0 +1,65 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+from importlib import import_module
+
+
+def attach(module_name, attrs):
+    """Make some of a module's attributes load lazily. Each is imported
+    from its submodule the first time it is accessed, and then stored
+    on the module.
+
+    Args:
+        module_name (:obj:`str`): The name of the module, usually
+            ``__name__``.
+        attrs (:obj:`dict[str, str]`): The submodule each attribute is
+            imported from, relative to the module, keyed by attribute
+            name.
+
+    Returns:
+        :obj:`tuple[Callable, Callable]`: The module's ``__getattr__``
+        and ``__dir__`` functions.
+
+    .. versionadded:: 1.4
+    """
+
+    def __getattr__(name):
+        if name not in attrs:
+            raise AttributeError(
+                f"module {module_name!r} has no attribute {name!r}"
+            )
+
+        value = getattr(import_module(attrs[name], module_name), name)
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    def __dir__():
+        return sorted({*vars(sys.modules[module_name]), *attrs})
+
+    return __getattr__, __dir__
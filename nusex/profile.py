@@ -30,10 +30,11 @@ import json
 import logging
 import os
 
-from nusex import CONFIG_DIR, LICENSE_DIR, PROFILE_DIR, VERSION_PATTERN
+from nusex import CONFIG_DIR, PROFILE_DIR, VERSION_PATTERN
 from nusex.errors import ProfileError
 from nusex.helpers import cprint, validate_name
 from nusex.spec import NSCSpecIO, NSPSpecIO
+from nusex.utils import LicenseIndex
 
 VALID_CONFIG_KEYS = (
     "author_name",
@@ -213,7 +214,7 @@ class Profile:
                         input(f"🎤 Starting version [0.1.0]: ").strip()
                         or "0.1.0"
                     )
-                    v = c._validate_option(k, v)
+                    v = c.validate_option(k, v)
                     log.info(f"[{name}] Option '{k}' resolved to '{v}'")
 
             elif k == "preferred_license":
@@ -223,7 +224,7 @@ class Profile:
                         input(f"🎤 Preferred license [unlicense]: ").strip()
                         or "unlicense"
                     )
-                    v = c._validate_option(k, v)
+                    v = c.validate_option(k, v)
                     log.info(f"[{name}] Option '{k}' resolved to '{v}'")
 
             c.data[k] = v
@@ -251,48 +252,32 @@ class Profile:
         log.info(f"[{self.name}] Selected")
 
     def _resolve_license(self, value):
-        def _sanitise(text):
-            return (
-                text.replace("License", "")
-                .replace("  ", "")
-                .replace("-", " ")
-                .replace("_", " ")
-                .strip()
-            )
-
-        value = value.lower()
-
-        for file in LICENSE_DIR.glob("*.txt"):
-            if value == file.stem:
-                log.debug(f"[{self.name}] License found: {file.stem}")
-                return file.stem
-
-            attrs = {}
-            with open(LICENSE_DIR / file, encoding="utf-8") as f:
-                for line in f:
-                    if line == "---\n":
-                        continue
-                    if line == "\n":
-                        break
-
-                    k, v = line.split(": ")
-                    attrs.update({k: v.strip().lower()})
-
-            nickname = attrs.get("nickname", "")
-            spdx_id = attrs.get("spdx-id", "")
-            title = attrs.get("title", "")
-
-            if (
-                title == value
-                or spdx_id == value
-                or title == value
-                or _sanitise(value)
-                in (_sanitise(nickname), _sanitise(spdx_id), _sanitise(title))
-            ):
-                log.debug(f"[{self.name}] License attrs ({value}): {attrs}")
-                return file.stem
-
-    def _validate_option(self, key, option):
+        stem = LicenseIndex.default().resolve(value)
+        if stem:
+            log.debug(f"[{self.name}] License found: {stem}")
+        return stem
+
+    def validate_option(self, key, option):
+        """Validate a value for one of this profile's options. The
+        value is not stored in the profile.
+
+        Args:
+            key (:obj:`str`): The option to validate the value for.
+            option (:obj:`str`): The value.
+
+        Returns:
+            :obj:`str`: The value as it would be stored. Trailing
+            slashes are removed from profile URLs, and licenses are
+            resolved to their file stems.
+
+        Raises:
+            :obj:`ProfileError`: The key or value is invalid.
+
+        .. versionadded:: 1.4
+        """
+        if key not in VALID_CONFIG_KEYS:
+            raise ProfileError(f"'{key}' is not a valid key")
+
         if key == "git_profile_url":
             option = option.strip("/")
 
@@ -324,7 +309,7 @@ class Profile:
         for k, v in self.data.items():
             kq = (k[0].upper() + k[1:].replace("_", " ")).replace("url", "URL")
             option = input(f"🎤 {kq} [{v}]: ").strip() or v.strip()
-            option = self._validate_option(k, option)
+            option = self.validate_option(k, option)
             self.data[k] = option
 
     def update(self, **kwargs):
@@ -349,6 +334,6 @@ class Profile:
                 continue
 
             if v:
-                v = self._validate_option(k, v)
+                v = self.validate_option(k, v)
                 self.data[k] = v
                 log.debug(f"[{self.name}] Option '{k}' updated to '{v}'")
@@ -0,0 +1,265 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import os
+import threading
+
+from nusex import CONFIG_FILE, PROFILE_DIR, TEMPLATE_DIR, Profile, Template
+from nusex.errors import DoesNotExist
+from nusex.spec import NSCSpecIO
+
+log = logging.getLogger(__name__)
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class Session:
+    """A long-lived session for deploying templates from code.
+
+    Templates, profiles, and the selected profile are loaded the first
+    time they are needed and kept for the life of the session, so
+    deploying the same template many times only parses it once. Each
+    is reloaded if its file changes. Rendered licenses are cached by
+    the shared :obj:`~nusex.utils.LicenseIndex`.
+
+    Sessions are thread-safe, so many deployments can be run from one
+    process at once. Templates are held open until they change on disk
+    and are no longer being deployed, or until the session is closed.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = ("_cache", "_lock", "_users", "_retired")
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+        # Templates being deployed, and templates that have since been
+        # replaced, keyed by ID. Replaced templates are closed when
+        # their last deployment finishes.
+        self._users = {}
+        self._retired = {}
+
+    def __repr__(self):
+        return f"<Session cached={len(self._cache)!r}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get(self, path, load):
+        stamp = _stamp(path)
+        entry = self._cache.get(path)
+        if entry and entry[0] == stamp:
+            return entry[1]
+
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry and entry[0] == stamp:
+                return entry[1]
+
+            if entry:
+                self._retire(entry[1])
+
+            if stamp is None:
+                self._cache.pop(path, None)
+                return None
+
+            log.info(f"Loading {path}...")
+            value = load()
+            self._cache[path] = (stamp, value)
+            return value
+
+    def _retire(self, value):
+        # Must be called with the lock held.
+        if not isinstance(value, Template):
+            return
+
+        if self._users.get(id(value)):
+            self._retired[id(value)] = value
+        else:
+            value.close()
+
+    def _checkout(self, name):
+        path = TEMPLATE_DIR / f"{name}.nsx"
+        while True:
+            template = self.template(name)
+            with self._lock:
+                # The template may have been replaced, and closed,
+                # since it was fetched.
+                entry = self._cache.get(path)
+                if entry and entry[1] is template:
+                    key = id(template)
+                    self._users[key] = self._users.get(key, 0) + 1
+                    return template
+
+    def _checkin(self, template):
+        with self._lock:
+            key = id(template)
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                if self._retired.pop(key, None) is not None:
+                    template.close()
+
+    def template(self, name):
+        """Get a template, loading it if it has not been loaded yet or
+        has changed on disk.
+
+        Args:
+            name (:obj:`str`): The name of the template.
+
+        Returns:
+            :obj:`Template`: The template. It is closed once the
+            template changes on disk, unless a deployment from this
+            session is still using it.
+
+        Raises:
+            :obj:`DoesNotExist`: The template does not exist.
+        """
+        path = TEMPLATE_DIR / f"{name}.nsx"
+        template = self._get(path, lambda: Template(name))
+        if template is None:
+            raise DoesNotExist(f"Template '{name}' not found")
+        return template
+
+    def profile(self, name=None):
+        """Get a profile, loading it if it has not been loaded yet or
+        has changed on disk.
+
+        Keyword Args:
+            name (:obj:`str`): The name of the profile. If this is None,
+                the currently selected profile is used. Defaults to
+                None.
+
+        Returns:
+            :obj:`Profile`: The profile.
+
+        Raises:
+            :obj:`DoesNotExist`: The profile does not exist.
+        """
+        if name is None:
+            config = self._get(CONFIG_FILE, lambda: NSCSpecIO().read())
+            if config is None:
+                raise DoesNotExist("No config file found")
+            name = config["profile"]
+
+        path = PROFILE_DIR / f"{name}.nsp"
+        profile = self._get(path, lambda: Profile(name))
+        if profile is None:
+            raise DoesNotExist(f"Profile '{name}' not found")
+        return profile
+
+    def deploy(
+        self,
+        template,
+        destination=".",
+        project_name=None,
+        overrides=None,
+        *,
+        profile=None,
+        jobs=1,
+        atomic=True,
+        fsync=False,
+    ):
+        """Deploy a template. This is safe to call from multiple
+        threads, though each deployment should have its own
+        destination.
+
+        Args:
+            template (:obj:`str` | :obj:`Template`): The template, or
+                the name of the template, to deploy.
+            destination (:obj:`str` | :obj:`os.PathLike`): The path to
+                deploy the template to. Defaults to the current
+                directory.
+            project_name (:obj:`str`): The name to use as the project
+                name. If this is None, the name of the destination
+                directory is used. Defaults to None.
+            overrides (:obj:`dict[str, str]`): Profile options to use
+                in place of the profile's own for this deployment only.
+                Defaults to None.
+
+        Keyword Args:
+            profile (:obj:`str`): The name of the profile to deploy
+                with. If this is None, the currently selected profile
+                is used. Defaults to None.
+            jobs (:obj:`int`): The number of files to write at once.
+                Defaults to 1.
+            atomic (:obj:`bool`): Whether to deploy through a staging
+                directory. Defaults to True.
+            fsync (:obj:`bool`): Whether to flush files to disk before
+                moving them into place. Defaults to False.
+
+        Raises:
+            :obj:`DoesNotExist`: The template or profile does not
+                exist.
+            :obj:`ProfileError`: One of the overrides is invalid.
+        """
+        profile = self.profile(profile)
+        if overrides:
+            data = profile.data.copy()
+            for k, v in overrides.items():
+                data[k] = profile.validate_option(k, v)
+        else:
+            data = profile.data
+
+        owned = not isinstance(template, Template)
+        if owned:
+            template = self._checkout(template)
+
+        try:
+            template.deploy(
+                project_name=project_name,
+                destination=destination,
+                jobs=jobs,
+                atomic=atomic,
+                fsync=fsync,
+                profile=data,
+            )
+        finally:
+            if owned:
+                self._checkin(template)
+
+    def close(self):
+        """Close every template loaded by this session, and forget
+        everything it has loaded. Templates still being deployed are
+        closed once their deployments finish.
+        """
+        with self._lock:
+            for _, value in self._cache.values():
+                self._retire(value)
+            self._cache.clear()
@@ -26,6 +26,7 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from .blobs import BlobStore
 from .nsc import NSCSpecIO
 from .nsp import NSPSpecIO
-from .nsx import NSXSpecIO
+from .nsx import NSXFileMapping, NSXReader, NSXSpecIO, NSXWriter
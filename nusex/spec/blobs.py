@@ -0,0 +1,336 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+from nusex import BLOB_DIR
+
+CHUNK_SIZE = 1 << 20
+# Blob digests are joined into paths, so anything else is rejected.
+DIGEST_PATTERN = re.compile("[0-9a-f]{64}")
+
+
+class BlobStore:
+    """A content-addressed store for file data shared between
+    templates. Each blob is stored once, keyed by the SHA-256 hash of
+    its data, and the blobs each template references are tracked so
+    that unreferenced blobs can be removed.
+
+    Keyword Args:
+        path (:obj:`pathlib.Path`): The directory to store blobs in.
+            Defaults to the blobs directory in the config directory.
+
+    Attributes:
+        path (:obj:`pathlib.Path`): The directory blobs are stored in.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = ("path",)
+
+    def __init__(self, path=BLOB_DIR):
+        self.path = path
+
+    @property
+    def refs_file(self):
+        """The file template references are recorded in.
+
+        Returns:
+            :obj:`pathlib.Path`
+        """
+        return self.path / "refs.json"
+
+    @contextmanager
+    def _lock_refs(self):
+        # Updating references reads, changes, and writes the whole refs
+        # file, so concurrent saves would otherwise drop each other's
+        # references. The lock is held across processes.
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.path / "refs.lock", "wb") as f:
+            if os.name == "nt":
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def path_for(self, digest):
+        """Get the path of a blob.
+
+        Args:
+            digest (:obj:`str`): The blob's hex digest.
+
+        Returns:
+            :obj:`pathlib.Path`
+
+        Raises:
+            :obj:`ValueError`: The digest is not a SHA-256 hex digest.
+        """
+        if not (isinstance(digest, str) and DIGEST_PATTERN.fullmatch(digest)):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+
+        return self.path / digest[:2] / digest[2:]
+
+    def _write_blob(self, path, data):
+        if not path.is_file():
+            os.makedirs(path.parent, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def put(self, data, *, ref=None):
+        """Add data to the store. Nothing is written if the data is
+        already stored.
+
+        Args:
+            data (:obj:`bytes`): The data to store.
+
+        Keyword Args:
+            ref (:obj:`str`): The name of the template the data is
+                being stored for. If this is given, the template
+                references the blob before it is written, so the blob
+                cannot be removed by another template releasing it
+                before this one is saved. Defaults to None.
+
+        Returns:
+            :obj:`str`: The data's hex digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+
+        if ref is None:
+            self._write_blob(path, data)
+            return digest
+
+        with self._lock_refs():
+            self._add_refs(ref, {digest})
+            self._write_blob(path, data)
+        return digest
+
+    def read(self, digest):
+        """Read a blob.
+
+        Args:
+            digest (:obj:`str`): The blob's hex digest.
+
+        Returns:
+            :obj:`bytes`: The blob's data.
+
+        Raises:
+            :obj:`FileNotFoundError`: The blob does not exist.
+        """
+        with open(self.path_for(digest), "rb") as f:
+            return f.read()
+
+    def iter_chunks(self, digest, chunk_size=CHUNK_SIZE):
+        """Read a blob in chunks.
+
+        Args:
+            digest (:obj:`str`): The blob's hex digest.
+            chunk_size (:obj:`int`): The maximum size of each chunk.
+                Defaults to 1 MiB.
+
+        Yields:
+            :obj:`bytes`: Chunks of the blob's data.
+        """
+        with open(self.path_for(digest), "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+
+    def copy(self, digest, path):
+        """Copy a blob to a file. Where the platform supports it, the
+        data is copied by the kernel without being read into memory.
+
+        Args:
+            digest (:obj:`str`): The blob's hex digest.
+            path (:obj:`str` | :obj:`os.PathLike`): The path to copy
+                the blob to. Any existing file is overwritten.
+
+        Raises:
+            :obj:`FileNotFoundError`: The blob does not exist.
+        """
+        shutil.copyfile(self.path_for(digest), path)
+
+    def refs(self):
+        """Get the blobs referenced by each template.
+
+        Returns:
+            :obj:`dict[str, set[str]]`: The digests each template
+            references, keyed by template name.
+        """
+        try:
+            with open(self.refs_file) as f:
+                return {k: set(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def _write_refs(self, refs):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f"{self.refs_file}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({k: sorted(v) for k, v in refs.items() if v}, f)
+        os.replace(tmp, self.refs_file)
+
+    def refcounts(self):
+        """Get the number of templates referencing each blob.
+
+        Returns:
+            :obj:`dict[str, int]`
+        """
+        counts = {}
+        for digests in self.refs().values():
+            for d in digests:
+                counts[d] = counts.get(d, 0) + 1
+        return counts
+
+    def _add_refs(self, name, digests):
+        refs = self.refs()
+        old = refs.get(name, set())
+        if not old.issuperset(digests):
+            refs[name] = old.union(digests)
+            self._write_refs(refs)
+
+    def add_refs(self, name, digests):
+        """Record more blobs a template references, keeping those it
+        already references. Templates being saved use this to keep the
+        blobs they reference from being removed until they are saved.
+
+        Args:
+            name (:obj:`str`): The name of the template.
+            digests (:obj:`set[str]`): The digests to add.
+        """
+        with self._lock_refs():
+            self._add_refs(name, digests)
+
+    def set_refs(self, name, digests):
+        """Record the blobs a template references, replacing any
+        previous record for that template. Blobs that are no longer
+        referenced by any template are removed.
+
+        Args:
+            name (:obj:`str`): The name of the template.
+            digests (:obj:`set[str]`): The digests the template
+                references.
+
+        Returns:
+            :obj:`int`: The number of blobs removed.
+        """
+        # Most templates reference no blobs, so there is no need to
+        # create the store just to lock it.
+        if not digests and not self.refs_file.is_file():
+            return 0
+
+        with self._lock_refs():
+            refs = self.refs()
+            if not digests and name not in refs:
+                return 0
+
+            old = refs.get(name, set())
+            refs[name] = set(digests)
+            self._write_refs(refs)
+            return self._collect(old - refs[name], refs)
+
+    def rename_refs(self, name, new_name):
+        """Move a template's references to a new name.
+
+        Args:
+            name (:obj:`str`): The old name of the template.
+            new_name (:obj:`str`): The new name of the template.
+        """
+        if not self.refs_file.is_file():
+            return
+
+        with self._lock_refs():
+            refs = self.refs()
+            if name in refs:
+                refs[new_name] = refs.pop(name)
+                self._write_refs(refs)
+
+    def release(self, name):
+        """Drop all of a template's references. Blobs that are no
+        longer referenced by any template are removed.
+
+        Args:
+            name (:obj:`str`): The name of the template.
+
+        Returns:
+            :obj:`int`: The number of blobs removed.
+        """
+        return self.set_refs(name, set())
+
+    def _collect(self, candidates, refs):
+        live = set().union(*refs.values())
+        removed = 0
+
+        for digest in candidates - live:
+            if not DIGEST_PATTERN.fullmatch(digest):
+                continue
+            try:
+                os.remove(self.path_for(digest))
+                removed += 1
+            except FileNotFoundError:
+                ...
+
+        return removed
+
+    def collect(self):
+        """Remove every blob not referenced by any template.
+
+        Returns:
+            :obj:`int`: The number of blobs removed.
+        """
+        if not self.path.is_dir():
+            return 0
+
+        stored = {
+            f"{p.parent.name}{p.name}"
+            for p in self.path.glob("??/*")
+            if not p.name.endswith(".tmp")
+        }
+        with self._lock_refs():
+            return self._collect(stored, self.refs())
+
+    def clear(self):
+        """Remove every blob, and all references to them."""
+        shutil.rmtree(self.path, ignore_errors=True)
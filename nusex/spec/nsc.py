@@ -26,6 +26,8 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
+
 from nusex import CONFIG_FILE
 from nusex.errors import UnsupportedFile
 
@@ -41,6 +43,7 @@ class NSCSpecIO:
             "last_update": "000101",
             "use_wildmatch_ignore": False,
             "auto_update": False,
+            "update_available": False,
         }
 
     def read(self):
@@ -61,7 +64,11 @@ class NSCSpecIO:
                 ...
 
             # Not guaranteed from here.
-            attrs = ("use_wildmatch_ignore", "auto_update")
+            attrs = (
+                "use_wildmatch_ignore",
+                "auto_update",
+                "update_available",
+            )
             for attr in attrs:
                 try:
                     data[attr] = f.read(1) == b"\x01"
@@ -72,7 +79,10 @@ class NSCSpecIO:
         return data
 
     def write(self, data):
-        with open(CONFIG_FILE, "wb") as f:
+        # Update checks write the config in the background, so it is
+        # replaced in one go to avoid it being read half-written.
+        tmp = f"{CONFIG_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
             # Identify format.
             f.write(SPEC_ID)
 
@@ -83,3 +93,6 @@ class NSCSpecIO:
             # Not guaranteed, so write a default value if not present.
             f.write((b"\x00", b"\x01")[data.get("use_wildmatch_ignore", 0)])
             f.write((b"\x00", b"\x01")[data.get("auto_update", 0)])
+            f.write((b"\x00", b"\x01")[data.get("update_available", 0)])
+
+        os.replace(tmp, CONFIG_FILE)
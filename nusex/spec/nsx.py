@@ -26,9 +26,1017 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import errno
+import io
+import lzma
+import math
+import mmap
+import os
+import struct
+import zlib
+from collections import Counter, namedtuple
+from collections.abc import MutableMapping
+
 from nusex.errors import TemplateError, UnsupportedFile
 
+from .blobs import DIGEST_PATTERN, BlobStore
+
 SPEC_ID = b"\x99\x78"
+VERSION = 3
+
+# Version 3 layout:
+#   header   spec ID, version, as_addon_for, language, TOC offset,
+#            number of entries, size of the name block, size of the
+#            placeholder index, reserved (64 bytes)
+#   bodies   the raw file bodies, back to back
+#   TOC      an offset, size, and flags record for each entry, then
+#            every entry name joined by null bytes
+#   index    the number of placeholders in each entry, then an offset
+#            and placeholder ID record for each placeholder
+#   installs each install, terminated by 0x97
+#
+# Version 2 files are identical, but have no placeholder index; the
+# size of the index is always 0 in them, as the field was reserved.
+#
+# Version 1 files have no version byte; instead, the byte after the
+# spec ID is the add-on flag, which is always 0x00 or 0x01.
+HEADER = struct.Struct("<2sB24s12sQIQI1x")
+TOC_ENTRY = struct.Struct("<QQI")
+
+# Placeholder offsets are relative to the decompressed file data, and
+# placeholder IDs are assigned by the template. Entries that were not
+# indexed have a count of UNINDEXED.
+PLACEHOLDER = struct.Struct("<QB")
+UNINDEXED = 0xFFFFFFFF
+
+# Entry flags. The lowest two bits hold the compression codec; the
+# size in the TOC is always the size of the data as stored. Blob
+# entries store the hex digest of a blob in the shared blob store
+# rather than the file itself.
+FLAG_ZLIB = 0x01
+FLAG_LZMA = 0x02
+CODEC_MASK = 0x03
+FLAG_BLOB = 0x04
+
+# Compression heuristics. Small files are not worth the overhead,
+# files that look random (images, archives, wheels) will not shrink,
+# and LZMA is only worth its cost on large, repetitive files such as
+# lockfiles.
+MIN_COMPRESS_SIZE = 512
+MAX_ENTROPY = 7.5
+LZMA_MIN_SIZE = 1 << 20
+LZMA_MAX_ENTROPY = 6.0
+MIN_SAVING = 0.1
+SAMPLE_SIZE = 1 << 16
+CHUNK_SIZE = 1 << 20
+
+# Files smaller than this are cheaper to store inline than as a blob
+# reference and a file of their own.
+MIN_BLOB_SIZE = 256
+
+# The most the kernel is asked to copy at once.
+MAX_COPY_SIZE = 1 << 30
+
+# Errors meaning a method of copying is not supported for the given
+# files, and that the next should be tried.
+COPY_FALLBACK_ERRNOS = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSOCK,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+NSXEntry = namedtuple("NSXEntry", ("name", "offset", "size", "flags"))
+
+
+def _truncated():
+    return UnsupportedFile("Not a valid NSX file (truncated)")
+
+
+def _check_digest(data):
+    # Blob entries are resolved to paths in the blob store, so a
+    # malformed digest could point anywhere on disk.
+    if not DIGEST_PATTERN.fullmatch(bytes(data).decode("latin-1")):
+        raise UnsupportedFile("Not a valid NSX file (bad blob digest)")
+
+
+def _index_v1(buf):
+    # Returns the header data, the entries, and the installs of a
+    # version 1 file without copying any of the bodies.
+    data = {"as_addon_for": "", "language": "python", "installs": []}
+    entries = []
+    find = buf.find
+    size = len(buf)
+
+    pos = 3
+    if buf[2:3] == b"\x01":
+        data["as_addon_for"] = buf[pos : pos + 24].decode().strip()
+        pos += 24
+
+    l = buf[pos : pos + 1]
+    pos += 1
+    if l == b"\x01":
+        data["language"] = buf[pos : pos + 12].decode().strip()
+        pos += 12
+
+    pos += 8  # Skip reserved.
+
+    while pos < size:
+        chunk = buf[pos]
+        pos += 1
+
+        if chunk == 1:
+            while True:
+                sep = find(b"\x97", pos)
+                if sep == -1:
+                    sep = size
+
+                # The chunk can end before another name has been found.
+                end = find(b"\x98", pos, sep)
+                if end != -1:
+                    pos = end + 1
+                    break
+
+                if sep == size:
+                    raise _truncated()
+
+                name = buf[pos:sep].decode()
+                length = int(buf[sep + 1 : sep + 9].strip(), base=16)
+                pos = sep + 9
+                entries.append(NSXEntry(name, pos, length, 0))
+                pos += length
+
+        elif chunk == 2:
+            end = find(b"\x98", pos)
+            if end == -1:
+                raise _truncated()
+
+            # Anything after the last separator is not a complete
+            # install.
+            data["installs"].extend(
+                i.decode() for i in buf[pos:end].split(b"\x97")[:-1]
+            )
+            pos = end + 1
+
+        else:
+            raise UnsupportedFile("Not a valid NSX file")
+
+    if entries and entries[-1].offset + entries[-1].size > size:
+        raise _truncated()
+
+    return data, entries
+
+
+def _index_v2(f):
+    try:
+        (
+            _,
+            version,
+            ef,
+            l,
+            toc_offset,
+            count,
+            names_size,
+            index_size,
+        ) = HEADER.unpack(f.read(HEADER.size))
+    except struct.error:
+        raise _truncated() from None
+
+    if version > VERSION:
+        raise UnsupportedFile(f"Unsupported NSX version ({version})")
+
+    data = {
+        "as_addon_for": ef.decode().strip(),
+        "language": l.decode().strip(),
+        "installs": [],
+    }
+
+    f.seek(toc_offset)
+    footer = f.read()
+    records_size = TOC_ENTRY.size * count
+    names_end = records_size + names_size
+    index_end = names_end + index_size
+
+    if len(footer) < index_end or (
+        footer[index_end:] and not footer.endswith(b"\x97")
+    ):
+        raise _truncated()
+
+    names = footer[records_size:names_end].decode().split("\x00")
+    if not count:
+        names = []
+    entries = [
+        NSXEntry(name, *record)
+        for name, record in zip(
+            names, TOC_ENTRY.iter_unpack(footer[:records_size])
+        )
+    ]
+
+    if len(entries) != count or (
+        entries and entries[-1].offset + entries[-1].size > toc_offset
+    ):
+        raise _truncated()
+
+    placeholders = {}
+    if index_size:
+        if index_size < 4 * count:
+            raise _truncated()
+
+        counts_end = names_end + 4 * count
+        counts = struct.unpack(f"<{count}I", footer[names_end:counts_end])
+        records = PLACEHOLDER.iter_unpack(footer[counts_end:index_end])
+        try:
+            for entry, n in zip(entries, counts):
+                if n != UNINDEXED:
+                    placeholders[entry.name] = [
+                        next(records) for _ in range(n)
+                    ]
+        except StopIteration:
+            raise _truncated() from None
+
+    data["installs"].extend(
+        i.decode() for i in footer[index_end:].split(b"\x97")[:-1]
+    )
+    return data, entries, placeholders
+
+
+def _copy_file_range(src, dst, offset, size):
+    return os.copy_file_range(src, dst, min(size, MAX_COPY_SIZE), offset)
+
+
+def _sendfile(src, dst, offset, size):
+    return os.sendfile(dst, src, offset, min(size, MAX_COPY_SIZE))
+
+
+_COPIERS = []
+if hasattr(os, "copy_file_range"):
+    _COPIERS.append(_copy_file_range)
+if hasattr(os, "sendfile"):
+    _COPIERS.append(_sendfile)
+
+
+def _copy_range(src, dst, offset, size):
+    """Copy part of one file to the current position of another
+    without the data passing through Python, using whichever system
+    call the platform and file systems support.
+
+    Args:
+        src (:obj:`int`): The file descriptor to copy from.
+        dst (:obj:`int`): The file descriptor to copy to.
+        offset (:obj:`int`): The offset in ``src`` to copy from.
+        size (:obj:`int`): The number of bytes to copy.
+
+    Returns:
+        :obj:`int`: The number of bytes left uncopied. This is only
+        non-zero if no system call could be used for the rest.
+    """
+    for copy in _COPIERS:
+        try:
+            while size:
+                n = copy(src, dst, offset, size)
+                if not n:
+                    raise _truncated()
+                offset += n
+                size -= n
+            break
+        except OSError as exc:
+            if exc.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+
+    return size
+
+
+def _entropy(data):
+    # Shannon entropy of samples from the start, middle, and end of the
+    # data, in bits per byte.
+    if len(data) > SAMPLE_SIZE:
+        n = SAMPLE_SIZE // 3
+        mid = len(data) // 2
+        sample = bytes(data[:n]) + bytes(data[mid : mid + n]) + data[-n:]
+    else:
+        sample = bytes(data)
+    total = len(sample)
+    return -sum(
+        n / total * math.log2(n / total) for n in Counter(sample).values()
+    )
+
+
+def _compress(data):
+    """Compress file data using whichever codec suits it best, if any.
+
+    Args:
+        data (:obj:`bytes`): The file data.
+
+    Returns:
+        :obj:`tuple[bytes, int]`: The data to store, and the flags to
+        store it with. If compressing the data is not worthwhile, the
+        data is returned as is with no flags set.
+    """
+    size = len(data)
+    if size < MIN_COMPRESS_SIZE:
+        return data, 0
+
+    entropy = _entropy(data)
+    if entropy > MAX_ENTROPY:
+        return data, 0
+
+    if size >= LZMA_MIN_SIZE and entropy <= LZMA_MAX_ENTROPY:
+        packed, flags = lzma.compress(data, preset=6), FLAG_LZMA
+    else:
+        packed, flags = zlib.compress(data, 6), FLAG_ZLIB
+
+    if len(packed) > size * (1 - MIN_SAVING):
+        return data, 0
+
+    return packed, flags
+
+
+def _decompress(data, flags):
+    """Decompress stored file data.
+
+    Args:
+        data (:obj:`bytes`): The file data, as stored.
+        flags (:obj:`int`): The entry's flags.
+
+    Returns:
+        :obj:`bytes`: The decompressed data.
+    """
+    codec = flags & CODEC_MASK
+    if codec == FLAG_ZLIB:
+        return zlib.decompress(data)
+    if codec == FLAG_LZMA:
+        return lzma.decompress(data)
+    return data
+
+
+def _iter_decompress(data, flags, chunk_size=CHUNK_SIZE):
+    """Decompress stored file data incrementally. Neither the input
+    nor the output is handled in pieces larger than ``chunk_size``.
+
+    Args:
+        data (:obj:`bytes` | :obj:`memoryview`): The file data, as
+            stored.
+        flags (:obj:`int`): The entry's flags.
+        chunk_size (:obj:`int`): The maximum size of each chunk.
+            Defaults to 1 MiB.
+
+    Yields:
+        :obj:`bytes`: Chunks of decompressed data.
+    """
+    codec = flags & CODEC_MASK
+    size = len(data)
+
+    if codec == FLAG_ZLIB:
+        d = zlib.decompressobj()
+        for i in range(0, size, chunk_size):
+            pending = data[i : i + chunk_size]
+            while True:
+                out = d.decompress(pending, chunk_size)
+                if out:
+                    yield out
+                pending = d.unconsumed_tail
+                if not pending and len(out) < chunk_size:
+                    break
+
+        if not d.eof:
+            raise _truncated()
+
+    elif codec == FLAG_LZMA:
+        d = lzma.LZMADecompressor()
+        pos = 0
+        while not d.eof:
+            pending = b""
+            if d.needs_input:
+                if pos >= size:
+                    raise _truncated()
+                pending = data[pos : pos + chunk_size]
+                pos += chunk_size
+
+            out = d.decompress(pending, chunk_size)
+            if out:
+                yield out
+
+    else:
+        for i in range(0, size, chunk_size):
+            yield bytes(data[i : i + chunk_size])
+
+
+class NSXReader:
+    """A reader providing random access to the entries of an NSX file.
+
+    The header and table of contents are read when the reader is
+    created; file bodies are only read when requested. Both version 1
+    and version 2 files are supported, though version 1 files need to
+    be scanned in full (without copying the bodies) to be indexed.
+
+    Args:
+        path (:obj:`str` | :obj:`os.PathLike`): The path to the NSX
+            file.
+
+    Keyword Args:
+        blobs (:obj:`BlobStore`): The blob store to read blob entries
+            from. If this is None, the default store is used. Defaults
+            to None.
+
+    Attributes:
+        path (:obj:`str` | :obj:`os.PathLike`): The path to the NSX
+            file.
+        blobs (:obj:`BlobStore`): The blob store blob entries are read
+            from.
+        version (:obj:`int`): The version of the NSX spec the file was
+            written with.
+        data (:obj:`dict[str, Any]`): The template data, minus the
+            files.
+        entries (:obj:`dict[str, NSXEntry]`): The entries in the file,
+            in the order they were written.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = (
+        "path",
+        "blobs",
+        "version",
+        "data",
+        "entries",
+        "_placeholders",
+        "_f",
+        "_mmap",
+    )
+
+    def __init__(self, path, *, blobs=None):
+        self.path = path
+        self.blobs = blobs or BlobStore()
+        self._f = open(path, "rb")
+        self._mmap = None
+
+        try:
+            head = self._f.read(3)
+            if head[:2] != SPEC_ID:
+                raise UnsupportedFile("Not a valid NSX file")
+
+            self._f.seek(0)
+            if head[2:] in (b"\x00", b"\x01"):
+                self.version = 1
+                self.data, entries = _index_v1(self._map())
+                self._placeholders = {}
+            else:
+                self.version = head[2]
+                self.data, entries, self._placeholders = _index_v2(self._f)
+
+            self.entries = {e.name: e for e in entries}
+            for entry in entries:
+                if entry.flags & FLAG_BLOB:
+                    _check_digest(self.read_raw(entry.name)[0])
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def names(self):
+        """The names of the files in this template.
+
+        Returns:
+            :obj:`list[str]`
+        """
+        return list(self.entries)
+
+    def read(self, name):
+        """Read a single file from this template.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`bytes`: The file's data.
+
+        Raises:
+            :obj:`KeyError`: The file is not in the template.
+        """
+        return self._read_entry(self.entries[name])
+
+    def _read_entry(self, entry):
+        data = self._map()[entry.offset : entry.offset + entry.size]
+        if entry.flags & FLAG_BLOB:
+            return self.blobs.read(data.decode())
+        return _decompress(data, entry.flags)
+
+    def read_raw(self, name):
+        """Read a single file from this template as it is stored,
+        without decompressing it or resolving blob references.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`tuple[bytes, int]`: The stored data and the entry's
+            flags.
+
+        Raises:
+            :obj:`KeyError`: The file is not in the template.
+        """
+        entry = self.entries[name]
+        return (
+            self._map()[entry.offset : entry.offset + entry.size],
+            entry.flags,
+        )
+
+    def placeholders(self, name):
+        """Get the placeholders in a single file in this template, as
+        recorded when the template was built.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`list[tuple[int, int]] | None`: The offset and ID of
+            each placeholder in the file's (decompressed) data, in
+            order. If the file was not indexed, this is None.
+
+        Raises:
+            :obj:`KeyError`: The file is not in the template.
+        """
+        if name not in self.entries:
+            raise KeyError(name)
+        return self._placeholders.get(name)
+
+    def blob_digests(self):
+        """Get the digests of every blob this template references.
+
+        Returns:
+            :obj:`set[str]`
+        """
+        return {
+            self.read_raw(name)[0].decode()
+            for name, entry in self.entries.items()
+            if entry.flags & FLAG_BLOB
+        }
+
+    def view(self, name):
+        """Get a zero-copy view of a single file in this template. The
+        file's data is paged in from disk as the view is accessed.
+        Compressed files cannot be viewed in place, so these are
+        decompressed into memory first. Blobs are read into memory
+        too.
+
+        Views must be released before the reader is closed, otherwise
+        the memory map is only closed once they have been.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`memoryview`: A read-only view of the file's data.
+
+        Raises:
+            :obj:`KeyError`: The file is not in the template.
+        """
+        entry = self.entries[name]
+        if entry.flags & (CODEC_MASK | FLAG_BLOB):
+            return memoryview(self._read_entry(entry))
+
+        with memoryview(self._map()) as mv:
+            return mv[entry.offset : entry.offset + entry.size]
+
+    def iter_chunks(self, name, chunk_size=CHUNK_SIZE):
+        """Read a single file from this template in chunks. Compressed
+        files are decompressed as they are read, so neither the
+        compressed nor the decompressed data is ever held in memory in
+        full.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+            chunk_size (:obj:`int`): The maximum size of each chunk.
+                Defaults to 1 MiB.
+
+        Yields:
+            :obj:`bytes`: Chunks of the file's data.
+
+        Raises:
+            :obj:`KeyError`: The file is not in the template.
+        """
+        entry = self.entries[name]
+        if entry.flags & FLAG_BLOB:
+            digest, _ = self.read_raw(name)
+            yield from self.blobs.iter_chunks(digest.decode(), chunk_size)
+            return
+
+        with memoryview(self._map()) as mv:
+            with mv[entry.offset : entry.offset + entry.size] as data:
+                yield from _iter_decompress(data, entry.flags, chunk_size)
+
+    def extract(self, name, path):
+        """Write a single file from this template to disk. Files that
+        are stored as they are, or as blobs, are copied by the kernel
+        where the platform supports it, so their data is never read
+        into memory. Compressed files are decompressed as they are
+        written.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+            path (:obj:`str` | :obj:`os.PathLike`): The path to write
+                the file to. Any existing file is overwritten.
+
+        Raises:
+            :obj:`KeyError`: The file is not in the template.
+        """
+        entry = self.entries[name]
+        if entry.flags & FLAG_BLOB:
+            digest, _ = self.read_raw(name)
+            self.blobs.copy(digest.decode(), path)
+            return
+
+        with open(path, "wb") as f:
+            if entry.flags & CODEC_MASK:
+                for chunk in self.iter_chunks(name):
+                    f.write(chunk)
+                return
+
+            left = _copy_range(
+                self._f.fileno(), f.fileno(), entry.offset, entry.size
+            )
+            if left:
+                end = entry.offset + entry.size
+                with memoryview(self._map()) as mv:
+                    with mv[end - left : end] as data:
+                        f.write(data)
+
+    def _map(self):
+        if self._mmap is None:
+            self._mmap = mmap.mmap(
+                self._f.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self._mmap
+
+    def close(self):
+        """Close the underlying file and memory map."""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # There are still views open; the map will be closed
+                # when they are garbage collected.
+                ...
+            self._mmap = None
+
+        self._f.close()
+
+
+class NSXFileMapping(MutableMapping):
+    """A mapping of file names to file data, backed by an NSX file on
+    disk. The names are available as soon as the mapping is created,
+    but file data is only read from the memory-mapped file when it is
+    accessed.
+
+    Files can be added, replaced, and removed as with a dictionary;
+    such changes are held in memory and never written back to the
+    underlying file.
+
+    Args:
+        path (:obj:`str` | :obj:`os.PathLike`): The path to the NSX
+            file.
+
+    Attributes:
+        reader (:obj:`NSXReader`): The reader for the underlying file.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = ("reader", "_files")
+
+    def __init__(self, path):
+        self.reader = NSXReader(path)
+        self._files = dict(self.reader.entries)
+
+    def __repr__(self):
+        return f"<NSXFileMapping path={self.reader.path!r} files={len(self)}>"
+
+    def __getitem__(self, name):
+        value = self._files[name]
+        if isinstance(value, NSXEntry):
+            return self.reader._read_entry(value)
+        return value
+
+    def __setitem__(self, name, value):
+        self._files[name] = value
+
+    def __delitem__(self, name):
+        del self._files[name]
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def view(self, name):
+        """Get a zero-copy view of a file's data. Files that are not
+        backed by the NSX file are wrapped instead.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`memoryview`: A read-only view of the file's data.
+        """
+        value = self._files[name]
+        if isinstance(value, NSXEntry):
+            return self.reader.view(name)
+        return memoryview(value)
+
+    def iter_chunks(self, name, chunk_size=CHUNK_SIZE):
+        """Read a file's data in chunks, decompressing it as it is read
+        if necessary.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+            chunk_size (:obj:`int`): The maximum size of each chunk.
+                Defaults to 1 MiB.
+
+        Yields:
+            :obj:`bytes`: Chunks of the file's data.
+        """
+        value = self._files[name]
+        if isinstance(value, NSXEntry):
+            yield from self.reader.iter_chunks(name, chunk_size)
+        elif value:
+            yield value
+
+    def extract(self, name, path):
+        """Write a file's data to disk, copying it without reading it
+        into memory where possible.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+            path (:obj:`str` | :obj:`os.PathLike`): The path to write
+                the file to. Any existing file is overwritten.
+        """
+        value = self._files[name]
+        if isinstance(value, NSXEntry):
+            self.reader.extract(name, path)
+            return
+
+        with open(path, "wb") as f:
+            f.write(value)
+
+    @property
+    def modified(self):
+        """Whether any files have been added, replaced, or removed
+        since the mapping was created.
+
+        Returns:
+            :obj:`bool`
+        """
+        return len(self._files) != len(self.reader.entries) or any(
+            not isinstance(v, NSXEntry) for v in self._files.values()
+        )
+
+    def placeholders(self, name):
+        """Get the placeholders in a file, as recorded when the
+        template was built.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`list[tuple[int, int]] | None`: The offset and ID of
+            each placeholder in the file's data, in order. If the file
+            was not indexed, or is held in memory, this is None.
+        """
+        if isinstance(self._files[name], NSXEntry):
+            return self.reader.placeholders(name)
+        return None
+
+    def read_raw(self, name):
+        """Read a file as it is stored in the NSX file.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+
+        Returns:
+            :obj:`tuple[bytes, int] | None`: The stored data and the
+            entry's flags, or None if the file is held in memory.
+        """
+        if isinstance(self._files[name], NSXEntry):
+            return self.reader.read_raw(name)
+        return None
+
+    def close(self):
+        """Close the underlying NSX file. Files not already in memory
+        can no longer be accessed after this."""
+        self.reader.close()
+
+    def reopen(self, path, *, keep_changes=True):
+        """Rebind this mapping to a different NSX file, such as one it
+        has been written or moved to. Files backed by the old file are
+        looked up by name in the new one.
+
+        Args:
+            path (:obj:`str` | :obj:`os.PathLike`): The path to the NSX
+                file.
+
+        Keyword Args:
+            keep_changes (:obj:`bool`): Whether to keep files held in
+                memory. If this is False, all files are read from the
+                new file instead. Defaults to True.
+        """
+        self.close()
+        self.reader = NSXReader(path)
+        entries = self.reader.entries
+        self._files = {
+            k: (
+                v
+                if keep_changes and not isinstance(v, NSXEntry)
+                else entries[k]
+            )
+            for k, v in self._files.items()
+        }
+
+
+class NSXWriter:
+    """A writer that appends entries to a version 2 NSX file one at a
+    time. The table of contents is written, and the header completed,
+    when the writer is closed.
+
+    Args:
+        path (:obj:`str` | :obj:`os.PathLike`): The path to write to.
+
+    Keyword Args:
+        as_addon_for (:obj:`str`): The name of the template this
+            template is an add-on for. Defaults to an empty string.
+        language (:obj:`str`): The template's language. Defaults to
+            "python".
+        installs (:obj:`list[str]`): A list of dependencies to install
+            when the template is deployed. Defaults to an empty list.
+        blobs (:obj:`BlobStore`): The blob store to write deduplicated
+            files to. If this is None, the default store is used.
+            Defaults to None.
+        ref (:obj:`str`): The name of the template being written. If
+            this is given, the template references each blob as it is
+            written, so no blob can be removed before the template is
+            saved. Defaults to None.
+
+    Attributes:
+        entries (:obj:`list[NSXEntry]`): The entries written so far.
+        placeholders (:obj:`list[list[tuple[int, int]] | None]`): The
+            placeholders in each entry written so far.
+        digests (:obj:`set[str]`): The digests of every blob referenced
+            by the entries written so far.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = (
+        "as_addon_for",
+        "language",
+        "installs",
+        "blobs",
+        "ref",
+        "entries",
+        "placeholders",
+        "digests",
+        "_f",
+    )
+
+    def __init__(
+        self,
+        path,
+        *,
+        as_addon_for="",
+        language="python",
+        installs=[],
+        blobs=None,
+        ref=None,
+    ):
+        self.as_addon_for = as_addon_for
+        self.language = language
+        self.installs = installs
+        self.blobs = blobs or BlobStore()
+        self.ref = ref
+        self.entries = []
+        self.placeholders = []
+        self.digests = set()
+        self._f = open(path, "wb")
+        self._f.write(b"\x00" * HEADER.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type:
+            self._f.close()
+            return
+
+        self.close()
+
+    def add(
+        self,
+        name,
+        data,
+        flags=0,
+        *,
+        compress=False,
+        dedupe=False,
+        placeholders=None,
+    ):
+        """Append a file to the template.
+
+        Args:
+            name (:obj:`str`): The name of the file.
+            data (:obj:`bytes`): The file's data. If any flags are
+                passed, this should be the data as it is to be stored.
+            flags (:obj:`int`): The entry's flags. Defaults to 0.
+
+        Keyword Args:
+            compress (:obj:`bool`): Whether to compress the file's data,
+                should it be worthwhile. Defaults to False.
+            dedupe (:obj:`bool`): Whether to store the file's data in
+                the blob store, and only reference it here. This takes
+                precedence over compression. Defaults to False.
+            placeholders (:obj:`list[tuple[int, int]]`): The offset and
+                ID of each placeholder in the file's data, in order. If
+                this is None, the file is not indexed. Defaults to
+                None.
+
+        Returns:
+            :obj:`NSXEntry`: The newly written entry.
+        """
+        if not flags:
+            if dedupe and len(data) >= MIN_BLOB_SIZE:
+                digest = self.blobs.put(data, ref=self.ref)
+                data, flags = digest.encode(), FLAG_BLOB
+            elif compress:
+                data, flags = _compress(data)
+        elif flags & FLAG_BLOB and self.ref is not None:
+            # References copied from other templates need pinning too.
+            self.blobs.add_refs(self.ref, {bytes(data).decode()})
+
+        if flags & FLAG_BLOB:
+            self.digests.add(bytes(data).decode())
+
+        entry = NSXEntry(name, self._f.tell(), len(data), flags)
+        self._f.write(data)
+        self.entries.append(entry)
+        self.placeholders.append(placeholders)
+        return entry
+
+    def close(self):
+        """Write the table of contents and header, and close the
+        file."""
+        f = self._f
+        toc_offset = f.tell()
+
+        names = "\x00".join(e.name for e in self.entries).encode()
+        index = b""
+        if any(p is not None for p in self.placeholders):
+            counts = (
+                UNINDEXED if p is None else len(p) for p in self.placeholders
+            )
+            index = struct.pack(f"<{len(self.entries)}I", *counts) + b"".join(
+                PLACEHOLDER.pack(*r) for p in self.placeholders if p for r in p
+            )
+
+        f.write(
+            b"".join(TOC_ENTRY.pack(*e[1:]) for e in self.entries)
+            + names
+            + index
+            + b"".join(i.encode() + b"\x97" for i in self.installs)
+        )
+
+        f.seek(0)
+        f.write(
+            HEADER.pack(
+                SPEC_ID,
+                VERSION,
+                self.as_addon_for.ljust(24).encode(),
+                self.language.ljust(12).encode(),
+                toc_offset,
+                len(self.entries),
+                len(names),
+                len(index),
+            )
+        )
+        f.close()
 
 
 class NSXSpecIO:
@@ -42,113 +1050,101 @@ class NSXSpecIO:
             "language": "python",
         }
 
-    def _process_files(self, f, data):
-        key = True
-        name = b""
-
-        while True:
-            if key:
-                chunk = f.read(1)
+    def version(self, path):
+        with open(path, "rb") as f:
+            head = f.read(3)
 
-                if chunk == b"\x97":
-                    key = False
-                    continue
+        if head[:2] != SPEC_ID:
+            raise UnsupportedFile("Not a valid NSX file")
 
-                if chunk == b"\x98":
-                    return data
+        return 1 if head[2:] in (b"\x00", b"\x01") else head[2]
 
-                name += chunk
+    def open(self, path):
+        return NSXReader(path)
 
-            else:
-                size = int(f.read(8).decode().strip(), base=16)
-                chunk = f.read(size)
-                data["files"].update({name.decode(): chunk})
-                name = b""
-                key = True
-
-    def _process_installs(self, f, data):
-        inst = b""
-        while True:
-            b = f.read(1)
-            if b == b"\x98":
-                return data
-
-            if b == b"\x97":
-                data["installs"].append(inst.decode())
-                inst = b""
-                continue
-
-            inst += b
-
-    def read(self, path):
+    def read(self, path, *, lazy=False):
         data = self.defaults.copy()
-        with open(path, "rb") as f:
-            # Validate format.
-            if f.read(2) != SPEC_ID:
-                raise UnsupportedFile("Not a valid NSX file")
 
-            # Read headers.
-            ef = f.read(1)
-            if ef == b"\x01":
-                data["as_addon_for"] = f.read(24).decode().strip()
+        if lazy:
+            files = NSXFileMapping(path)
+            data.update(files.reader.data)
+            data["files"] = files
+            return data
+
+        with open(path, "rb") as f:
+            buf = f.read()
 
-            l = f.read(1)
-            if l == b"\x01":
-                data["language"] = f.read(12).decode().strip()
+        if buf[:2] != SPEC_ID:
+            raise UnsupportedFile("Not a valid NSX file")
 
-            f.read(8)  # Skip reserved.
+        if buf[2:3] in (b"\x00", b"\x01"):
+            meta, entries = _index_v1(buf)
+        else:
+            meta, entries, _ = _index_v2(io.BytesIO(buf))
 
-            # Process chunks.
-            while f.peek(1):
-                data = {
-                    b"\x01": self._process_files,
-                    b"\x02": self._process_installs,
-                }[f.read(1)](f, data)
+        def load(e):
+            stored = buf[e.offset : e.offset + e.size]
+            if e.flags & FLAG_BLOB:
+                _check_digest(stored)
+                return blobs.read(stored.decode())
+            return _decompress(stored, e.flags)
 
+        blobs = BlobStore()
+        data.update(meta)
+        data["files"] = {e.name: load(e) for e in entries}
         return data
 
-    def write(self, path, data):
+    def write(self, path, data, *, compress=False, dedupe=False, ref=None):
         if set(self.defaults.keys()) != set(data.keys()):
             raise TemplateError("Invalid template data")
 
-        with open(path, "wb") as f:
-            # Identify format.
-            f.write(SPEC_ID)
-
-            # Write headers.
-            ef = data["as_addon_for"]
-            if ef:
-                f.write(b"\x01")
-                f.write(ef.ljust(24).encode())
-            else:
-                f.write(b"\x00")
+        # Write to a temporary file first, as the existing file may be
+        # memory-mapped by the data being written.
+        tmp = f"{path}.tmp"
+        files = data["files"]
+        try:
+            with NSXWriter(
+                tmp,
+                as_addon_for=data["as_addon_for"],
+                language=data["language"],
+                installs=data["installs"],
+                ref=ref,
+            ) as w:
+                for k in files:
+                    # Blob references are carried over as they are, so
+                    # the blobs do not need to be read again. So are
+                    # placeholder indexes.
+                    mapped = isinstance(files, NSXFileMapping)
+                    raw = files.read_raw(k) if dedupe and mapped else None
+                    ph = files.placeholders(k) if mapped else None
+                    if raw and raw[1] & FLAG_BLOB:
+                        w.add(k, *raw, placeholders=ph)
+                    else:
+                        w.add(
+                            k,
+                            files[k],
+                            compress=compress,
+                            dedupe=dedupe,
+                            placeholders=ph,
+                        )
+        except BaseException:
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+            raise
 
-            l = data["language"]
-            if l:
-                f.write(b"\x01")
-                f.write(l.ljust(12).encode())
-            else:
-                f.write(b"\x00")
-
-            f.write(b"\x00" * 8)  # Reserved space.
-
-            # Files chunk starting byte.
-            f.write(b"\x01")
-            for k, v in data["files"].items():
-                f.write(k.encode())
-                f.write(b"\x97")
-                size = len(v)
-                if size > 0xFFFFFFFF:
-                    raise UnsupportedFile(
-                        "Files larger than 4 GB are not supported"
-                    )
-                f.write(hex(len(v))[2:].ljust(8).encode())
-                f.write(v)
-            f.write(b"\x98")
-
-            # Installs chunk starting byte.
-            f.write(b"\x02")
-            for i in data["installs"]:
-                f.write(i.encode())
-                f.write(b"\x97")
-            f.write(b"\x98")
+        if isinstance(files, NSXFileMapping):
+            # Windows cannot replace files that are mapped.
+            files.close()
+            os.replace(tmp, path)
+            files.reopen(path, keep_changes=False)
+        else:
+            os.replace(tmp, path)
+
+        return w.digests
+
+    def upgrade(self, path):
+        if self.version(path) >= VERSION:
+            return False
+
+        self.write(path, self.read(path))
+        return True
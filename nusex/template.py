@@ -27,19 +27,26 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import datetime as dt
+import hashlib
 import json
 import logging
 import os
+import stat
 import sys
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from platform import python_implementation
 
 from nusex import TEMP_DIR, TEMPLATE_DIR, Profile
 from nusex.blueprints import PythonBlueprint
-from nusex.constants import LICENSE_DIR
+from nusex.constants import MANIFEST_DIR
 from nusex.errors import BuildError, IncompatibilityError
 from nusex.helpers import cprint, run, validate_name
-from nusex.spec import NSXSpecIO
+from nusex.spec.blobs import BlobStore
+from nusex.spec.nsx import NSXFileMapping, NSXReader, NSXSpecIO, NSXWriter
+from nusex.utils import LicenseIndex, StagingArea, Substituter, walk_files
 
 ATTRS = (
     "PROJECTNAME",
@@ -54,9 +61,49 @@ ATTRS = (
     "PROJECTBASEEXC",
 )
 
+# Placeholder IDs, as stored in a template's placeholder index, are
+# positions in ATTRS.
+PLACEHOLDERS = tuple(a.encode() for a in ATTRS)
+PLACEHOLDER_IDS = {p: i for i, p in enumerate(PLACEHOLDERS)}
+_locator = Substituter(dict.fromkeys(PLACEHOLDERS, b""))
+
 log = logging.getLogger(__name__)
 
 
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        ...
+
+
+def _index_placeholders(data):
+    return [(i, PLACEHOLDER_IDS[p]) for i, p in _locator.find(data)]
+
+
+def _ordered_map(func, iterable, jobs):
+    # Like map, but runs up to `jobs` calls at once in a thread pool.
+    # Results are yielded in order, and only a few more than `jobs` are
+    # ever held at once.
+    if jobs <= 1:
+        yield from map(func, iterable)
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= jobs * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
 class Template:
     """A class in which to create, load, modify, and save templates.
 
@@ -81,12 +128,24 @@ class Template:
             Added ``as_addon_for`` keyword argument.
     """
 
-    __slots__ = ("path", "data", "_installs", "_as_addon_for")
+    __slots__ = (
+        "path",
+        "data",
+        "_installs",
+        "_as_addon_for",
+        "_build_file",
+        "_build_cleanup",
+        "_manifest",
+        "__weakref__",
+    )
 
     def __init__(self, name, *, installs=[], as_addon_for=""):
         self.path = TEMPLATE_DIR / f"{name}.nsx"
         self._installs = installs
         self._as_addon_for = as_addon_for
+        self._build_file = None
+        self._build_cleanup = None
+        self._manifest = None
 
         if not self.path.exists():
             log.info(f"[{name}] Not found; creating new...")
@@ -121,6 +180,20 @@ class Template:
         """
         return self.path.stem
 
+    @property
+    def manifest_path(self):
+        """The path to the template's build manifest. The manifest
+        records the modification time, size, and hash of every file the
+        template was built from, and is used to speed up incremental
+        builds.
+
+        Returns:
+            :obj:`pathlib.Path`
+
+        .. versionadded:: 1.4
+        """
+        return MANIFEST_DIR / f"{self.name}.json"
+
     @property
     def exists(self):
         """Whether the template exists on disk.
@@ -151,22 +224,125 @@ class Template:
         called as templates are loaded automatically when necessary upon
         object instantiation.
 
+        Only the file names are read here; file data is read from disk
+        as it is accessed.
+
         Raises:
             :obj:`FileNotFoundError`: The template does not exist on
                 disk.
+
+        .. versionchanged:: 1.4
+            File data is now loaded lazily.
         """
-        self.data = NSXSpecIO().read(self.path)
+        self.data = NSXSpecIO().read(self.path, lazy=True)
         log.debug(f"[{self.name}] Files = {list(self.data['files'].keys())}")
 
-    def save(self):
-        """Save this profile.
+    def _close_files(self):
+        files = self.data["files"]
+        if isinstance(files, NSXFileMapping):
+            files.close()
+        return files
+
+    def _discard_build(self):
+        if self._build_cleanup:
+            self._build_cleanup()
+            self._build_file = self._build_cleanup = None
+
+    def _build_unmodified(self):
+        files = self.data["files"]
+        return (
+            isinstance(files, NSXFileMapping)
+            and files.reader.path == self._build_file
+            and not files.modified
+            and set(self.data) == set(NSXSpecIO().defaults)
+            and all(v == self.data[k] for k, v in files.reader.data.items())
+        )
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        if manifest is None:
+            _remove_quietly(self.manifest_path)
+            return
+
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(manifest))
+        os.replace(tmp, self.manifest_path)
+
+    def close(self):
+        """Close this template's underlying file, and remove any build
+        output that has not been saved. File data that has not been
+        read can no longer be accessed after this.
+
+        .. versionadded:: 1.4
+        """
+        self._close_files()
+        self._discard_build()
+
+    def save(self, *, compress=False, dedupe=False):
+        """Save this template.
+
+        Keyword Args:
+            compress (:obj:`bool`): Whether to compress files in the
+                template. Each file is only compressed if doing so is
+                worthwhile. Defaults to False.
+            dedupe (:obj:`bool`): Whether to store files in the blob
+                store shared between templates, rather than in the
+                template itself. Files already in the store are not
+                written again. Defaults to False.
 
         Raises:
-            :obj:`TemplateError`: The profile data has been improperly
+            :obj:`TemplateError`: The template data has been improperly
                 modified.
+
+        .. versionchanged:: 1.4
+            Added ``compress`` and ``dedupe`` keyword arguments.
+
+        .. versionchanged:: 1.4
+            Freshly built templates are moved into place rather than
+            being written again.
         """
-        NSXSpecIO().write(self.path, self.data)
+        files = self.data["files"]
+        built = self._build_unmodified()
+        # The manifest only stays valid if the files have not been
+        # changed since they were built or loaded.
+        if built:
+            manifest = self._manifest
+        elif isinstance(files, NSXFileMapping) and not files.modified:
+            manifest = self._read_manifest()
+        else:
+            manifest = None
+
+        if built and not (compress or dedupe):
+            self._close_files()
+            os.replace(self._build_file, self.path)
+            files.reopen(self.path)
+            digests = files.reader.blob_digests()
+        else:
+            # Blobs are referenced as they are written, and those the
+            # template no longer uses are only released once it is
+            # saved.
+            digests = NSXSpecIO().write(
+                self.path,
+                self.data,
+                compress=compress,
+                dedupe=dedupe,
+                ref=self.name,
+            )
+
+        self._discard_build()
+        self._write_manifest(manifest)
+        removed = BlobStore().set_refs(self.name, digests)
         log.info(f"[{self.name}] Saved to {self.path}")
+        if removed:
+            log.debug(f"[{self.name}] Removed {removed} unused blob(s)")
 
     def delete(self):
         """Delete this template.
@@ -175,8 +351,13 @@ class Template:
             :obj:`FileNotFoundError`: The template does not exist on
                 disk.
         """
+        self.close()
         os.remove(self.path)
+        _remove_quietly(self.manifest_path)
+        removed = BlobStore().release(self.name)
         log.info(f"[{self.name}] Deleted from {self.path}")
+        if removed:
+            log.debug(f"[{self.name}] Removed {removed} unused blob(s)")
 
     def rename(self, new_name):
         """Rename this template.
@@ -194,8 +375,14 @@ class Template:
         """
         validate_name(new_name, self.__class__.__name__)
         new_path = f"{self.path}".replace(self.path.stem, new_name)
+        files = self._close_files()
         self.path.rename(new_path)
+        if self.manifest_path.is_file():
+            self.manifest_path.rename(MANIFEST_DIR / f"{new_name}.json")
+        BlobStore().rename_refs(self.name, new_name)
         self.path = TEMPLATE_DIR / f"{new_name}.nsx"
+        if isinstance(files, NSXFileMapping):
+            files.reopen(self.path)
         log.info(f"[{self.name}] Renamed")
 
     @classmethod
@@ -209,6 +396,9 @@ class Template:
         as_addon_for="",
         ignore_exts=set(),
         ignore_dirs=set(),
+        use_ignore_files=False,
+        jobs=1,
+        incremental=False,
     ):
         """Create a template using files from the current working
         directory.
@@ -232,6 +422,14 @@ class Template:
                 ignore. Defaults to an empty set.
             ignore_dirs (:obj:`set[str]`): A set of directories to
                 ignore. Defaults to an empty set.
+            use_ignore_files (:obj:`bool`): Whether to also ignore
+                files matched by .gitignore and .nusexignore files.
+                Defaults to False.
+            jobs (:obj:`int`): The number of files to read and process
+                at once. Defaults to 1.
+            incremental (:obj:`bool`): Whether to reuse files from the
+                existing template that have not changed since it was
+                last built. Defaults to False.
 
         Returns:
             :obj:`Template`: The newly created template.
@@ -241,6 +439,10 @@ class Template:
 
         .. versionchanged:: 1.2
             Added ``as_addon_for`` keyword argument.
+
+        .. versionchanged:: 1.4
+            Added ``use_ignore_files``, ``jobs``, and ``incremental``
+            keyword arguments.
         """
         c = cls(name, installs=installs, as_addon_for=as_addon_for)
         c.build(
@@ -248,6 +450,9 @@ class Template:
             blueprint=blueprint,
             ignore_exts=ignore_exts,
             ignore_dirs=ignore_dirs,
+            use_ignore_files=use_ignore_files,
+            jobs=jobs,
+            incremental=incremental,
         )
         return c
 
@@ -263,6 +468,9 @@ class Template:
         as_addon_for="",
         ignore_exts=set(),
         ignore_dirs=set(),
+        use_ignore_files=False,
+        jobs=1,
+        incremental=False,
     ):
         """Create a template using files from a specific directory.
 
@@ -287,6 +495,14 @@ class Template:
                 ignore. Defaults to an empty set.
             ignore_dirs (:obj:`set[str]`): A set of directories to
                 ignore. Defaults to an empty set.
+            use_ignore_files (:obj:`bool`): Whether to also ignore
+                files matched by .gitignore and .nusexignore files.
+                Defaults to False.
+            jobs (:obj:`int`): The number of files to read and process
+                at once. Defaults to 1.
+            incremental (:obj:`bool`): Whether to reuse files from the
+                existing template that have not changed since it was
+                last built. Defaults to False.
 
         Returns:
             :obj:`Template`: The newly created template.
@@ -296,6 +512,10 @@ class Template:
 
         .. versionchanged:: 1.2
             Added ``as_addon_for`` keyword argument.
+
+        .. versionchanged:: 1.4
+            Added ``use_ignore_files``, ``jobs``, and ``incremental``
+            keyword arguments.
         """
         c = cls(name, installs=installs, as_addon_for=as_addon_for)
         c.build(
@@ -304,6 +524,9 @@ class Template:
             blueprint=blueprint,
             ignore_exts=ignore_exts,
             ignore_dirs=ignore_dirs,
+            use_ignore_files=use_ignore_files,
+            jobs=jobs,
+            incremental=incremental,
         )
         return c
 
@@ -319,6 +542,9 @@ class Template:
         as_addon_for="",
         ignore_exts=set(),
         ignore_dirs=set(),
+        use_ignore_files=False,
+        jobs=1,
+        incremental=False,
     ):
         """Create a template using files from a GitHub repository.
 
@@ -342,6 +568,14 @@ class Template:
                 ignore. Defaults to an empty set.
             ignore_dirs (:obj:`set[str]`): A set of directories to
                 ignore. Defaults to an empty set.
+            use_ignore_files (:obj:`bool`): Whether to also ignore
+                files matched by .gitignore and .nusexignore files.
+                Defaults to False.
+            jobs (:obj:`int`): The number of files to read and process
+                at once. Defaults to 1.
+            incremental (:obj:`bool`): Whether to reuse files from the
+                existing template that have not changed since it was
+                last built. Defaults to False.
 
         Returns:
             :obj:`Template`: The newly created template.
@@ -354,6 +588,10 @@ class Template:
 
         .. versionchanged:: 1.2
             Added ``as_addon_for`` keyword argument.
+
+        .. versionchanged:: 1.4
+            Added ``use_ignore_files``, ``jobs``, and ``incremental``
+            keyword arguments.
         """
         os.makedirs(TEMP_DIR, exist_ok=True)
         os.chdir(TEMP_DIR)
@@ -378,10 +616,18 @@ class Template:
             as_addon_for=as_addon_for,
             ignore_exts=ignore_exts,
             ignore_dirs=ignore_dirs,
+            use_ignore_files=use_ignore_files,
+            jobs=jobs,
+            incremental=incremental,
         )
 
     def get_file_listing(
-        self, root_dir, *, ignore_exts=set(), ignore_dirs=set()
+        self,
+        root_dir,
+        *,
+        ignore_exts=set(),
+        ignore_dirs=set(),
+        use_ignore_files=False,
     ):
         """Get a list of files to include in this template.
 
@@ -394,19 +640,21 @@ class Template:
                 ignore. Defaults to an empty set.
             ignore_dirs (:obj:`set[str]`): A set of directories to
                 ignore. Defaults to an empty set.
+            use_ignore_files (:obj:`bool`): Whether to also ignore
+                files matched by the .gitignore and .nusexignore files
+                in the root directory and its subdirectories. Negated
+                patterns cannot re-include files in ignored
+                directories. Defaults to False.
 
         Returns:
             :obj:`list[pathlib.Path]`: A list of filepaths.
-        """
 
-        def is_valid(path):
-            return (
-                path.is_file()
-                and all(i not in path.parts for i in true_dir_ignores)
-                and all(i[1:] not in f"{path}" for i in wild_dir_ignores)
-                and all(i != path.suffix[1:] for i in ignore_exts)
-            )
+        .. versionchanged:: 1.4
+            Ignored directories are no longer searched.
 
+        .. versionchanged:: 1.4
+            Added ``use_ignore_files`` keyword argument.
+        """
         wild_dir_ignores = set(
             filter(lambda x: x.startswith("*"), ignore_dirs)
         )
@@ -414,9 +662,14 @@ class Template:
         log.debug(f"[{self.name}] Ignoring exts: {ignore_exts}")
         log.debug(f"[{self.name}] Ignoring dirs (true): {true_dir_ignores}")
         log.debug(f"[{self.name}] Ignoring dirs (wild): {wild_dir_ignores}")
+        log.debug(f"[{self.name}] Using ignore files: {use_ignore_files}")
 
-        files = filter(lambda p: is_valid(p), Path(root_dir).rglob("*"))
-        return list(files)
+        return walk_files(
+            root_dir,
+            ignore_exts=ignore_exts,
+            ignore_dirs=ignore_dirs,
+            use_ignore_files=use_ignore_files,
+        )
 
     def build(
         self,
@@ -425,6 +678,8 @@ class Template:
         files=[],
         root_dir=".",
         blueprint=None,
+        jobs=1,
+        incremental=False,
         **kwargs,
     ):
         """Build this template. View the
@@ -443,16 +698,72 @@ class Template:
             blueprint (:obj:`Blueprint`): The language blueprint to use.
                 If this is None, the Python blueprint is selected.
                 Defaults to None.
+            jobs (:obj:`int`): The number of files to read and process
+                at once. Files are always written in the same order, so
+                the result does not depend on this. Defaults to 1.
+            incremental (:obj:`bool`): Whether to reuse files from the
+                existing template that have not changed since it was
+                last built. Files whose size and modification time are
+                unchanged are copied from the existing template without
+                being read; files whose contents are unchanged are
+                copied without being processed again. Defaults to
+                False.
             **kwargs (:obj:`Any`): Arguments for the
                 :obj:`get_file_listing` method.
 
+        Files are read, run through the blueprint, and written to a
+        temporary file in the template directory as they are processed,
+        so only a few files are held in memory at once. The temporary
+        file is moved into place when the template is saved. The
+        placeholders in each file are indexed as it is written, so they
+        do not need to be searched for again on deployment.
+
         .. versionchanged:: 1.1
             Added ``blueprint`` keyword argument.
+
+        .. versionchanged:: 1.4
+            Files are now streamed to disk as they are processed.
+
+        .. versionchanged:: 1.4
+            Added ``jobs`` and ``incremental`` keyword arguments.
         """
 
-        def resolve_key(path):
-            path = "/".join(f"{path.resolve()}".split(os.sep)[nparts:])
-            return path.replace(project_name, "PROJECTNAME")
+        def ingest(path):
+            # Resolving every path is slow, and only needed for symlinks
+            # and files from outside the root directory.
+            st = os.lstat(path)
+            name = f"{path}"
+            if (
+                stat.S_ISLNK(st.st_mode)
+                or not name.startswith(prefix)
+                or os.path.isabs(name[len(prefix) :])
+                or ".." in name
+            ):
+                st = os.stat(path)
+                name = f"{path.resolve()}"
+                rel_path = "/".join(name.split(os.sep)[nparts:])
+            else:
+                rel_path = name[len(prefix) :].replace(os.sep, "/")
+
+            key = rel_path.replace(project_name, "PROJECTNAME")
+            old = previous.get(key)
+
+            if old and old[1:3] == [st.st_mtime_ns, st.st_size]:
+                data, flags = reader.read_raw(key)
+                return key, data, flags, old, reader.placeholders(key)
+
+            data = path.read_bytes()
+            # Files modified around now could be modified again without
+            # their mtime changing, so their hash is always checked.
+            mtime = st.st_mtime_ns if st.st_mtime_ns < racy_after else 0
+            entry = [rel_path, mtime, st.st_size]
+            entry.append(hashlib.sha256(data).hexdigest())
+            if old and old[3] == entry[3]:
+                data, flags = reader.read_raw(key)
+                return key, data, flags, entry, reader.placeholders(key)
+
+            data = bp.process(key, data)
+            return key, data, 0, entry, _index_placeholders(data)
 
         if not project_name:
             project_name = Path(root_dir).resolve().parts[-1]
@@ -465,6 +776,7 @@ class Template:
                 root_dir,
                 ignore_exts=kwargs.pop("ignore_exts", set()),
                 ignore_dirs=kwargs.pop("ignore_dirs", set()),
+                use_ignore_files=kwargs.pop("use_ignore_files", False),
             )
 
         self.data["installs"] = self._installs
@@ -475,17 +787,88 @@ class Template:
         log.info(f"[{self.name}] As add-on for: " + self.data["as_addon_for"])
         log.info(f"[{self.name}] For language: " + self.data["language"])
         log.info(f"[{self.name}] With {len(files):,} files")
+        log.info(f"[{self.name}] Using {jobs} job(s)")
         log.debug(f"[{self.name}] With files: {files}")
 
         nparts = len(Path(root_dir).resolve().parts)
-        self.data["files"] = {resolve_key(f): f.read_bytes() for f in files}
-
+        prefix = f"{Path(root_dir)}".rstrip(os.sep) + os.sep
+        if prefix == f".{os.sep}":
+            prefix = ""
+        self.close()
+        self.data["files"] = {}
         bp = blueprint(project_name, self.data)
-        self.data = bp().data
+        self._manifest = {
+            "root": f"{Path(root_dir).resolve()}",
+            "project_name": project_name,
+            "blueprint": f"{blueprint.__module__}.{blueprint.__qualname__}",
+            "files": {},
+        }
 
+        racy_after = (dt.datetime.now().timestamp() - 2) * 1e9
+
+        # Files can only be reused if they were built the same way.
+        reader, previous = None, {}
+        manifest = self._read_manifest() if incremental else None
+        if manifest and self.exists:
+            if all(
+                manifest.get(k) == v
+                for k, v in self._manifest.items()
+                if k != "files"
+            ):
+                reader = NSXReader(self.path)
+                previous = {
+                    k: v
+                    for k, v in manifest["files"].items()
+                    if k in reader.entries
+                }
+
+        os.makedirs(TEMPLATE_DIR, exist_ok=True)
+        self._build_file = TEMPLATE_DIR / f".{self.name}.{os.getpid()}.build"
+        # Builds that are never saved are cleaned up when the template
+        # is garbage collected, or at the latest when nusex exits.
+        self._build_cleanup = weakref.finalize(
+            self, _remove_quietly, self._build_file
+        )
+        try:
+            with NSXWriter(
+                self._build_file,
+                as_addon_for=self.data["as_addon_for"],
+                language=self.data["language"],
+                installs=self.data["installs"],
+            ) as w:
+                for key, data, flags, entry, placeholders in _ordered_map(
+                    ingest, files, jobs
+                ):
+                    w.add(key, data, flags, placeholders=placeholders)
+                    self._manifest["files"][key] = entry
+        except BaseException:
+            self._discard_build()
+            self._manifest = None
+            raise
+        finally:
+            if reader:
+                reader.close()
+
+        self.data["files"] = NSXFileMapping(self._build_file)
+
+        if previous:
+            reused = sum(
+                previous.get(k) == v
+                for k, v in self._manifest["files"].items()
+            )
+            log.info(f"[{self.name}] Reused {reused:,} unchanged files")
         log.info(f"[{self.name}] Build successful")
 
-    def deploy(self, *, project_name=None, destination="."):
+    def deploy(
+        self,
+        *,
+        project_name=None,
+        destination=".",
+        jobs=1,
+        atomic=True,
+        fsync=False,
+        profile=None,
+    ):
         """Deploy this template.
 
         Keyword Args:
@@ -494,9 +877,31 @@ class Template:
                 name of the parent directory is used. Defaults to None.
             destination (:obj:`str`): The path to deploy this template
                 to. Defaults to the current directory.
+            jobs (:obj:`int`): The number of files to write at once.
+                Defaults to 1.
+            atomic (:obj:`bool`): Whether to write files to a staging
+                directory first, and only move them into place once
+                they have all been written. If moving them fails, the
+                destination is restored to how it was. Defaults to
+                True.
+            fsync (:obj:`bool`): Whether to flush files to disk before
+                moving them into place, so a deployment that succeeds
+                survives a crash. This only has an effect if ``atomic``
+                is True. Defaults to False.
+            profile (:obj:`Profile` | :obj:`dict[str, str]`): The
+                profile to deploy with. If this is None, the currently
+                selected profile is used. Defaults to None.
 
         .. versionchanged:: 1.1
             Added ``project_name`` keyword argument.
+
+        .. versionchanged:: 1.4
+            Placeholders are no longer searched for in files indexed
+            when the template was built.
+
+        .. versionchanged:: 1.4
+            Added ``jobs``, ``atomic``, ``fsync``, and ``profile``
+            keyword arguments.
         """
 
         def resolve_version(key):
@@ -505,28 +910,18 @@ class Template:
 
             return key
 
-        def resolve_license_info(key):
-            with open(LICENSE_DIR / f"{key}.txt", encoding="utf-8") as f:
-                lines = f.read().split("\n")
-
-            start = [i for i, line in enumerate(lines) if line == "---"][
-                -1
-            ] + 2
-
-            return (
-                lines[1][7:].replace('"', "'"),
-                "\n".join(lines[start:])
-                .replace("[year]", f"{dt.date.today().year}")
-                .replace("[fullname]", profile["author_name"]),
-            )
-
         if not project_name:
             project_name = Path(destination).resolve().parts[-1]
         project_slug = project_name.lower().replace(" ", "_").replace("-", "_")
         project_error = project_name.replace("_", " ").title().replace(" ", "")
 
-        profile = Profile.current()
-        lic_name, lic_body = resolve_license_info(profile["preferred_license"])
+        if profile is None:
+            profile = Profile.current()
+        lic_name, lic_body = LicenseIndex.default().render(
+            profile["preferred_license"],
+            year=dt.date.today().year,
+            author=profile["author_name"],
+        )
 
         var_mapping = {
             b"PROJECTNAME": project_name,
@@ -545,27 +940,86 @@ class Template:
         log.info(f"[{self.name}] Using project slug: {project_slug}")
         log.debug(f"[{self.name}] Using var mapping: {var_mapping}")
 
-        for name, data in self.data["files"].items():
-            name = name.replace("PROJECTNAME", project_slug)
-
-            dirs = name.split("/")[:-1]
-            if dirs:
-                os.makedirs(f"{destination}/" + "/".join(dirs), exist_ok=True)
-
-            for k, v in var_mapping.items():
-                data = data.replace(k, v.encode())
-
-            with open(f"{destination}/{name}", "wb") as f:
-                f.write(data)
+        substituter = Substituter(var_mapping)
+        files = self.data["files"]
+        mapped = isinstance(files, NSXFileMapping)
+
+        def write(target):
+            key, path = target
+            placeholders = files.placeholders(key) if mapped else None
+
+            # Files without placeholders are copied as they are, by the
+            # kernel where possible.
+            if placeholders == []:
+                files.extract(key, path)
+                return
+
+            # Compressed files are decompressed as they are written.
+            if mapped:
+                chunks = files.iter_chunks(key)
+            else:
+                chunks = (files[key],)
+
+            # Indexed files have their values spliced in at known
+            # offsets; others must be searched.
+            if placeholders is None:
+                chunks = substituter.sub_stream(chunks)
+            else:
+                chunks = substituter.splice(
+                    chunks, ((i, PLACEHOLDERS[p]) for i, p in placeholders)
+                )
+
+            with open(path, "wb") as f:
+                for data in chunks:
+                    f.write(data)
+
+        names = {k: k.replace("PROJECTNAME", project_slug) for k in files}
+
+        # Every directory is created once, parents first, before any
+        # files are written.
+        dirs = set()
+        for name in names.values():
+            parts = name.split("/")[:-1]
+            dirs.update("/".join(parts[: i + 1]) for i in range(len(parts)))
+        dirs = sorted(dirs, key=lambda d: d.count("/"))
+
+        os.makedirs(destination, exist_ok=True)
+        stage = StagingArea(destination) if atomic else None
+        root = stage.path if stage else f"{destination}"
+        targets = [(k, f"{root}/{v}") for k, v in names.items()]
+
+        try:
+            for d in dirs:
+                try:
+                    os.mkdir(f"{root}/{d}")
+                except FileExistsError:
+                    if not os.path.isdir(f"{root}/{d}"):
+                        raise
+
+            log.info(f"[{self.name}] Using {jobs} job(s)")
+            for _ in _ordered_map(write, targets, jobs):
+                ...
 
-        meta = {
-            "template": self.name,
-            "files": list(self.data["files"].keys()),
-            "language": self.data["language"],
-        }
-        if not self.data["as_addon_for"]:
-            with open(f"{destination}/.nusexmeta", "w") as f:
-                json.dump(meta, f)
+            meta = {
+                "template": self.name,
+                "files": list(self.data["files"].keys()),
+                "language": self.data["language"],
+            }
+            staged = list(names.values())
+            if not self.data["as_addon_for"]:
+                with open(f"{root}/.nusexmeta", "w") as f:
+                    json.dump(meta, f)
+                staged.append(".nusexmeta")
+
+            if stage:
+                if fsync:
+                    for _ in _ordered_map(stage.fsync, staged + dirs, jobs):
+                        ...
+                log.info(f"[{self.name}] Moving files into place...")
+                stage.commit(fsync=fsync)
+        finally:
+            if stage:
+                stage.discard()
 
         log.info(f"[{self.name}] Deployment successful")
 
@@ -603,19 +1057,49 @@ class Template:
             manifest. The keys are always file names, and the values are
             tuples of the line numbers and line values that have been
             changed. This may not always be present.
+
+        .. versionchanged:: 1.4
+            Files are no longer read if they were indexed as having no
+            placeholders when the template was built.
         """
         manifest = {}
+        files = self.data["files"]
+        mapped = isinstance(files, NSXFileMapping)
 
-        for file, data in self.data["files"].items():
+        for file in files:
             manifest.update({file: []})
+            # Files indexed without placeholders need not be read.
+            placeholders = files.placeholders(file) if mapped else None
+            if placeholders == []:
+                continue
 
+            data = files[file]
             try:
-                for i, line in enumerate(data.decode().split("\n")):
-                    if any(a in line for a in ATTRS):
-                        manifest[file].append((i + 1, line))
+                text = data.decode()
             except UnicodeDecodeError:
                 # If it errors here, no modifications could have been
                 # made.
-                ...
+                continue
+
+            if placeholders is None:
+                for i, line in enumerate(text.split("\n")):
+                    if any(a in line for a in ATTRS):
+                        manifest[file].append((i + 1, line))
+                continue
+
+            # Otherwise, only the lines containing placeholders are
+            # found, by their offsets.
+            lineno, pos, end = 1, 0, -1
+            for i, _ in placeholders:
+                if i < end:
+                    # This is on the same line as the last one.
+                    continue
+                start = data.rfind(b"\n", 0, i) + 1
+                end = data.find(b"\n", i)
+                if end == -1:
+                    end = len(data)
+                lineno += data.count(b"\n", pos, start)
+                pos = start
+                manifest[file].append((lineno, data[start:end].decode()))
 
         return manifest
@@ -26,4 +26,33 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from .downloader import Downloader
+from nusex.lazy import attach
+
+from .licenses import LicenseIndex
+from .placeholders import Substituter
+from .staging import StagingArea
+from .walker import walk_files
+from .wildmatch import IgnoreRules
+
+__all__ = (
+    "Downloader",
+    "IgnoreRules",
+    "LicenseIndex",
+    "StagingArea",
+    "Substituter",
+    "downloader",
+    "export_bundle",
+    "import_bundle",
+    "walk_files",
+)
+
+# The downloader and bundles pull in urllib and zipfile, which are slow
+# to import and rarely needed.
+__getattr__, __dir__ = attach(
+    __name__,
+    {
+        "Downloader": ".downloader",
+        "export_bundle": ".bundles",
+        "import_bundle": ".bundles",
+    },
+)
@@ -0,0 +1,307 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import datetime as dt
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+
+from nusex import CONFIG_DIR, __version__
+from nusex.errors import DownloadError, UnsupportedFile
+from nusex.spec.blobs import DIGEST_PATTERN, BlobStore
+from nusex.spec.nsx import NSXReader
+
+ASSET_TYPES = {"templates": ".nsx", "licenses": ".txt"}
+BUNDLE_FORMAT = 2
+MANIFEST_NAME = "manifest.json"
+# The size of the chunks bundles are copied in.
+CHUNK_SIZE = 1 << 20
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        ...
+
+
+def _asset_type(name):
+    # The type of asset a bundle member is, or None if the name is not
+    # a plain file in one of the asset directories. This keeps members
+    # from being written anywhere else.
+    parts = name.split("/")
+    if len(parts) != 2 or parts[0] not in ASSET_TYPES:
+        return None
+    base = parts[1]
+    if (
+        not base.endswith(ASSET_TYPES[parts[0]])
+        or base.startswith(".")
+        or "\\" in base
+    ):
+        return None
+    return parts[0]
+
+
+def _blob_digest(name):
+    # The digest of a blob bundle member, or None if the name is not a
+    # blob. Blobs are named by their digest, so nothing else is valid.
+    if name.startswith("blobs/") and DIGEST_PATTERN.fullmatch(name[6:]):
+        return name[6:]
+    return None
+
+
+def _blob_refs(path):
+    # Deduplicated templates only reference the data in their blobs, so
+    # the blobs need bundling too. Anything that cannot be read as an
+    # NSX file references none.
+    try:
+        with NSXReader(path) as reader:
+            return reader.blob_digests()
+    except UnsupportedFile:
+        return set()
+
+
+def _extract(zf, info, path, expected):
+    # Stream a member to a temporary file next to its destination, and
+    # only move it into place if it matches its hash.
+    tmp = f"{path}.tmp"
+    digest = hashlib.sha256()
+    try:
+        with zf.open(info) as src, open(tmp, "wb") as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+    except zipfile.BadZipFile:
+        _remove_quietly(tmp)
+        raise UnsupportedFile(
+            f"Bundle is corrupt ({info.filename} is damaged)"
+        ) from None
+    except BaseException:
+        _remove_quietly(tmp)
+        raise
+
+    if digest.hexdigest() != expected:
+        _remove_quietly(tmp)
+        raise UnsupportedFile(
+            f"Bundle is corrupt ({info.filename} does not match its hash)"
+        )
+
+    os.replace(tmp, path)
+
+
+def export_bundle(path, *, directory=CONFIG_DIR):
+    """Pack all downloaded templates and licenses into a bundle, which
+    can be imported on machines without internet access using
+    :obj:`import_bundle`.
+
+    A bundle is a ZIP file holding the assets, the blobs any
+    deduplicated templates reference, and a manifest of their SHA-256
+    hashes.
+
+    Args:
+        path (:obj:`str` | :obj:`os.PathLike`): Where to save the
+            bundle.
+
+    Keyword Args:
+        directory (:obj:`str` | :obj:`os.PathLike`): The directory the
+            assets are in. Defaults to nusex's config directory.
+
+    Returns:
+        :obj:`int`: The number of assets exported.
+
+    .. versionadded:: 1.4
+    """
+    files, refs = {}, {}
+    tmp = f"{path}.tmp"
+
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+        for of_type, suffix in ASSET_TYPES.items():
+            try:
+                names = sorted(os.listdir(f"{directory}/{of_type}"))
+            except FileNotFoundError:
+                continue
+
+            for name in names:
+                member = f"{of_type}/{name}"
+                if not _asset_type(member):
+                    continue
+
+                with open(f"{directory}/{member}", "rb") as f:
+                    data = f.read()
+                zf.writestr(member, data)
+                files[member] = hashlib.sha256(data).hexdigest()
+
+                if of_type == "templates":
+                    digests = _blob_refs(f"{directory}/{member}")
+                    if digests:
+                        refs[name[: -len(suffix)]] = sorted(digests)
+
+        # Blobs are stored under their digest, which is also their hash.
+        blobs = BlobStore(Path(directory) / "blobs")
+        for digest in sorted(set().union(*refs.values())):
+            zf.write(blobs.path_for(digest), f"blobs/{digest}")
+            files[f"blobs/{digest}"] = digest
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "nusex": __version__,
+            "created": dt.date.today().isoformat(),
+            "files": files,
+            "refs": refs,
+        }
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+
+    os.replace(tmp, path)
+    return len(files) - len(set().union(*refs.values()))
+
+
+def _open_source(source, timeout):
+    # ZIP files are read from the end, so bundles served over HTTP are
+    # streamed into a temporary file first.
+    if not f"{source}".startswith(("http://", "https://")):
+        return open(source, "rb")
+
+    from urllib import request
+
+    f = tempfile.TemporaryFile()
+    try:
+        with request.urlopen(f"{source}", timeout=timeout) as r:
+            shutil.copyfileobj(r, f, CHUNK_SIZE)
+    except OSError as exc:
+        f.close()
+        raise DownloadError(
+            f"Bundle download failed ({getattr(exc, 'reason', exc)})"
+        ) from None
+
+    f.seek(0)
+    return f
+
+
+def import_bundle(source, *, directory=CONFIG_DIR, timeout=10):
+    """Unpack a bundle made with :obj:`export_bundle`. Every asset is
+    checked against the bundle's manifest as it is extracted, and only
+    moved into place if it matches. Blobs are added to the blob store,
+    and the templates that reference them are recorded.
+
+    Args:
+        source (:obj:`str` | :obj:`os.PathLike`): The path to the
+            bundle, or an HTTP(S) URL to download it from.
+
+    Keyword Args:
+        directory (:obj:`str` | :obj:`os.PathLike`): The directory to
+            unpack assets into. Defaults to nusex's config directory.
+        timeout (:obj:`float`): How long to wait on the server if
+            downloading the bundle (in seconds). Defaults to 10.
+
+    Returns:
+        :obj:`dict[str, int]`: The number of assets imported of each
+        type.
+
+    Raises:
+        :obj:`UnsupportedFile`: The bundle is invalid or corrupt.
+        :obj:`DownloadError`: The bundle could not be downloaded.
+
+    .. versionadded:: 1.4
+    """
+    counts = dict.fromkeys(ASSET_TYPES, 0)
+
+    with _open_source(source, timeout) as f:
+        try:
+            zf = zipfile.ZipFile(f)
+        except zipfile.BadZipFile:
+            raise UnsupportedFile("Not a valid bundle") from None
+
+        with zf:
+            try:
+                manifest = json.loads(zf.read(MANIFEST_NAME))
+                files = manifest["files"]
+                # Bundles made before blobs were bundled have no refs.
+                refs = manifest.get("refs", {})
+                if not 1 <= manifest["format"] <= BUNDLE_FORMAT:
+                    raise ValueError
+                for digests in refs.values():
+                    if not all(f"blobs/{d}" in files for d in digests):
+                        raise ValueError
+            except (AttributeError, KeyError, TypeError, ValueError):
+                raise UnsupportedFile("Not a valid bundle") from None
+
+            for of_type in ASSET_TYPES:
+                os.makedirs(f"{directory}/{of_type}", exist_ok=True)
+            blobs = BlobStore(Path(directory) / "blobs")
+            templates, stored = [], 0
+
+            # Members are read in the order they are stored, and each
+            # is streamed straight to disk.
+            for info in zf.infolist():
+                if info.filename not in files:
+                    continue
+
+                digest = _blob_digest(info.filename)
+                if digest:
+                    if files[info.filename] != digest:
+                        raise UnsupportedFile(
+                            f"Bundle is corrupt ({info.filename} does not "
+                            "match its hash)"
+                        )
+                    path = blobs.path_for(digest)
+                    os.makedirs(path.parent, exist_ok=True)
+                    _extract(zf, info, path, digest)
+                    stored += 1
+                    continue
+
+                of_type = _asset_type(info.filename)
+                if not of_type:
+                    continue
+
+                _extract(
+                    zf,
+                    info,
+                    f"{directory}/{info.filename}",
+                    files[info.filename],
+                )
+                counts[of_type] += 1
+                if of_type == "templates":
+                    templates.append(Path(info.filename).stem)
+
+    expected = sum(bool(_asset_type(f) or _blob_digest(f)) for f in files)
+    if sum(counts.values()) + stored != expected:
+        raise UnsupportedFile("Bundle is corrupt (some assets are missing)")
+
+    # Imported templates replace any existing ones, so their old
+    # references are replaced too.
+    for name in templates:
+        blobs.set_refs(name, set(refs.get(name, ())))
+
+    return counts
@@ -26,11 +26,19 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import asyncio
+import hashlib
+import http.client
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from urllib import request
 from urllib.error import HTTPError
+from urllib.parse import urljoin
 
-from nusex import CONFIG_DIR
+from nusex import CONFIG_DIR, MANIFEST_DIR
 from nusex.errors import DownloadError
 from nusex.helpers import cprint
 
@@ -40,29 +48,147 @@ TEMPLATE_SUFFIX = "tree/main/templates1x"
 LICENSE_URL = (
     "https://github.com/github/choosealicense.com/tree/gh-pages/_licenses"
 )
+# Asset indexes are looked for here unless a mirror is given, either
+# explicitly or through the NUSEX_MIRROR environment variable.
+MIRROR_URL = f"{RAW_URL}/nusex/downloads/main/index"
+INDEX_FORMAT = 1
+# The delay before the first retry (in seconds). This doubles with each
+# subsequent retry.
+RETRY_BACKOFF = 0.5
+# The size of the chunks downloads are streamed in.
+CHUNK_SIZE = 1 << 16
+# The manifest entry for a file that has only been partly downloaded.
+PENDING_ENTRY = {"etag": None, "last_modified": None, "sha256": None}
+
+log = logging.getLogger(__name__)
+
+
+def _is_transient(exc):
+    # Server errors and rate limits are worth retrying; other HTTP
+    # errors will not go away by themselves. Connection errors,
+    # timeouts, and responses cut short are all worth retrying.
+    if isinstance(exc, HTTPError):
+        return exc.code >= 500 or exc.code == 429
+    if isinstance(exc, http.client.HTTPException):
+        return True
+    # Missing local files will not appear either.
+    return not isinstance(getattr(exc, "reason", None), FileNotFoundError)
+
+
+def _hash_file(path, digest):
+    # Feed a file into a hash in chunks, returning the file's size.
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return size
+            digest.update(chunk)
+            size += len(chunk)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        ...
+
+
+def _to_url(location):
+    # Mirrors can be local directories as well as URLs.
+    if "://" in f"{location}":
+        return f"{location}".rstrip("/")
+    return Path(location).resolve().as_uri()
+
+
+def _describe(exc):
+    if isinstance(exc, HTTPError):
+        return f"GitHub returned {exc.code}"
+    return f"{getattr(exc, 'reason', exc)}"
 
 
 class Downloader:
     """A utility class for downloading assets.
 
+    Files are downloaded concurrently by a pool of worker threads.
+    Requests that time out, fail to connect, or receive a server error
+    are retried with exponential backoff.
+
+    The files to download are listed in an asset index: a small JSON
+    file giving the name, URL, size, SHA-256 hash, and version of each
+    asset. Indexes are read from ``<mirror>/<of_type>.json``, where the
+    mirror is any static host or local directory; asset URLs are
+    relative to the index. Downloads are checked against the index, and
+    files which already match it locally are not requested at all. If
+    the default index cannot be fetched, the asset repositories on
+    GitHub are scraped instead.
+
+    The ETag, Last-Modified date, and SHA-256 hash of every downloaded
+    file are recorded in a manifest. Files which are still intact
+    locally are requested conditionally, and are only rewritten if
+    they have changed.
+
     Args:
         of_type(str): The type of asset to download (must be either
             "templates" or "licenses").
 
+    Keyword Args:
+        jobs (int): The number of files to download at once. Defaults
+            to 8.
+        timeout (float): How long to wait on each request before giving
+            up (in seconds). Defaults to 10.
+        retries (int): How many times to retry each request before
+            giving up. Defaults to 3.
+        mirror (str | os.PathLike | None): The URL or directory to read
+            asset indexes from. Defaults to the NUSEX_MIRROR
+            environment variable if set, or :obj:`MIRROR_URL` if not.
+
     Attributes:
         of_type(str): The type of asset to download (must be either
             "templates" or "licenses").
         extension (str): The file extension of the files to search for.
         url (str): The repo to search for files in.
+        directory (pathlib.Path): The directory to download files to.
         files (list[str]): A series of file URLs.
+        index (dict[str, dict]): The asset index entry for each file,
+            if the files were fetched from an index.
         completed (int): The number of files that have been downloaded.
+        unchanged (int): The number of files that did not need to be
+            rewritten.
+        jobs (int): The number of files to download at once.
+        timeout (float): How long to wait on each request before giving
+            up (in seconds).
+        retries (int): How many times to retry each request before
+            giving up.
+        mirror (str | None): The URL to read asset indexes from, if one
+            was given.
+
+    .. versionchanged:: 1.4
+        Files are now downloaded concurrently, and only when they have
+        changed. Files are now listed by an asset index. Added
+        ``jobs``, ``timeout``, ``retries``, and ``mirror`` keyword
+        arguments.
     """
 
-    __slots__ = ("of_type", "extension", "url", "files", "completed")
+    __slots__ = (
+        "of_type",
+        "extension",
+        "url",
+        "directory",
+        "files",
+        "index",
+        "completed",
+        "unchanged",
+        "jobs",
+        "timeout",
+        "retries",
+        "mirror",
+        "_partial",
+    )
 
-    def __init__(self, of_type):
+    def __init__(self, of_type, *, jobs=8, timeout=10, retries=3, mirror=None):
         if of_type not in ("templates", "licenses"):
-            return DownloadError("You can only download templates or licenses")
+            raise DownloadError("You can only download templates or licenses")
 
         self.of_type = of_type
         if of_type == "templates":
@@ -71,8 +197,17 @@ class Downloader:
         else:
             self.extension = "txt"
             self.url = LICENSE_URL
+        self.directory = CONFIG_DIR / of_type
         self.files = []
+        self.index = {}
         self.completed = 0
+        self.unchanged = 0
+        self.jobs = max(jobs, 1)
+        self.timeout = timeout
+        self.retries = retries
+        mirror = mirror or os.environ.get("NUSEX_MIRROR")
+        self.mirror = _to_url(mirror) if mirror else None
+        self._partial = {}
 
     @property
     def progress(self):
@@ -81,23 +216,195 @@ class Downloader:
         Returns:
             float
         """
+        if not self.files:
+            return 100.0
         return (100 / len(self.files)) * self.completed
 
+    @property
+    def manifest_path(self):
+        """The path to the download manifest for this type of asset.
+
+        Returns:
+            pathlib.Path
+
+        .. versionadded:: 1.4
+        """
+        return MANIFEST_DIR / "downloads" / f"{self.of_type}.json"
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.manifest_path.parent, exist_ok=True)
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(manifest))
+        os.replace(tmp, self.manifest_path)
+
+    def _retry(self, action, func, *args):
+        # Call func, retrying transient failures. Returns None if the
+        # server says nothing has been modified.
+        for attempt in range(self.retries + 1):
+            try:
+                return func(*args)
+            except (OSError, http.client.HTTPException) as exc:
+                # HTTPError, URLError, and timeouts all end up here.
+                if isinstance(exc, HTTPError) and exc.code == 304:
+                    return None
+                if attempt == self.retries or not _is_transient(exc):
+                    raise DownloadError(
+                        f"{action} failed ({_describe(exc)})"
+                    ) from None
+
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    def _urlopen(self, url, action, headers=None):
+        # Read a whole response. This is only used for small files.
+        def read():
+            req = request.Request(url, headers=headers or {})
+            with request.urlopen(req, timeout=self.timeout) as r:
+                return r.read(), r.headers
+
+        return self._retry(action, read)
+
+    def _stream(self, url, headers, part, asset, validator):
+        # Stream a response into a partial file, returning the
+        # response's headers and the hash of the whole file. If the
+        # index says what the file should be, whatever is already in
+        # the partial file is kept, and only the rest is requested.
+        # The validator holds the ETag of the response the partial file
+        # was started from.
+        digest = hashlib.sha256()
+        offset = 0
+        base, headers = headers, dict(headers)
+
+        if asset:
+            try:
+                offset = _hash_file(part, digest)
+            except FileNotFoundError:
+                ...
+            if 0 < offset < asset["size"]:
+                headers["Range"] = f"bytes={offset}-"
+                # Servers send the whole file instead if it has changed
+                # since the partial file was started.
+                if validator["etag"]:
+                    headers["If-Range"] = validator["etag"]
+            elif (
+                offset == asset["size"]
+                and digest.hexdigest() == asset["sha256"]
+            ):
+                # An earlier download finished, but was never moved
+                # into place.
+                return {}, digest.hexdigest(), offset
+            else:
+                digest = hashlib.sha256()
+                offset = 0
+
+        req = request.Request(url, headers=headers)
+        with request.urlopen(req, timeout=self.timeout) as r:
+            if offset and not r.headers.get("Content-Range", "").startswith(
+                f"bytes {offset}-"
+            ):
+                # The server sent the whole file instead.
+                digest = hashlib.sha256()
+                offset = 0
+
+            resumed = offset > 0
+            if not resumed:
+                validator["etag"] = r.headers.get("ETag")
+
+            with open(part, "ab" if offset else "wb") as f:
+                while True:
+                    chunk = r.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    offset += len(chunk)
+                    if asset and offset > asset["size"]:
+                        break
+
+            # Responses cut short do not raise errors by themselves.
+            missing = getattr(r, "length", None)
+            if not missing and asset and offset < asset["size"]:
+                missing = asset["size"] - offset
+            if missing:
+                raise http.client.IncompleteRead(b"", missing)
+
+        if resumed and (
+            offset != asset["size"] or digest.hexdigest() != asset["sha256"]
+        ):
+            # The partial file was started from a different version of
+            # the file, so it is thrown away and the file downloaded
+            # again in full.
+            log.info(f"Discarding stale partial file {part}")
+            _remove_quietly(part)
+            validator["etag"] = None
+            return self._stream(url, base, part, asset, validator)
+
+        return r.headers, digest.hexdigest(), offset
+
     def fetch(self):
         """Fetch the files to download.
 
         Raises:
             DownloadError: There was a problem fetching the files.
+
+        .. versionchanged:: 1.4
+            Files are now fetched from an asset index.
         """
         self.files = []
+        self.index = {}
 
         try:
-            with request.urlopen(self.url) as r:
-                data = r.readlines()
-        except HTTPError as exc:
-            raise DownloadError(
-                f"Fetch failed (GitHub returned {exc.code})"
-            ) from None
+            self._fetch_index()
+        except DownloadError as exc:
+            # Only fall back to scraping GitHub if no mirror was asked
+            # for.
+            if self.mirror:
+                raise
+            log.info(f"Asset index unavailable ({exc}); scraping instead")
+            self._scrape()
+
+    def _fetch_index(self):
+        url = f"{self.mirror or MIRROR_URL}/{self.of_type}.json"
+        data = self._urlopen(url, "Fetch")[0]
+
+        try:
+            index = json.loads(data)
+            if index["format"] != INDEX_FORMAT:
+                raise ValueError
+
+            files, entries = [], {}
+            for asset in index["assets"]:
+                entry = {
+                    "name": asset["name"],
+                    "size": int(asset["size"]),
+                    "sha256": asset["sha256"],
+                    "version": asset.get("version"),
+                }
+                name = entry["name"]
+                if (
+                    not name.endswith(f".{self.extension}")
+                    or name.startswith(".")
+                    or "/" in name
+                    or "\\" in name
+                ):
+                    raise ValueError
+                file = urljoin(url, asset["url"])
+                files.append(file)
+                entries[file] = entry
+        except (KeyError, TypeError, ValueError):
+            raise DownloadError("Fetch failed (invalid asset index)") from None
+
+        self.files, self.index = files, entries
+
+    def _scrape(self):
+        data = self._urlopen(self.url, "Fetch")[0].splitlines()
 
         for i, line in enumerate(data):
             if b'role="rowheader"' in line:
@@ -105,33 +412,80 @@ class Downloader:
                 if path.endswith(f".{self.extension.lstrip('.')}"):
                     self.files.append("".join(path.split("blob/")))
 
-    async def _download_files(self):
+    def _download_file(self, file, entry):
+        # Returns the file's new manifest entry, and whether it was
+        # left as it was.
+        asset = self.index.get(file)
+        name = asset["name"] if asset else file.split("/")[-1]
+        path = self.directory / name
         try:
-            for f in self.files:
-                with request.urlopen(f"{RAW_URL}/{f}") as r:
-                    with open(
-                        (CONFIG_DIR / self.of_type) / f.split("/")[-1], "wb"
-                    ) as f:
-                        f.write(r.read())
-                        self.completed += 1
+            digest = hashlib.sha256()
+            _hash_file(path, digest)
+            digest = digest.hexdigest()
+        except FileNotFoundError:
+            digest = None
 
-                await asyncio.sleep(0)
+        # The index says what the file should be, so there is no need
+        # to ask if it already is.
+        if asset and asset["sha256"] == digest:
+            if not entry or entry["sha256"] != digest:
+                entry = {"etag": None, "last_modified": None, "sha256": digest}
+            return entry, True
 
-        except HTTPError as exc:
-            raise DownloadError(
-                f"Download failed (GitHub returned {exc.code})"
-            ) from None
+        # Only ask whether the file has changed if the local copy is
+        # the one the manifest describes.
+        headers = {}
+        if entry and entry["sha256"] == digest:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
 
-    async def _display_progress(self):
-        while True:
-            cprint(
-                "prc",
-                f"Downloading {self.of_type}... {self.progress:,.0f}%",
-                end="\r",
+        # Files are streamed to a partial file, and only moved into
+        # place once complete and verified. Partial files of indexed
+        # assets are kept if the download fails, so it can be resumed.
+        url = file if "://" in file else f"{RAW_URL}/{file}"
+        part = self.directory / f"{name}.part"
+        validator = {"etag": entry.get("part_etag") if entry else None}
+        try:
+            resp = self._retry(
+                "Download", self._stream, url, headers, part, asset, validator
+            )
+        except BaseException:
+            if not asset:
+                _remove_quietly(part)
+            elif validator["etag"]:
+                self._partial[file] = validator["etag"]
+            raise
+
+        if resp is None:
+            _remove_quietly(part)
+            return entry, True
+
+        info, new_digest, size = resp
+        entry = {
+            "etag": info.get("ETag"),
+            "last_modified": info.get("Last-Modified"),
+            "sha256": new_digest,
+        }
+        if asset and (new_digest != asset["sha256"] or size != asset["size"]):
+            _remove_quietly(part)
+            raise DownloadError(
+                f"Download failed ({name} does not match the asset index)"
             )
-            if self.progress == 100:
-                return
-            await asyncio.sleep(0)
+        if new_digest == digest:
+            _remove_quietly(part)
+            return entry, True
+
+        os.replace(part, path)
+        return entry, False
+
+    def _display_progress(self):
+        cprint(
+            "prc",
+            f"Downloading {self.of_type}... {self.progress:,.0f}%",
+            end="\r",
+        )
 
     def download(self, display_progress=False):
         """Download files. The files will be fetched automatically if
@@ -142,14 +496,52 @@ class Downloader:
                 progress in the terminal. Defaults to False.
 
         Raises:
-            DownloadError: There was a problem fetching the files.
+            DownloadError: There was a problem fetching or downloading
+                the files.
         """
         if not self.files:
             self.fetch()
 
-        loop = asyncio.get_event_loop()
-        download = loop.create_task(self._download_files())
+        self.completed = 0
+        self.unchanged = 0
+        self._partial = {}
+        old = self._read_manifest()
+        manifest = {}
         if display_progress:
-            display = loop.create_task(self._display_progress())
-            display.add_done_callback(lambda x: print())
-        loop.run_until_complete(download)
+            self._display_progress()
+
+        # Progress is only updated as downloads complete, so nothing
+        # polls while waiting.
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = {
+                    executor.submit(self._download_file, f, old.get(f)): f
+                    for f in self.files
+                }
+                try:
+                    for future in as_completed(futures):
+                        entry, unchanged = future.result()
+                        manifest[futures[future]] = entry
+                        self.completed += 1
+                        self.unchanged += unchanged
+                        if display_progress:
+                            self._display_progress()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except BaseException:
+            # Keep what was learnt for next time, including where any
+            # partial files came from, so they can be resumed safely.
+            for file, etag in self._partial.items():
+                manifest[file] = {
+                    **old.get(file, PENDING_ENTRY),
+                    "part_etag": etag,
+                }
+            self._write_manifest({**old, **manifest})
+            raise
+        finally:
+            if display_progress:
+                print()
+
+        self._write_manifest(manifest)
@@ -0,0 +1,355 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import errno
+import json
+import logging
+import os
+import threading
+
+from nusex import LICENSE_DIR, LICENSE_INDEX_FILE
+
+INDEX_FORMAT = 2
+# The number of rendered licenses to keep in memory.
+RENDER_CACHE_SIZE = 64
+
+log = logging.getLogger(__name__)
+
+
+def _sanitise(text):
+    return (
+        text.replace("License", "")
+        .replace("  ", "")
+        .replace("-", " ")
+        .replace("_", " ")
+        .strip()
+    )
+
+
+def _parse(data):
+    # Pull the attributes, name, and body offset out of a license file.
+    # Attributes are the front matter up to the first blank line.
+    text = data.decode("utf-8")
+    lines = text.split("\n")
+
+    attrs = {}
+    for line in lines:
+        if line == "---":
+            continue
+        if not line:
+            break
+        k, v = line.split(": ", 1)
+        attrs[k] = v.strip().lower()
+
+    # The body starts on the line after the one following the closing
+    # front matter marker.
+    start = [i for i, line in enumerate(lines) if line == "---"][-1] + 2
+    offset = len("".join(f"{line}\n" for line in lines[:start]).encode())
+    return attrs, lines[1][7:].replace('"', "'"), min(offset, len(data))
+
+
+class LicenseIndex:
+    """A persistent index of downloaded licenses, used to resolve
+    license names without reading every license file.
+
+    The index maps each license's file stem, SPDX ID, title, and
+    nickname (and sanitised forms of them) to the license, and records
+    each license's display name and where its body starts. It is saved
+    to disk, and only rebuilt when the license directory changes, or
+    when a license that is read has been edited since it was indexed.
+    Licenses rendered for projects are cached in memory as well.
+
+    Keyword Args:
+        directory (:obj:`str` | :obj:`os.PathLike`): The directory
+            licenses are stored in. Defaults to nusex's license
+            directory.
+        path (:obj:`str` | :obj:`os.PathLike`): Where to save the
+            index. Defaults to ``licenses.json`` in nusex's config
+            directory.
+
+    Attributes:
+        directory (:obj:`str`): The directory licenses are stored in.
+        path (:obj:`str`): Where the index is saved.
+        licenses (:obj:`dict[str, dict]`): The name, body offset, and
+            file mtime and size of each license, keyed by file stem.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = (
+        "directory",
+        "path",
+        "licenses",
+        "_exact",
+        "_fuzzy",
+        "_mtime",
+        "_rendered",
+        "_lock",
+    )
+
+    _default = None
+
+    def __init__(self, *, directory=LICENSE_DIR, path=LICENSE_INDEX_FILE):
+        self.directory = f"{directory}"
+        self.path = f"{path}"
+        self.licenses = {}
+        self._exact = {}
+        self._fuzzy = {}
+        self._mtime = None
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<LicenseIndex directory={self.directory!r}>"
+
+    def __contains__(self, stem):
+        self.refresh()
+        return stem in self.licenses
+
+    @classmethod
+    def default(cls):
+        """Get the index of nusex's license directory. The same index is
+        shared by everything in the process.
+
+        Returns:
+            :obj:`LicenseIndex`
+        """
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def refresh(self):
+        """Make sure the index reflects the license directory, loading
+        or rebuilding it if necessary. This only costs a single
+        :obj:`os.stat` call if the index is already up to date. This is
+        safe to call from multiple threads.
+        """
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._mtime and self._mtime is not None:
+            return
+
+        with self._lock:
+            # Another thread may have loaded the index while this one
+            # was waiting.
+            if mtime == self._mtime and self._mtime is not None:
+                return
+
+            self._rendered = {}
+            if not self._load(mtime):
+                self._build(mtime)
+
+    def _load(self, mtime):
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+            if index["format"] != INDEX_FORMAT or index["mtime"] != mtime:
+                return False
+            self.licenses = index["licenses"]
+            self._exact = index["exact"]
+            self._fuzzy = index["fuzzy"]
+        except (FileNotFoundError, KeyError, TypeError, ValueError):
+            return False
+
+        self._mtime = mtime
+        return True
+
+    def _build(self, mtime):
+        log.info(f"Indexing licenses in {self.directory}...")
+        licenses, attrs = {}, {}
+
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            names = []
+
+        for name in names:
+            if not name.endswith(".txt"):
+                continue
+
+            stem = name[:-4]
+            with open(f"{self.directory}/{name}", "rb") as f:
+                st = os.fstat(f.fileno())
+                try:
+                    attrs[stem], lic_name, offset = _parse(f.read())
+                except (IndexError, UnicodeDecodeError, ValueError):
+                    log.warning(f"Could not index license {name!r}")
+                    continue
+            licenses[stem] = {
+                "name": lic_name,
+                "body": offset,
+                "mtime": st.st_mtime_ns,
+                "size": st.st_size,
+            }
+
+        # Keys are added in order of increasing priority, so file stems
+        # always win, then the first license alphabetically.
+        exact, fuzzy = {}, {}
+        for stem in reversed(list(licenses)):
+            nickname = attrs[stem].get("nickname", "")
+            spdx_id = attrs[stem].get("spdx-id", "")
+            title = attrs[stem].get("title", "")
+
+            for value in (spdx_id, title):
+                if value:
+                    exact[value] = stem
+            for value in map(_sanitise, (nickname, spdx_id, title)):
+                if value:
+                    fuzzy[value] = stem
+        exact.update((stem, stem) for stem in licenses)
+
+        self.licenses, self._exact, self._fuzzy = licenses, exact, fuzzy
+        self._mtime = mtime
+
+        index = {
+            "format": INDEX_FORMAT,
+            "mtime": mtime,
+            "licenses": licenses,
+            "exact": exact,
+            "fuzzy": fuzzy,
+        }
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(json.dumps(index))
+            os.replace(tmp, self.path)
+        except OSError:
+            # The index still works, it just will not be saved.
+            log.warning(f"Could not save license index to {self.path}")
+
+    def _check(self, stem, st):
+        # Editing a license in place does not change the directory's
+        # mtime, so make sure the file is the one that was indexed
+        # before trusting its body offset, and rebuild if it is not.
+        version = (st.st_mtime_ns, st.st_size)
+        info = self.licenses.get(stem)
+        if info is not None and (info["mtime"], info["size"]) == version:
+            return info
+
+        with self._lock:
+            info = self.licenses.get(stem)
+            if info is None or (info["mtime"], info["size"]) != version:
+                try:
+                    mtime = os.stat(self.directory).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                self._rendered = {}
+                self._build(mtime)
+        return self.licenses.get(stem)
+
+    def resolve(self, value):
+        """Resolve a license name to the stem of its file. Stems, SPDX
+        IDs, titles, and nicknames are all accepted, case-insensitively.
+
+        Args:
+            value (:obj:`str`): The license name to resolve.
+
+        Returns:
+            :obj:`str` | :obj:`None`: The file stem of the license, or
+            None if the name could not be resolved.
+        """
+        self.refresh()
+        value = value.lower()
+        return self._exact.get(value) or self._fuzzy.get(_sanitise(value))
+
+    def read(self, stem):
+        """Read a license's display name and body.
+
+        Args:
+            stem (:obj:`str`): The file stem of the license.
+
+        Returns:
+            :obj:`tuple[str, str]`: The license's name and body.
+
+        Raises:
+            :obj:`FileNotFoundError`: The license does not exist.
+        """
+        self.refresh()
+        path = f"{self.directory}/{stem}.txt"
+        if stem in self.licenses:
+            with open(path, "rb") as f:
+                info = self._check(stem, os.fstat(f.fileno()))
+                if info is not None:
+                    f.seek(info["body"])
+                    return info["name"], f.read().decode("utf-8")
+
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+    def render(self, stem, *, year, author):
+        """Render a license for a project, filling in the year and the
+        copyright holder. The most recently rendered licenses are
+        cached, so deploying many projects for the same author only
+        reads and renders each license once. This is safe to call from
+        multiple threads.
+
+        Args:
+            stem (:obj:`str`): The file stem of the license.
+
+        Keyword Args:
+            year (:obj:`int` | :obj:`str`): The copyright year.
+            author (:obj:`str`): The copyright holder.
+
+        Returns:
+            :obj:`tuple[bytes, bytes]`: The license's name and rendered
+            body, encoded as UTF-8.
+
+        Raises:
+            :obj:`FileNotFoundError`: The license does not exist.
+        """
+        self.refresh()
+        key = (stem, f"{year}", author)
+        try:
+            st = os.stat(f"{self.directory}/{stem}.txt")
+            version = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            version = None
+
+        # Entries are moved to the end when used, so the first is
+        # always the least recently used. Entries for licenses that
+        # have been edited since they were rendered are discarded.
+        # Deploys render from many threads at once, so the cache is
+        # only touched under the lock.
+        with self._lock:
+            cached = self._rendered.pop(key, None)
+            if cached is not None and cached[0] == version:
+                self._rendered[key] = cached
+                return cached[1]
+
+        name, body = self.read(stem)
+        body = body.replace("[year]", key[1]).replace("[fullname]", author)
+        rendered = (name.encode(), body.encode())
+
+        with self._lock:
+            self._rendered.pop(key, None)
+            while len(self._rendered) >= RENDER_CACHE_SIZE:
+                self._rendered.pop(next(iter(self._rendered)))
+            self._rendered[key] = (version, rendered)
+        return rendered
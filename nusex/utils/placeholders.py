@@ -0,0 +1,278 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Placeholders sharing a prefix at least this long are located together.
+MIN_ANCHOR = 4
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return a[:n]
+
+
+def _group(keys):
+    # Group the placeholders by a shared prefix, or "anchor". Anchors
+    # are located with bytes.find, which is far faster than scanning
+    # with a regular expression. Within a group, the candidates are
+    # indexed by the byte following the anchor, longest first.
+    groups = []
+
+    for key in sorted(keys):
+        if groups:
+            anchor = _common_prefix(groups[-1][0], key)
+            if len(anchor) >= MIN_ANCHOR:
+                groups[-1][0] = anchor
+                groups[-1][1].append(key)
+                continue
+        groups.append([key, [key]])
+
+    out = []
+    for anchor, members in groups:
+        table = {}
+        n = len(anchor)
+        for key in sorted(members, key=len, reverse=True):
+            table.setdefault(key[n : n + 1], []).append(key)
+        out.append((anchor, table))
+    return out
+
+
+class Substituter:
+    """A compiled set of placeholders and the values to replace them
+    with.
+
+    Each body is rewritten in a single pass, with no placeholder
+    replaced more than once. Where placeholders overlap, the leftmost
+    is preferred, and then the longest, so PROJECTAUTHOREMAIL is never
+    mistaken for PROJECTAUTHOR.
+
+    Args:
+        mapping (:obj:`dict[bytes, str | bytes]`): The placeholders,
+            and the values to replace them with. String values are
+            encoded as UTF-8.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = ("mapping", "_groups", "_keep")
+
+    def __init__(self, mapping):
+        self.mapping = {
+            k: v if isinstance(v, bytes) else v.encode()
+            for k, v in mapping.items()
+        }
+        self._groups = _group(self.mapping)
+        self._keep = max(map(len, self.mapping), default=1) - 1
+
+    def __repr__(self):
+        return f"<Substituter placeholders={len(self.mapping)}>"
+
+    def _matches(self, data, end):
+        # Find the offset and placeholder of each match starting
+        # before `end`.
+        find = data.find
+        startswith = data.startswith
+        found = []
+        pending = []
+
+        for anchor, table in self._groups:
+            i = find(anchor, 0, end + len(anchor) - 1)
+            if i > -1:
+                pending.append([i, anchor, table])
+
+        while len(pending) > 1:
+            pos = min(p[0] for p in pending)
+            best = b""
+
+            for i, anchor, table in pending:
+                if i != pos:
+                    continue
+                j = pos + len(anchor)
+                for key in table.get(data[j : j + 1], ()):
+                    if len(key) > len(best) and startswith(key, pos):
+                        best = key
+                        break
+                if len(anchor) > len(best) and b"" in table:
+                    best = anchor
+
+            if best:
+                found.append((pos, best))
+                resume = pos + len(best)
+            else:
+                resume = pos + 1
+
+            for p in pending:
+                if p[0] < resume:
+                    p[0] = find(p[1], resume, end + len(p[1]) - 1)
+            pending = [p for p in pending if p[0] > -1]
+
+        if pending:
+            # With only one group left, there is nothing to merge.
+            i, anchor, table = pending[0]
+            limit = end + len(anchor) - 1
+            exact = anchor if b"" in table else b""
+
+            while i > -1:
+                j = i + len(anchor)
+                for key in table.get(data[j : j + 1], ()):
+                    if startswith(key, i):
+                        break
+                else:
+                    key = exact
+
+                if key:
+                    found.append((i, key))
+                    i = find(anchor, i + len(key), limit)
+                else:
+                    i = find(anchor, i + 1, limit)
+
+        return found
+
+    def _scan(self, data, end):
+        # Replace the placeholders starting before `end`. Returns the
+        # output segments, and the offset up to which data was
+        # consumed by them.
+        mapping = self.mapping
+        out = []
+        last = 0
+
+        for pos, key in self._matches(data, end):
+            out.append(data[last:pos])
+            out.append(mapping[key])
+            last = pos + len(key)
+
+        return out, last
+
+    def find(self, data):
+        """Find every placeholder in a body.
+
+        Args:
+            data (:obj:`bytes`): The body.
+
+        Returns:
+            :obj:`list[tuple[int, bytes]]`: The offset of each
+            placeholder, and the placeholder itself, in order.
+        """
+        return self._matches(data, len(data))
+
+    def sub(self, data):
+        """Replace every placeholder in a body.
+
+        Args:
+            data (:obj:`bytes`): The body.
+
+        Returns:
+            :obj:`bytes`: The body with its placeholders replaced.
+        """
+        out, last = self._scan(data, len(data))
+        if not out:
+            return data
+
+        out.append(data[last:])
+        return b"".join(out)
+
+    def sub_stream(self, chunks):
+        """Replace every placeholder in a body provided as a stream of
+        chunks. Just enough of each chunk is held back that no
+        placeholder is split between two segments.
+
+        Args:
+            chunks (:obj:`Iterable[bytes]`): The chunks of the body.
+
+        Yields:
+            :obj:`bytes`: Segments of the body with their placeholders
+            replaced.
+        """
+        buf = b""
+
+        for chunk in chunks:
+            buf = buf + chunk if buf else chunk
+            cut = len(buf) - self._keep
+            if cut <= 0:
+                continue
+
+            # Any placeholder starting before the cut has enough of the
+            # body after it to rule out a longer one.
+            out, last = self._scan(buf, cut)
+            end = max(last, cut)
+            out.append(buf[last:end])
+            yield b"".join(out)
+            buf = buf[end:]
+
+        yield self.sub(buf)
+
+    def splice(self, chunks, matches):
+        """Replace placeholders at known offsets in a body provided as
+        a stream of chunks, such as those returned by :obj:`find`. The
+        body is not searched, so nothing is held back.
+
+        Args:
+            chunks (:obj:`Iterable[bytes]`): The chunks of the body.
+            matches (:obj:`Iterable[tuple[int, bytes]]`): The offset of
+                each placeholder, and the placeholder itself, in order.
+
+        Yields:
+            :obj:`bytes`: Segments of the body with their placeholders
+            replaced.
+        """
+        mapping = self.mapping
+        matches = iter(matches)
+        match = next(matches, None)
+        pos = 0
+        skip = 0
+
+        for chunk in chunks:
+            size = len(chunk)
+            end = pos + size
+            if match is None or match[0] >= end:
+                if skip < size:
+                    yield chunk[skip:] if skip else chunk
+                skip = max(skip - size, 0)
+                pos = end
+                continue
+
+            # Placeholders can be split between chunks, in which case
+            # the rest of one is skipped at the start of the next.
+            out = []
+            start = min(skip, size)
+            skip -= start
+            while match is not None and match[0] < end:
+                i = match[0] - pos
+                out.append(chunk[start:i])
+                out.append(mapping[match[1]])
+                start = i + len(match[1])
+                if start > size:
+                    skip, start = start - size, size
+                match = next(matches, None)
+
+            out.append(chunk[start:])
+            yield b"".join(out)
+            pos = end
@@ -0,0 +1,199 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import errno
+import logging
+import os
+import shutil
+import stat
+import tempfile
+
+log = logging.getLogger(__name__)
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StagingArea:
+    """A temporary directory in which to write a tree of files before
+    moving them into a destination directory together.
+
+    Files are moved into place with renames once every one of them has
+    been written. If anything goes wrong while they are being moved,
+    every change made to the destination is undone, so it is left as
+    it was found.
+
+    The staging directory is created inside the destination, so the
+    two are always on the same file system.
+
+    Args:
+        destination (:obj:`str` | :obj:`os.PathLike`): The directory to
+            move files into. This is created if it does not exist.
+
+    Attributes:
+        destination (:obj:`str`): The directory to move files into.
+        path (:obj:`str`): The staging directory.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = ("destination", "path")
+
+    def __init__(self, destination):
+        self.destination = f"{destination}"
+        os.makedirs(self.destination, exist_ok=True)
+        self.path = tempfile.mkdtemp(
+            prefix=".nusex-staging-", dir=self.destination
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.discard()
+
+    def __repr__(self):
+        return f"<StagingArea destination={self.destination!r}>"
+
+    def fsync(self, name):
+        """Flush a staged file or directory to disk.
+
+        Args:
+            name (:obj:`str`): The path relative to the staging
+                directory, using forward slashes.
+        """
+        _fsync_path(f"{self.path}/{name}")
+
+    def commit(self, *, fsync=False):
+        """Move everything in the staging directory into the
+        destination. Files and directories that do not already exist
+        there are moved with a single rename each, so whole trees can
+        be moved at once; existing directories are merged into, and
+        existing files replaced. Should any move fail, every change
+        made to the destination is undone before the error is raised.
+
+        Keyword Args:
+            fsync (:obj:`bool`): Whether to flush the destination's
+                directories to disk once everything has been moved, so
+                the moves survive a crash. Staged files and
+                directories should already have been flushed with
+                :obj:`fsync`. Defaults to False.
+
+        Raises:
+            :obj:`IsADirectoryError`: A staged file would replace a
+                directory.
+            :obj:`FileExistsError`: A staged directory would replace a
+                file.
+        """
+        moved = []
+        backup = None
+
+        def merge(src_dir, dst_dir):
+            nonlocal backup
+
+            with os.scandir(src_dir) as it:
+                entries = list(it)
+
+            for entry in entries:
+                src = entry.path
+                dst = f"{dst_dir}/{entry.name}"
+                try:
+                    st = os.lstat(dst)
+                except FileNotFoundError:
+                    st = None
+
+                is_dir = st is not None and stat.S_ISDIR(st.st_mode)
+                if entry.is_dir(follow_symlinks=False):
+                    if is_dir:
+                        merge(src, dst)
+                        continue
+                    if st:
+                        raise FileExistsError(
+                            errno.EEXIST, os.strerror(errno.EEXIST), dst
+                        )
+                elif is_dir:
+                    raise IsADirectoryError(
+                        errno.EISDIR, os.strerror(errno.EISDIR), dst
+                    )
+
+                # Replaced files are set aside until the commit is
+                # complete.
+                old = None
+                if st:
+                    if backup is None:
+                        backup = tempfile.mkdtemp(
+                            prefix=".nusex-backup-", dir=self.destination
+                        )
+                    old = f"{backup}/{len(moved)}"
+                    os.replace(dst, old)
+
+                moved.append((src, dst, old))
+                os.replace(src, dst)
+
+        try:
+            merge(self.path, self.destination)
+        except BaseException:
+            try:
+                self._rollback(moved)
+            except OSError:
+                # Replaced files must not be lost.
+                log.error(f"Rollback failed; replaced files are in {backup}")
+                raise
+            if backup:
+                shutil.rmtree(backup, ignore_errors=True)
+            raise
+
+        if backup:
+            shutil.rmtree(backup, ignore_errors=True)
+
+        if fsync and os.name != "nt":
+            parents = {os.path.dirname(dst) for _, dst, _ in moved}
+            for path in sorted(parents):
+                _fsync_path(path)
+
+    def _rollback(self, moved):
+        log.info(f"Rolling back {len(moved):,} move(s)")
+
+        for src, dst, old in reversed(moved):
+            try:
+                os.replace(dst, src)
+            except FileNotFoundError:
+                # This was never moved.
+                ...
+            if old:
+                os.replace(old, dst)
+
+    def discard(self):
+        """Remove the staging directory, along with any files left in
+        it."""
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,150 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import re
+from pathlib import Path
+
+from .wildmatch import IgnoreRules
+
+
+def _suffix(name):
+    # The same as PurePath.suffix, minus the dot.
+    i = name.rfind(".")
+    if 0 < i < len(name) - 1:
+        return name[i + 1 :]
+    return ""
+
+
+def _match_rules(levels, rel_path, is_dir):
+    # Rules in deeper directories take precedence, as with Git.
+    for offset, rules in reversed(levels):
+        ignored = rules.match(rel_path[offset:], is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+
+def walk_files(
+    root_dir, *, ignore_exts=set(), ignore_dirs=set(), use_ignore_files=False
+):
+    """Get a list of files under a directory, skipping ignored files
+    and directories.
+
+    Ignored directories are never entered, and the file type
+    information returned by :obj:`os.scandir` is used where possible,
+    so this is much faster than filtering the results of
+    :obj:`pathlib.Path.rglob` when large directories are ignored. The
+    results are the same, and in the same order: each directory's files
+    are listed before those of its subdirectories, which are walked
+    depth-first. Symlinked directories are not followed.
+
+    Args:
+        root_dir (:obj:`str` | :obj:`os.PathLike`): The directory to
+            search from.
+
+    Keyword Args:
+        ignore_exts (:obj:`set[str]`): A set of file extensions to
+            ignore. Defaults to an empty set.
+        ignore_dirs (:obj:`set[str]`): A set of directories to ignore.
+            Values starting with an asterisk (*) ignore any path
+            containing the rest of the value. Defaults to an empty set.
+        use_ignore_files (:obj:`bool`): Whether to also ignore files
+            matched by the .gitignore and .nusexignore files in the root
+            directory and its subdirectories. Defaults to False.
+
+    Returns:
+        :obj:`list[pathlib.Path]`: A list of filepaths.
+
+    .. versionadded:: 1.4
+    """
+    wild_dir_ignores = [i[1:] for i in ignore_dirs if i.startswith("*")]
+    true_dir_ignores = {i for i in ignore_dirs if not i.startswith("*")}
+    wild_search = (
+        re.compile("|".join(map(re.escape, wild_dir_ignores))).search
+        if wild_dir_ignores
+        else lambda _: None
+    )
+
+    def is_ignored(name, path):
+        return name in true_dir_ignores or wild_search(path) is not None
+
+    root = Path(root_dir)
+    base = f"{root}"
+    if true_dir_ignores.intersection(root.parts) or wild_search(base):
+        return []
+
+    # Paths are joined the same way pathlib joins them, so the wildcard
+    # checks see the same strings rglob would produce. Paths relative to
+    # the root, using forward slashes, are tracked alongside them for
+    # matching against ignore files, as are the rules that apply to
+    # each directory.
+    stack = [("" if base == "." else base, "", ())]
+    files = []
+
+    while stack:
+        dir_path, rel_dir, levels = stack.pop()
+        prefix = dir_path.rstrip(os.sep) + os.sep if dir_path else ""
+        subdirs = []
+
+        try:
+            with os.scandir(dir_path or ".") as it:
+                entries = list(it)
+        except PermissionError:
+            continue
+
+        if use_ignore_files:
+            rules = IgnoreRules.from_dir(dir_path or ".")
+            if rules:
+                levels += ((len(rel_dir), rules),)
+
+        for entry in entries:
+            name = entry.name
+            path = prefix + name
+
+            if entry.is_dir(follow_symlinks=False):
+                rel_path = rel_dir + name
+                if not (
+                    is_ignored(name, path)
+                    or levels
+                    and _match_rules(levels, rel_path, True)
+                ):
+                    subdirs.append((path, f"{rel_path}/", levels))
+            elif (
+                entry.is_file()
+                and not is_ignored(name, path)
+                and _suffix(name) not in ignore_exts
+                and not (
+                    levels and _match_rules(levels, rel_dir + name, False)
+                )
+            ):
+                files.append(path)
+
+        stack.extend(reversed(subdirs))
+
+    return [Path(f) for f in files]
@@ -0,0 +1,234 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import os
+import re
+
+IGNORE_FILES = (".gitignore", ".nusexignore")
+
+log = logging.getLogger(__name__)
+
+
+def _translate_segment(segment):
+    # Translate a single path segment of a pattern, which cannot
+    # contain a slash.
+    out = []
+    i, n = 0, len(segment)
+
+    while i < n:
+        c = segment[i]
+        i += 1
+
+        if c == "\\" and i < n:
+            out.append(re.escape(segment[i]))
+            i += 1
+        elif c == "*":
+            if not out or out[-1] != "[^/]*":
+                out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and segment[j] in "!^":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+
+            if j >= n:
+                out.append(r"\[")
+                continue
+
+            chars, i = segment[i:j], j + 1
+            negate = chars[:1] in ("!", "^")
+            if negate:
+                chars = chars[1:]
+            chars = "".join(f"\\{c}" if c in "\\[]^" else c for c in chars)
+            out.append(f"[^/{chars}]" if negate else f"[{chars}]")
+        else:
+            out.append(re.escape(c))
+
+    return "".join(out)
+
+
+def translate(pattern):
+    """Translate a single line of a gitignore file into a regular
+    expression.
+
+    The expression matches paths relative to the directory containing
+    the ignore file, using forward slashes. Directories must be matched
+    with a trailing slash.
+
+    Args:
+        pattern (:obj:`str`): The line to translate.
+
+    Returns:
+        :obj:`tuple[str, bool] | None`: The expression, and whether the
+        pattern is negated. If the line is blank or a comment, this is
+        None instead.
+
+    .. versionadded:: 1.4
+    """
+    # Trailing spaces are ignored unless they are escaped.
+    pattern = pattern.rstrip("\n\r")
+    stripped = pattern.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(pattern):
+        stripped += " "
+    pattern = stripped
+
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+
+    # Patterns with a slash anywhere but the end are relative to the
+    # ignore file; others match at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = "" if anchored else "(?:.*/)?"
+    segments = pattern.split("/")
+    last = len(segments) - 1
+
+    for i, segment in enumerate(segments):
+        if segment == "**":
+            regex += ".+" if i == last else "(?:.*/)?"
+        else:
+            regex += _translate_segment(segment) + ("" if i == last else "/")
+
+    return regex + ("/" if dir_only else "/?"), negate
+
+
+class IgnoreRules:
+    """A set of gitignore-style rules, such as those from a single
+    ignore file.
+
+    Every pattern is compiled into a single regular expression, so each
+    path is matched against the whole set in one pass. Later patterns
+    take precedence over earlier ones, as with Git. Patterns that
+    cannot be compiled, such as those with reversed character ranges,
+    match nothing, also as with Git.
+
+    Args:
+        lines (:obj:`Iterable[str]`): The lines of the ignore file.
+
+    Attributes:
+        patterns (:obj:`list[str]`): The patterns in the set, excluding
+            blank lines and comments.
+
+    .. versionadded:: 1.4
+    """
+
+    __slots__ = ("patterns", "_regex", "_negated")
+
+    def __init__(self, lines):
+        self.patterns = []
+        regexes = []
+        negated = []
+
+        for line in lines:
+            translated = translate(line)
+            if not translated:
+                continue
+
+            try:
+                re.compile(translated[0])
+            except re.error as exc:
+                log.warning(
+                    f"Ignoring invalid pattern {line.strip()!r}: {exc}"
+                )
+                continue
+
+            self.patterns.append(line.strip())
+            regexes.append(translated[0])
+            negated.append(translated[1])
+
+        # The alternatives are tried in order, so they are reversed to
+        # give later patterns precedence. Each is the only capturing
+        # group in its alternative, so lastindex identifies it.
+        self._regex = re.compile(
+            "|".join(f"({r})" for r in reversed(regexes))
+        ).fullmatch
+        self._negated = (None, *reversed(negated))
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __repr__(self):
+        return f"<IgnoreRules patterns={len(self.patterns)}>"
+
+    @classmethod
+    def from_dir(cls, path):
+        """Load the rules from the ignore files in a directory.
+        Patterns in .nusexignore take precedence over those in
+        .gitignore.
+
+        Args:
+            path (:obj:`str` | :obj:`os.PathLike`): The directory.
+
+        Returns:
+            :obj:`IgnoreRules | None`: The rules, or None if there are
+            no ignore files or they contain no patterns.
+        """
+        lines = []
+
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(path, name), encoding="utf-8") as f:
+                    lines.extend(f)
+            except (FileNotFoundError, NotADirectoryError):
+                ...
+
+        return cls(lines) or None
+
+    def match(self, path, is_dir=False):
+        """Match a path against these rules.
+
+        Args:
+            path (:obj:`str`): The path, relative to the directory the
+                rules apply to, using forward slashes.
+            is_dir (:obj:`bool`): Whether the path is a directory.
+                Defaults to False.
+
+        Returns:
+            :obj:`bool | None`: True if the path is ignored, False if it
+            is explicitly not ignored by a negated pattern, or None if
+            no pattern matches.
+        """
+        m = self._regex(f"{path}/" if is_dir else path)
+        if not m or not m.lastindex:
+            return None
+        return not self._negated[m.lastindex]
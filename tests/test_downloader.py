@@ -0,0 +1,570 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import functools
+import hashlib
+import json
+import os
+import subprocess as sp
+import sys
+import threading
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest  # type: ignore
+
+from nusex import Template
+from nusex.errors import DownloadError, UnsupportedFile
+from nusex.spec.blobs import BlobStore
+from nusex.utils import Downloader, downloader, export_bundle, import_bundle
+
+FILES = [f"nusex/downloads/main/licenses/license_{i}.txt" for i in range(20)]
+PROFILE = {
+    "author_name": "Andy Koffman",
+    "author_email": "wrestingbears@hotmail.com",
+    "git_profile_url": "https://github.com/wrestlingbears",
+    "starting_version": "0.1.0",
+    "default_description": "My project, created using nusex",
+    "preferred_license": "mit",
+}
+TEST_DIR = Path(__file__).parent / "data/testarosa_py"
+
+
+class FlakyHandler(SimpleHTTPRequestHandler):
+    # Fails the first request for each file, and always fails for
+    # anything called "missing".
+    seen = set()
+    hits = []
+    codes = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if "missing" in self.path:
+            return self.send_error(404)
+        if self.path not in self.seen:
+            self.seen.add(self.path)
+            return self.send_error(503)
+        return super().do_GET()
+
+    def log_request(self, code="-", size="-"):
+        self.codes.append(code)
+
+    def log_message(self, *args):
+        ...
+
+
+@pytest.fixture()
+def server(tmp_path, monkeypatch):
+    root = tmp_path / "remote"
+    for file in FILES:
+        path = root / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"{path.name}\n")
+
+    FlakyHandler.seen = set()
+    FlakyHandler.hits = []
+    FlakyHandler.codes = []
+    handler = functools.partial(FlakyHandler, directory=f"{root}")
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+
+    monkeypatch.setattr(
+        downloader, "RAW_URL", f"http://127.0.0.1:{httpd.server_port}"
+    )
+    monkeypatch.setattr(downloader, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(downloader, "MANIFEST_DIR", tmp_path / "manifests")
+    yield root
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_concurrently_with_retries(server, tmp_path):
+    dl = Downloader("licenses", jobs=4, timeout=5, retries=2)
+    dl.directory = tmp_path
+    dl.files = FILES
+    dl.download()
+
+    assert dl.completed == len(FILES)
+    assert dl.progress == 100
+    for file in FILES:
+        name = file.split("/")[-1]
+        assert (tmp_path / name).read_text() == f"{name}\n"
+
+
+def test_download_only_changed_files(server, tmp_path):
+    dl = Downloader("licenses", jobs=4, timeout=5, retries=2)
+    dl.directory = tmp_path
+    dl.files = FILES
+    dl.download()
+    assert dl.unchanged == 0
+
+    # Nothing has changed, so nothing should be transferred or written.
+    FlakyHandler.codes = []
+    mtimes = [os.stat(p).st_mtime_ns for p in tmp_path.glob("*.txt")]
+    dl.download()
+    assert dl.completed == dl.unchanged == len(FILES)
+    assert FlakyHandler.codes == [304] * len(FILES)
+    assert [os.stat(p).st_mtime_ns for p in tmp_path.glob("*.txt")] == mtimes
+
+    # Change one file upstream, and break another locally.
+    remote = server / FILES[0]
+    remote.write_text("Changed\n")
+    os.utime(remote, (remote.stat().st_atime, remote.stat().st_mtime + 10))
+    (tmp_path / "license_1.txt").write_text("Broken\n")
+
+    dl.download()
+    assert dl.unchanged == len(FILES) - 2
+    assert (tmp_path / "license_0.txt").read_text() == "Changed\n"
+    assert (tmp_path / "license_1.txt").read_text() == "license_1.txt\n"
+
+
+def test_download_gives_up(server, tmp_path):
+    dl = Downloader("licenses", jobs=4, timeout=5, retries=0)
+    dl.directory = tmp_path
+    dl.files = FILES[:1]
+
+    with pytest.raises(DownloadError) as exc:
+        dl.download()
+    assert f"{exc.value}" == "Download failed (GitHub returned 503)"
+
+
+def test_download_does_not_retry_missing_files(server, tmp_path):
+    dl = Downloader("licenses", jobs=4, timeout=5, retries=5)
+    dl.directory = tmp_path
+    dl.files = [*FILES, "nusex/downloads/main/licenses/missing.txt"]
+
+    with pytest.raises(DownloadError) as exc:
+        dl.download()
+    assert f"{exc.value}" == "Download failed (GitHub returned 404)"
+    assert (
+        FlakyHandler.hits.count("/nusex/downloads/main/licenses/missing.txt")
+        == 1
+    )
+
+
+def _write_index(root, files, **overrides):
+    assets = []
+    for file in files:
+        data = (root / file).read_bytes()
+        asset = {
+            "name": file.split("/")[-1],
+            "url": file,
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "version": "1",
+        }
+        asset.update(overrides)
+        assets.append(asset)
+
+    index = {"format": 1, "assets": assets}
+    (root / "licenses.json").write_text(json.dumps(index))
+
+
+def test_download_from_local_mirror(server, tmp_path):
+    _write_index(server, FILES)
+    dl = Downloader("licenses", jobs=4, mirror=server)
+    dl.directory = tmp_path / "dest"
+    dl.directory.mkdir()
+    dl.download()
+
+    assert len(dl.files) == len(FILES)
+    assert dl.unchanged == 0
+    for file in FILES:
+        name = file.split("/")[-1]
+        assert (dl.directory / name).read_text() == f"{name}\n"
+
+    dl.download()
+    assert dl.unchanged == len(FILES)
+
+
+def test_download_from_http_mirror(server, tmp_path):
+    _write_index(server, FILES)
+    FlakyHandler.seen.add("/licenses.json")
+    dl = Downloader("licenses", jobs=4, mirror=downloader.RAW_URL)
+    dl.directory = tmp_path
+    dl.download()
+    assert dl.completed == len(FILES)
+
+    # Everything already matches the index, so only the index itself
+    # should be requested.
+    FlakyHandler.hits = []
+    dl = Downloader("licenses", jobs=4, mirror=downloader.RAW_URL)
+    dl.directory = tmp_path
+    dl.download()
+    assert dl.unchanged == len(FILES)
+    assert FlakyHandler.hits == ["/licenses.json"]
+
+
+def test_download_checks_index_hashes(server, tmp_path):
+    _write_index(server, FILES[:1], sha256="0" * 64)
+    dl = Downloader("licenses", retries=1, mirror=server)
+    dl.directory = tmp_path
+
+    with pytest.raises(DownloadError) as exc:
+        dl.download()
+    assert "does not match the asset index" in f"{exc.value}"
+    assert not (tmp_path / "license_0.txt").exists()
+
+
+def test_download_rejects_bad_index(server, tmp_path):
+    _write_index(server, FILES[:1], name="../license_0.txt")
+    dl = Downloader("licenses", mirror=server)
+    with pytest.raises(DownloadError) as exc:
+        dl.fetch()
+    assert f"{exc.value}" == "Fetch failed (invalid asset index)"
+
+    dl = Downloader("licenses", mirror=server / "nowhere")
+    with pytest.raises(DownloadError):
+        dl.fetch()
+
+
+def test_fetch_falls_back_to_scraping(server, monkeypatch):
+    monkeypatch.delenv("NUSEX_MIRROR", raising=False)
+    monkeypatch.setattr(downloader, "MIRROR_URL", server.as_uri())
+    (server / "listing.html").write_text(
+        '<div role="rowheader">\n'
+        '<a href="/nusex/downloads/blob/main/licenses/mit.txt">\n'
+    )
+
+    dl = Downloader("licenses")
+    dl.url = (server / "listing.html").as_uri()
+    dl.fetch()
+    assert dl.files == ["/nusex/downloads/main/licenses/mit.txt"]
+    assert dl.index == {}
+
+
+class CuttingHandler(SimpleHTTPRequestHandler):
+    # Serves byte ranges, and cuts off the first response for each
+    # file halfway through. If-Range is only honoured if if_range is
+    # set.
+    seen = set()
+    ranges = []
+    if_ranges = []
+    if_range = True
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        with open(path, "rb") as f:
+            data = f.read()
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+
+        start = 0
+        header = self.headers.get("Range")
+        self.ranges.append(header)
+        self.if_ranges.append(self.headers.get("If-Range"))
+        if header and self.if_range:
+            if self.headers.get("If-Range") not in (None, etag):
+                header = None
+        if header:
+            start = int(header.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", f"{len(data) - start}")
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        if self.path.endswith(".txt") and self.path not in self.seen:
+            self.seen.add(self.path)
+            self.wfile.write(data[start : start + (len(data) - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        ...
+
+
+@pytest.fixture()
+def cutting_server(tmp_path, monkeypatch):
+    root = tmp_path / "remote"
+    root.mkdir()
+    CuttingHandler.seen = set()
+    CuttingHandler.ranges = []
+    CuttingHandler.if_ranges = []
+    CuttingHandler.if_range = True
+    handler = functools.partial(CuttingHandler, directory=f"{root}")
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+    monkeypatch.setattr(downloader, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(downloader, "MANIFEST_DIR", tmp_path / "manifests")
+
+    yield root, f"http://127.0.0.1:{httpd.server_port}"
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_resumes_cut_off_files(cutting_server, tmp_path):
+    root, url = cutting_server
+    files = []
+    for i in range(3):
+        (root / f"big_{i}.txt").write_bytes(os.urandom(300_000))
+        files.append(f"big_{i}.txt")
+    _write_index(root, files)
+
+    dl = Downloader("licenses", mirror=url)
+    dl.directory = tmp_path / "dest"
+    dl.directory.mkdir()
+    dl.download()
+
+    # Each file was requested once in full, then once from halfway.
+    assert CuttingHandler.ranges.count(None) == 1 + len(files)
+    assert sorted(r for r in CuttingHandler.ranges if r) == [
+        "bytes=150000-"
+    ] * len(files)
+    for file in files:
+        assert (dl.directory / file).read_bytes() == (root / file).read_bytes()
+    assert not list(dl.directory.glob("*.part"))
+
+    # Ranges are only resumed from the same version of each file.
+    etags = {r for r in CuttingHandler.if_ranges if r}
+    assert len(etags) == len(files)
+
+
+@pytest.mark.parametrize("if_range", [True, False])
+def test_download_restarts_stale_partial_files(
+    cutting_server, tmp_path, if_range
+):
+    root, url = cutting_server
+    data = os.urandom(300_000)
+    (root / "big_0.txt").write_bytes(data)
+    _write_index(root, ["big_0.txt"])
+    CuttingHandler.seen.add("/big_0.txt")
+    CuttingHandler.if_range = if_range
+
+    # A partial file left over from an older version of the asset.
+    dl = Downloader("licenses", mirror=url)
+    dl.directory = tmp_path / "dest"
+    dl.directory.mkdir()
+    (dl.directory / "big_0.txt.part").write_bytes(os.urandom(150_000))
+    dl.manifest_path.parent.mkdir(parents=True)
+    dl.manifest_path.write_text(
+        json.dumps(
+            {
+                f"{url}/big_0.txt": {
+                    **downloader.PENDING_ENTRY,
+                    "part_etag": '"older"',
+                }
+            }
+        )
+    )
+    dl.download()
+
+    assert (dl.directory / "big_0.txt").read_bytes() == data
+    assert not list(dl.directory.glob("*.part"))
+    # The first request is for the index.
+    assert CuttingHandler.if_ranges[1] == '"older"'
+    # Servers that ignore If-Range send the wrong range, which is only
+    # caught by the hash check, so the file is requested again.
+    assert CuttingHandler.ranges[1:] == (
+        ["bytes=150000-"] if if_range else ["bytes=150000-", None]
+    )
+
+
+def test_download_records_partial_files(cutting_server, tmp_path):
+    root, url = cutting_server
+    (root / "big_0.txt").write_bytes(os.urandom(300_000))
+    _write_index(root, ["big_0.txt"])
+
+    # Every attempt is cut off, so the partial file is kept along with
+    # the ETag it was started from.
+    dl = Downloader("licenses", retries=0, mirror=url)
+    dl.directory = tmp_path / "dest"
+    dl.directory.mkdir()
+    with pytest.raises(DownloadError):
+        dl.download()
+
+    manifest = json.loads(dl.manifest_path.read_text())
+    assert manifest[f"{url}/big_0.txt"]["part_etag"].startswith('"')
+    assert (dl.directory / "big_0.txt.part").stat().st_size == 150_000
+
+    dl.download()
+    assert CuttingHandler.if_ranges[-1] == (
+        manifest[f"{url}/big_0.txt"]["part_etag"]
+    )
+    assert (
+        "part_etag"
+        not in json.loads(dl.manifest_path.read_text())[f"{url}/big_0.txt"]
+    )
+
+
+def test_download_leaves_old_files_on_failure(server, tmp_path):
+    _write_index(server, FILES[:1])
+    FlakyHandler.seen.add("/licenses.json")
+    (tmp_path / "license_0.txt").write_text("Old\n")
+
+    # The first request for the file fails, so the old file should be
+    # left alone.
+    dl = Downloader("licenses", retries=0, mirror=downloader.RAW_URL)
+    dl.directory = tmp_path
+    with pytest.raises(DownloadError):
+        dl.download()
+    assert (tmp_path / "license_0.txt").read_text() == "Old\n"
+
+    dl.download()
+    assert (tmp_path / "license_0.txt").read_text() == "license_0.txt\n"
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_invalid_asset_type():
+    with pytest.raises(DownloadError):
+        Downloader("profiles")
+
+
+@pytest.fixture()
+def assets(tmp_path):
+    src = tmp_path / "src"
+    for of_type, suffix in (("templates", "nsx"), ("licenses", "txt")):
+        (src / of_type).mkdir(parents=True)
+        for i in range(5):
+            (src / of_type / f"{of_type}_{i}.{suffix}").write_bytes(
+                os.urandom(1024)
+            )
+    # Not an asset, so should not be bundled.
+    (src / "templates" / "notes.md").write_text("Hi\n")
+    return src
+
+
+def test_bundle_round_trip(assets, tmp_path):
+    bundle = tmp_path / "bundle.zip"
+    assert export_bundle(bundle, directory=assets) == 10
+
+    dest = tmp_path / "dest"
+    counts = import_bundle(bundle, directory=dest)
+    assert counts == {"templates": 5, "licenses": 5}
+
+    for of_type in ("templates", "licenses"):
+        names = sorted(p.name for p in (dest / of_type).iterdir())
+        assert len(names) == 5
+        for name in names:
+            assert (dest / of_type / name).read_bytes() == (
+                assets / of_type / name
+            ).read_bytes()
+
+
+def test_bundle_import_from_url(server, assets, tmp_path):
+    export_bundle(server / "bundle.zip", directory=assets)
+    url = f"{downloader.RAW_URL}/bundle.zip"
+    FlakyHandler.seen.add("/bundle.zip")
+
+    counts = import_bundle(url, directory=tmp_path / "dest")
+    assert counts == {"templates": 5, "licenses": 5}
+
+
+def test_bundle_rejects_corrupt_assets(assets, tmp_path):
+    bundle = tmp_path / "bundle.zip"
+    export_bundle(bundle, directory=assets)
+
+    with zipfile.ZipFile(bundle) as zf:
+        members = {n: zf.read(n) for n in zf.namelist()}
+    members["licenses/licenses_3.txt"] = b"Tampered\n"
+    members["../escape.txt"] = b"Nope\n"
+    manifest = json.loads(members["manifest.json"])
+    manifest["files"]["../escape.txt"] = "0" * 64
+    members["manifest.json"] = json.dumps(manifest)
+    with zipfile.ZipFile(bundle, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+
+    dest = tmp_path / "dest"
+    with pytest.raises(UnsupportedFile) as exc:
+        import_bundle(bundle, directory=dest)
+    assert "licenses/licenses_3.txt" in f"{exc.value}"
+    assert not (dest / "licenses" / "licenses_3.txt").exists()
+    assert not list(dest.glob("*/*.tmp"))
+    assert not (tmp_path / "escape.txt").exists()
+
+
+def _read_tree(root):
+    return {
+        p.relative_to(root): p.read_bytes()
+        for p in root.rglob("*")
+        if p.is_file()
+    }
+
+
+def test_bundle_round_trip_deduped(tmp_path):
+    template = Template.from_dir("__test_bundle__", TEST_DIR)
+    template.save(dedupe=True)
+    try:
+        digests = BlobStore().refs()["__test_bundle__"]
+        assert digests
+
+        bundle = tmp_path / "bundle.zip"
+        export_bundle(bundle)
+        with zipfile.ZipFile(bundle) as zf:
+            assert {f"blobs/{d}" for d in digests} <= set(zf.namelist())
+
+        Template("__test_bundle__").deploy(
+            project_name="bundled",
+            destination=tmp_path / "expected",
+            profile=PROFILE,
+        )
+    finally:
+        template.delete()
+
+    # The bundle is imported and deployed in a fresh process with its
+    # own home directory, so nothing can be read from this config.
+    home = tmp_path / "home"
+    script = (
+        "from nusex import Template\n"
+        "from nusex.utils import import_bundle\n"
+        f"import_bundle({f'{bundle}'!r})\n"
+        "Template('__test_bundle__').deploy(\n"
+        f"    project_name='bundled', destination={f'{tmp_path}/actual'!r},\n"
+        f"    profile={PROFILE!r},\n"
+        ")\n"
+    )
+    sp.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).parents[1],
+        env={**os.environ, "HOME": f"{home}", "USERPROFILE": f"{home}"},
+        check=True,
+    )
+
+    expected = _read_tree(tmp_path / "expected")
+    assert expected and _read_tree(tmp_path / "actual") == expected
+
+
+def test_bundle_rejects_other_files(tmp_path):
+    bundle = tmp_path / "bundle.zip"
+    bundle.write_bytes(b"Not a bundle")
+
+    with pytest.raises(UnsupportedFile):
+        import_bundle(bundle, directory=tmp_path / "dest")
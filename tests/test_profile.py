@@ -27,11 +27,17 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest  # type: ignore
 
-from nusex import CONFIG_DIR, PROFILE_DIR, Profile
+from nusex import CONFIG_DIR, LICENSE_DIR, PROFILE_DIR, Profile
 from nusex.errors import AlreadyExists, ProfileError
+from nusex.utils import LicenseIndex
+from nusex.utils.licenses import RENDER_CACHE_SIZE
 
 
 def test_create_valid_profile():
@@ -141,6 +147,85 @@ def test_update_profile_preferred_license():
     )
 
 
+def test_license_index(tmp_path, monkeypatch):
+    licenses = tmp_path / "licenses"
+    licenses.mkdir()
+    for stem in ("mit", "0bsd"):
+        shutil.copy(LICENSE_DIR / f"{stem}.txt", licenses)
+
+    index = LicenseIndex(directory=licenses, path=tmp_path / "index.json")
+    assert index.resolve("MIT") == "mit"
+    assert index.resolve("BSD Zero Clause License") == "0bsd"
+    assert index.resolve("unlicense") is None
+    assert (tmp_path / "index.json").is_file()
+
+    name, body = index.read("mit")
+    assert name == "MIT License"
+    assert body.startswith("MIT License\n\nCopyright (c) [year] [fullname]")
+
+    name, body = index.render("mit", year=2021, author="Jane Doe")
+    assert name == b"MIT License"
+    assert body.startswith(b"MIT License\n\nCopyright (c) 2021 Jane Doe")
+    assert index.render("mit", year=2021, author="Jane Doe")[1] is body
+    assert b"John Doe" in index.render("mit", year=2021, author="John Doe")[1]
+
+    # A saved index should be reused until the directory changes.
+    with monkeypatch.context() as m:
+        m.setattr(LicenseIndex, "_build", None)
+        index = LicenseIndex(directory=licenses, path=tmp_path / "index.json")
+        assert index.resolve("mit") == "mit"
+
+    shutil.copy(LICENSE_DIR / "unlicense.txt", licenses)
+    os.utime(licenses, ns=(0, os.stat(licenses).st_mtime_ns + 1))
+    index = LicenseIndex(directory=licenses, path=tmp_path / "index.json")
+    assert index.resolve("unlicense") == "unlicense"
+
+    # Editing a license in place leaves the directory's mtime alone, but
+    # should still be picked up, by new indexes and this one.
+    index.render("mit", year=2021, author="Jane Doe")
+    mtime = os.stat(licenses).st_mtime_ns
+    text = (licenses / "mit.txt").read_text()
+    (licenses / "mit.txt").write_text(
+        text.replace("title: MIT License", "title: Expat License", 1)
+    )
+    os.utime(licenses, ns=(0, mtime))
+
+    name, body = index.render("mit", year=2021, author="Jane Doe")
+    assert name == b"Expat License"
+    assert body.startswith(b"MIT License\n\nCopyright (c) 2021 Jane Doe")
+    index = LicenseIndex(directory=licenses, path=tmp_path / "index.json")
+    name, body = index.read("mit")
+    assert name == "Expat License"
+    assert body.startswith("MIT License\n\nCopyright (c) [year]")
+
+
+def test_license_index_renders_from_threads(tmp_path):
+    licenses = tmp_path / "licenses"
+    licenses.mkdir()
+    for stem in ("mit", "0bsd"):
+        shutil.copy(LICENSE_DIR / f"{stem}.txt", licenses)
+    index = LicenseIndex(directory=licenses, path=tmp_path / "index.json")
+
+    def render(i):
+        # There are more keys than fit in the cache, so entries are
+        # evicted while other threads look them up.
+        author = f"Author {i % (RENDER_CACHE_SIZE * 3)}"
+        stem = ("mit", "0bsd")[i % 2]
+        body = index.render(stem, year=2021, author=author)[1]
+        return f"2021 {author}\n".encode() in body
+
+    # Switching threads as often as possible gives races in the cache
+    # the best chance of showing up.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert all(executor.map(render, range(RENDER_CACHE_SIZE * 20)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(index._rendered) == RENDER_CACHE_SIZE
+
+
 def test_update_invalid():
     profile1 = Profile("__test_profile__")
     profile2 = Profile("__test_profile__")
@@ -149,6 +234,19 @@ def test_update_invalid():
     assert profile1 == profile2
 
 
+def test_validate_option():
+    profile = Profile("__test_profile__")
+    assert profile.validate_option("preferred_license", "MIT") == "mit"
+    assert profile.validate_option("git_profile_url", "https://x.y/") == (
+        "https://x.y"
+    )
+
+    with pytest.raises(ProfileError):
+        profile.validate_option("version", "0.1.0")
+    with pytest.raises(ProfileError):
+        profile.validate_option("starting_version", "test")
+
+
 def test_rename_profile():
     profile = Profile("__test_profile__")
     profile.rename("__test_profile__")
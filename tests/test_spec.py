@@ -26,10 +26,25 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest  # type: ignore
+
 from nusex import PROFILE_DIR, TEMPLATE_DIR
-from nusex.spec import NSCSpecIO, NSPSpecIO, NSXSpecIO
+from nusex.errors import UnsupportedFile
+from nusex.spec import (
+    BlobStore,
+    NSCSpecIO,
+    NSPSpecIO,
+    NSXFileMapping,
+    NSXReader,
+    NSXSpecIO,
+    NSXWriter,
+    nsx,
+)
+from nusex.spec.nsx import CODEC_MASK, FLAG_BLOB
 
 
 def test_nsc_spec():
@@ -38,6 +53,7 @@ def test_nsc_spec():
         "last_update": "210101",
         "use_wildmatch_ignore": False,
         "auto_update": False,
+        "update_available": True,
     }
     NSCSpecIO().write(data)
 
@@ -74,3 +90,286 @@ def test_nsx_spec():
 
     data2 = NSXSpecIO().read(TEMPLATE_DIR / "__nsx_spec_test__.nsx")
     assert data == data2
+
+
+def test_nsx_reader():
+    with NSXReader(TEMPLATE_DIR / "__nsx_spec_test__.nsx") as r:
+        assert r.version == 3
+        assert len(r) == 5
+        assert r.data["installs"] == ["analytix", "nusex"]
+        assert r.data["as_addon_for"] == "template"
+        assert "hello.txt" in r
+        assert (
+            r.read("hello.txt")
+            == (Path(__file__).parent / "data/nsx/hello.txt").read_bytes()
+        )
+
+
+def test_nsx_spec_legacy():
+    data = {
+        "files": {
+            f"{p}".split("/")[-1]: p.read_bytes()
+            for p in (Path(__file__).parent / "data/nsx").glob("*")
+        },
+        "installs": ["analytix", "nusex"],
+        "as_addon_for": "",
+        "language": "rust",
+    }
+    path = TEMPLATE_DIR / "__nsx_v1_test__.nsx"
+    with open(path, "wb") as f:
+        f.write(b"\x99\x78\x00\x01" + b"rust".ljust(12) + b"\x00" * 8)
+        f.write(b"\x01")
+        for k, v in data["files"].items():
+            f.write(k.encode() + b"\x97" + hex(len(v))[2:].ljust(8).encode())
+            f.write(v)
+        f.write(b"\x98\x02analytix\x97nusex\x97\x98")
+
+    assert NSXSpecIO().version(path) == 1
+    assert NSXSpecIO().read(path) == data
+    with NSXReader(path) as r:
+        assert r.version == 1
+        assert r.names() == list(data["files"].keys())
+        for name, body in data["files"].items():
+            assert r.read(name) == body
+
+    assert NSXSpecIO().upgrade(path)
+    assert NSXSpecIO().version(path) == 3
+    assert NSXSpecIO().read(path) == data
+    assert not NSXSpecIO().upgrade(path)
+    path.unlink()
+
+
+def test_nsx_spec_lazy():
+    path = TEMPLATE_DIR / "__nsx_spec_test__.nsx"
+    data = NSXSpecIO().read(path)
+    lazy = NSXSpecIO().read(path, lazy=True)
+    files = lazy["files"]
+
+    assert isinstance(files, NSXFileMapping)
+    assert lazy == data
+    assert list(files.keys()) == list(data["files"].keys())
+    assert files["hello.txt"] == data["files"]["hello.txt"]
+
+    view = files.view("tree.jpg")
+    assert isinstance(view, memoryview)
+    assert view == data["files"]["tree.jpg"]
+    view.release()
+
+    files["hello.txt"] = b"changed"
+    del files["goodbye.txt"]
+    assert files["hello.txt"] == b"changed"
+    assert "goodbye.txt" not in files
+    assert len(files) == 4
+
+    NSXSpecIO().write(path, lazy)
+    assert files.reader.path == path
+    assert NSXSpecIO().read(path)["files"] == dict(files.items())
+    files.close()
+    NSXSpecIO().write(path, data)
+
+
+def test_nsx_spec_compressed():
+    text = b"".join(b"line %d of a lockfile\n" % (i % 50) for i in range(2000))
+    data = {
+        "files": {
+            "tiny.txt": b"hello",
+            "text.txt": text,
+            "random.bin": os.urandom(4096),
+            "tree.jpg": (
+                Path(__file__).parent / "data/nsx/tree.jpg"
+            ).read_bytes(),
+        },
+        "installs": [],
+        "as_addon_for": "",
+        "language": "python",
+    }
+    path = TEMPLATE_DIR / "__nsx_z_test__.nsx"
+    NSXSpecIO().write(path, data, compress=True)
+
+    with NSXReader(path) as r:
+        assert r.entries["tiny.txt"].flags == 0
+        assert r.entries["random.bin"].flags == 0
+        assert r.entries["text.txt"].flags & CODEC_MASK
+        assert r.entries["text.txt"].size < len(text)
+        assert r.read("text.txt") == text
+        assert b"".join(r.iter_chunks("text.txt", 1000)) == text
+        assert bytes(r.view("text.txt")) == text
+
+    assert NSXSpecIO().read(path) == data
+    assert NSXSpecIO().read(path, lazy=True) == data
+    path.unlink()
+
+
+def test_nsx_spec_deduped(tmp_path):
+    shared = b"shared license text\n" * 100
+    data = {
+        "files": {"tiny.txt": b"hello", "LICENSE": shared},
+        "installs": [],
+        "as_addon_for": "",
+        "language": "python",
+    }
+    blobs = BlobStore(tmp_path)
+    path = tmp_path / "__nsx_d_test__.nsx"
+
+    with NSXWriter(path, blobs=blobs) as w:
+        for k, v in data["files"].items():
+            w.add(k, v, dedupe=True)
+    (digest,) = w.digests
+
+    with NSXReader(path, blobs=blobs) as r:
+        assert r.entries["tiny.txt"].flags == 0
+        assert r.entries["LICENSE"].flags == FLAG_BLOB
+        assert r.read_raw("LICENSE") == (digest.encode(), FLAG_BLOB)
+        assert r.read("LICENSE") == shared
+        assert b"".join(r.iter_chunks("LICENSE", 100)) == shared
+        assert bytes(r.view("LICENSE")) == shared
+
+    assert blobs.put(shared) == digest
+    assert blobs.path_for(digest).read_bytes() == shared
+
+
+def test_nsx_spec_placeholder_index(tmp_path):
+    path = tmp_path / "__nsx_i_test__.nsx"
+    text = b"PROJECTNAME by PROJECTAUTHOR\n" * 100
+
+    with NSXWriter(path) as w:
+        w.add("plain.txt", b"hello", placeholders=[])
+        w.add("text.txt", text, compress=True, placeholders=[(0, 0), (15, 1)])
+        w.add("unindexed.txt", b"PROJECTNAME")
+
+    with NSXReader(path) as r:
+        assert r.placeholders("plain.txt") == []
+        assert r.placeholders("text.txt") == [(0, 0), (15, 1)]
+        assert r.placeholders("unindexed.txt") is None
+        assert r.read("text.txt") == text
+
+    # Indexes survive being rewritten.
+    data = NSXSpecIO().read(path, lazy=True)
+    NSXSpecIO().write(path, data, compress=True)
+    assert data["files"].placeholders("text.txt") == [(0, 0), (15, 1)]
+    data["files"]["plain.txt"] = b"changed"
+    assert data["files"].placeholders("plain.txt") is None
+    data["files"].close()
+
+
+def test_nsx_reader_extract(tmp_path, monkeypatch):
+    text = b"line of a lockfile\n" * 2000
+    files = {
+        "raw.bin": os.urandom(4096),
+        "text.txt": text,
+        "empty.txt": b"",
+    }
+    blobs = BlobStore(tmp_path / "blobs")
+    path = tmp_path / "__nsx_x_test__.nsx"
+
+    with NSXWriter(path, blobs=blobs) as w:
+        for k, v in files.items():
+            w.add(k, v, compress=True)
+        w.add("blob.txt", text, dedupe=True)
+    files["blob.txt"] = text
+
+    with NSXReader(path, blobs=blobs) as r:
+        for name, data in files.items():
+            r.extract(name, tmp_path / name)
+            assert (tmp_path / name).read_bytes() == data
+
+        # Platforms without a suitable system call fall back to
+        # writing from the memory map.
+        monkeypatch.setattr(nsx, "_COPIERS", [])
+        r.extract("raw.bin", tmp_path / "fallback.bin")
+        assert (tmp_path / "fallback.bin").read_bytes() == files["raw.bin"]
+
+
+def test_blob_store_refcounting(tmp_path):
+    blobs = BlobStore(tmp_path)
+    a, b = blobs.put(b"a" * 1000), blobs.put(b"b" * 1000)
+
+    assert blobs.set_refs("one", {a, b}) == 0
+    assert blobs.set_refs("two", {a}) == 0
+    assert blobs.refcounts() == {a: 2, b: 1}
+
+    blobs.rename_refs("one", "three")
+    assert blobs.refs() == {"two": {a}, "three": {a, b}}
+
+    assert blobs.release("three") == 1
+    assert not blobs.path_for(b).exists()
+    assert blobs.read(a) == b"a" * 1000
+    assert blobs.release("two") == 1
+    assert blobs.refs() == {}
+
+    blobs.put(b"orphan" * 100)
+    assert blobs.collect() == 1
+
+
+def test_blob_store_concurrent_refs(tmp_path):
+    blobs = BlobStore(tmp_path)
+    digest = blobs.put(b"shared" * 1000)
+
+    def save(i):
+        blobs.set_refs(f"template_{i}", {digest})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(save, range(64)))
+
+    assert blobs.refcounts() == {digest: 64}
+    assert blobs.collect() == 0
+    assert blobs.read(digest) == b"shared" * 1000
+
+
+def test_blob_store_pins_blobs_being_saved(tmp_path):
+    blobs = BlobStore(tmp_path / "blobs")
+    data = b"shared" * 1000
+    digest = blobs.put(data)
+    blobs.set_refs("old", {digest})
+
+    # The blob already exists, so nothing is written, but releasing the
+    # only template saved with it must not remove it from under the
+    # template still being written.
+    path = tmp_path / "new.nsx"
+    with NSXWriter(path, blobs=blobs, ref="new") as w:
+        w.add("shared.txt", data, dedupe=True)
+        assert blobs.release("old") == 0
+        w.add("copied.txt", digest.encode(), FLAG_BLOB)
+    assert blobs.refs() == {"new": {digest}}
+
+    with NSXReader(path, blobs=blobs) as reader:
+        assert reader.read("shared.txt") == data
+        assert reader.read("copied.txt") == data
+
+    # Without a reference, the blob is fair game.
+    blobs.set_refs("new", set())
+    assert blobs.put(data) == digest
+    assert blobs.collect() == 1
+
+
+def test_nsx_rejects_bad_blob_digests(tmp_path):
+    blobs = BlobStore(tmp_path / "blobs")
+    secret = tmp_path / "secret"
+    secret.write_text("hunter2")
+    path = tmp_path / "__nsx_b_test__.nsx"
+
+    for digest in (
+        f"../../{secret}",
+        f"{secret}",
+        "A" * 64,
+        "0" * 63,
+        "0" * 65,
+    ):
+        with NSXWriter(path, blobs=blobs) as w:
+            w.add("stolen.txt", digest.encode(), FLAG_BLOB)
+
+        with pytest.raises(UnsupportedFile):
+            NSXReader(path, blobs=blobs)
+        with pytest.raises(UnsupportedFile):
+            NSXSpecIO().read(path)
+        with pytest.raises(ValueError):
+            blobs.path_for(digest)
+
+
+def test_nsx_spec_truncated():
+    path = TEMPLATE_DIR / "__nsx_spec_test__.nsx"
+    path.write_bytes(path.read_bytes()[:-40])
+
+    with pytest.raises(UnsupportedFile) as exc:
+        NSXSpecIO().read(path)
+    assert f"{exc.value}" == "Not a valid NSX file (truncated)"
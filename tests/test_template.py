@@ -26,8 +26,12 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import subprocess as sp
+import sys
+
 import pytest  # type: ignore
 
+import nusex
 from nusex import Template
 from nusex.errors import AlreadyExists, TemplateError
 
@@ -66,3 +70,27 @@ def test_reject_taken_names():
     with pytest.raises(AlreadyExists) as exc:
         Template("default")
     assert f"{exc.value}" == "A profile is already using that name"
+
+
+def test_star_imports():
+    for module, names in (
+        ("nusex", {"CONFIG_DIR", "Profile", "Session", "Template", "spec"}),
+        ("nusex.utils", {"Downloader", "LicenseIndex", "import_bundle"}),
+    ):
+        ns = {}
+        exec(f"from {module} import *", ns)
+        assert names <= set(ns)
+    assert ns["Downloader"] is nusex.utils.Downloader
+
+    # Importing the package should not load any of the lazy attributes.
+    out = sp.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, nusex, nusex.utils; "
+            "print(*(m for m in sys.modules if m.startswith('nusex')))",
+        ],
+        stdout=sp.PIPE,
+        check=True,
+    ).stdout.decode()
+    assert "nusex.template" not in out and "nusex.utils.downloader" not in out
@@ -26,15 +26,22 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import datetime as dt
 import logging
 import os
 import re
+import shutil
+import subprocess as sp
 from pathlib import Path
 
 import pytest  # type: ignore
 
 from nusex import TEMPLATE_DIR, Template
+from nusex.blueprints import PythonBlueprint
 from nusex.errors import TemplateError
+from nusex.spec import BlobStore
+from nusex.template import PLACEHOLDERS
+from nusex.utils import IgnoreRules
 
 TEST_DIR = Path(__file__).parent / "data/testarosa_py"
 
@@ -93,6 +100,85 @@ def test_build_okay_from_dir():
     assert template.exists
 
 
+def test_build_okay_streamed():
+    template = Template.from_dir("__test_stream__", TEST_DIR)
+    build_files = list(TEMPLATE_DIR.glob(".__test_stream__.*.build"))
+    assert len(build_files) == 1
+
+    # The streamed result must match running the blueprint over every
+    # file at once.
+    files = template.get_file_listing(TEST_DIR)
+    nparts = len(TEST_DIR.resolve().parts)
+    data = {
+        "files": {
+            "/".join(f"{f.resolve()}".split(os.sep)[nparts:]).replace(
+                "testarosa_py", "PROJECTNAME"
+            ): f.read_bytes()
+            for f in files
+        }
+    }
+    expected = PythonBlueprint("testarosa_py", data)().data["files"]
+    assert dict(template.data["files"].items()) == expected
+
+    template.save()
+    assert not build_files[0].exists()
+    assert dict(Template("__test_stream__").data["files"].items()) == expected
+    template.delete()
+
+
+def test_build_okay_parallel():
+    serial = Template.from_dir("__test_serial__", TEST_DIR)
+    parallel = Template.from_dir("__test_parallel__", TEST_DIR, jobs=4)
+    serial.save()
+    parallel.save()
+
+    assert serial.path.read_bytes() == parallel.path.read_bytes()
+    serial.delete()
+    parallel.delete()
+
+
+def test_build_okay_deduped():
+    templates = [
+        Template.from_dir(f"__test_dedupe_{i}__", TEST_DIR) for i in range(2)
+    ]
+    for template in templates:
+        template.save(dedupe=True)
+
+    blobs = BlobStore()
+    counts = blobs.refcounts()
+    assert counts and set(counts.values()) == {2}
+
+    reloaded = Template("__test_dedupe_0__")
+    assert dict(reloaded.data["files"].items()) == dict(
+        templates[0].data["files"].items()
+    )
+
+    templates[0].delete()
+    assert all(blobs.path_for(d).is_file() for d in counts)
+    templates[1].delete()
+    assert not any(blobs.path_for(d).is_file() for d in counts)
+
+
+def test_build_okay_indexed():
+    template = Template.from_dir("__test_index__", TEST_DIR)
+    files = template.data["files"]
+
+    for key in files:
+        data = files[key]
+        placeholders = files.placeholders(key)
+        assert placeholders is not None
+        for i, p in placeholders:
+            assert data.startswith(PLACEHOLDERS[p], i)
+
+    # The manifest must not depend on whether the files are indexed.
+    indexed = template.check()
+    assert any(indexed.values())
+    template.data["files"] = dict(files.items())
+    assert template.check() == indexed
+    files.close()
+    template.close()
+
+
 def test_build_okay_from_valid_repo():
     template = Template.from_repo(
         "__test_build_repo__",
@@ -333,3 +419,180 @@ def test_ignore_wildmatch_directories():
     )
     assert template.name == "__test_ignore_w_dir__"
     assert len(template.data["files"].keys()) == 19
+
+
+def test_file_listing_matches_rglob(tmp_path, monkeypatch):
+    def rglob_listing(root_dir, ignore_exts, ignore_dirs):
+        # The listing implementation prior to 1.4.
+        wild = {i for i in ignore_dirs if i.startswith("*")}
+        true = ignore_dirs - wild
+        return [
+            p
+            for p in Path(root_dir).rglob("*")
+            if p.is_file()
+            and all(i not in p.parts for i in true)
+            and all(i[1:] not in f"{p}" for i in wild)
+            and all(i != p.suffix[1:] for i in ignore_exts)
+        ]
+
+    for path in (
+        "pkg/__init__.py",
+        "pkg/sub/module.py",
+        "pkg/sub/module.pyc",
+        "pkg/sub/deeper/data.json",
+        "pkg/build",
+        ".git/objects/ab/cdef",
+        "venv/lib/site.py",
+        "thing.egg-info/PKG-INFO",
+        "docs/build/index.html",
+        ".gitignore",
+        "README.md",
+        "Makefile.",
+    ):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    os.symlink(tmp_path / "pkg", tmp_path / "linked")
+    os.symlink(tmp_path / "README.md", tmp_path / "README.rst")
+
+    template = Template("__test_listing__")
+    for ignore_exts, ignore_dirs in (
+        (set(), set()),
+        ({"pyc"}, {".git", "venv", "build", "*.egg-info"}),
+        ({"", "md"}, {"*sub/deep", "*.git"}),
+    ):
+        for root_dir in (tmp_path, tmp_path / "pkg"):
+            assert template.get_file_listing(
+                root_dir, ignore_exts=ignore_exts, ignore_dirs=ignore_dirs
+            ) == rglob_listing(root_dir, ignore_exts, ignore_dirs)
+
+    monkeypatch.chdir(tmp_path)
+    assert template.get_file_listing(".") == rglob_listing(".", set(), set())
+    assert template.get_file_listing(".", ignore_dirs={"pkg"}) == (
+        rglob_listing(".", set(), {"pkg"})
+    )
+    assert template.get_file_listing("pkg", ignore_dirs={"pkg"}) == []
+
+
+def test_file_listing_with_ignore_files(tmp_path):
+    files = {
+        ".gitignore": "*.log\n!keep.log\nbuild/\n/top.txt\ndocs/**/*.tmp\n",
+        ".nusexignore": "secret.env\n",
+        "top.txt": "",
+        "a.log": "",
+        "keep.log": "",
+        "secret.env": "",
+        "build/out.bin": "",
+        "pkg/top.txt": "",
+        "pkg/build": "",
+        "pkg/.gitignore": "# Comment\n\n*.py\n!main.py\n",
+        "pkg/main.py": "",
+        "pkg/util.py": "",
+        "pkg/sub/other.py": "",
+        "pkg/sub/debug.log": "",
+        "docs/a/b/c.tmp": "",
+        "docs/index.rst": "",
+    }
+    for path, content in files.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(content)
+
+    listing = Template("__test_listing__").get_file_listing(
+        tmp_path, use_ignore_files=True
+    )
+    assert sorted(
+        "/".join(p.relative_to(tmp_path).parts) for p in listing
+    ) == [
+        ".gitignore",
+        ".nusexignore",
+        "docs/index.rst",
+        "keep.log",
+        "pkg/.gitignore",
+        "pkg/build",
+        "pkg/main.py",
+        "pkg/top.txt",
+    ]
+
+    if shutil.which("git"):
+        # Git should agree, save for the nusex-specific ignore file.
+        (tmp_path / ".nusexignore").unlink()
+        sp.run(["git", "init", "-q", f"{tmp_path}"], check=True)
+        out = sp.run(
+            [
+                "git",
+                "-c",
+                "core.excludesFile=",
+                "ls-files",
+                "--others",
+                "--exclude-standard",
+            ],
+            cwd=tmp_path,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        listing = Template("__test_listing__").get_file_listing(
+            tmp_path, ignore_dirs={".git"}, use_ignore_files=True
+        )
+        assert sorted(
+            "/".join(p.relative_to(tmp_path).parts) for p in listing
+        ) == sorted(out.split())
+
+
+def test_file_listing_skips_invalid_ignore_patterns(tmp_path):
+    (tmp_path / ".gitignore").write_text("[z-a]\n*.log\n")
+    (tmp_path / "a.log").write_text("")
+    (tmp_path / "z").write_text("")
+
+    rules = IgnoreRules.from_dir(tmp_path)
+    assert rules.patterns == ["*.log"]
+    assert rules.match("a.log")
+    assert rules.match("z") is None
+
+    listing = Template("__test_listing__").get_file_listing(
+        tmp_path, use_ignore_files=True
+    )
+    assert sorted(p.name for p in listing) == [".gitignore", "z"]
+
+
+def test_build_okay_incremental(tmp_path):
+    calls = []
+
+    class CountingBlueprint(PythonBlueprint):
+        def process(self, key, data):
+            calls.append(key)
+            return super().process(key, data)
+
+    root = tmp_path / "testarosa_py"
+    shutil.copytree(TEST_DIR, root)
+    stale = (dt.datetime.now() - dt.timedelta(minutes=1)).timestamp()
+    for path in root.rglob("*"):
+        os.utime(path, (stale, stale))
+
+    template = Template.from_dir(
+        "__test_incr__", root, blueprint=CountingBlueprint
+    )
+    template.save()
+    assert len(calls) == 23
+    assert template.manifest_path.is_file()
+
+    (root / "README.md").write_text("# Changed\n")
+    (root / "LICENSE").unlink()
+    (root / "NEW.txt").write_text("New\n")
+    os.utime(root / "CONTRIBUTING.md")  # Touched, but unchanged.
+    calls.clear()
+
+    template = Template.from_dir(
+        "__test_incr__", root, blueprint=CountingBlueprint, incremental=True
+    )
+    assert sorted(calls) == ["NEW.txt", "README.md"]
+    template.save()
+    incremental = template.path.read_bytes()
+
+    template = Template.from_dir(
+        "__test_incr__", root, blueprint=CountingBlueprint
+    )
+    template.save()
+    assert template.path.read_bytes() == incremental
+
+    template.delete()
+    assert not template.manifest_path.exists()
@@ -31,16 +31,25 @@ import logging
 import os
 import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from platform import python_implementation
 
 import pytest  # type: ignore
 
-from nusex import Profile, Template
-from nusex.constants import CONFIG_DIR, LICENSE_DIR
+from nusex import Profile, Session, Template
+from nusex.constants import CONFIG_DIR, LICENSE_DIR, TEMPLATE_DIR
+from nusex.errors import DoesNotExist, ProfileError
+from nusex.spec import NSXSpecIO
+from nusex.utils import Substituter
 
 DEPLOY_DIR = Path(__file__).parent / "my_app"
 CALVER_DEPLOY_DIR = Path(__file__).parent / "calver_check"
+COMPRESSED_DEPLOY_DIR = Path(__file__).parent / "compressed"
+UNINDEXED_DEPLOY_DIR = Path(__file__).parent / "unindexed"
+PARALLEL_DEPLOY_DIR = Path(__file__).parent / "parallel"
+ROLLBACK_DEPLOY_DIR = Path(__file__).parent / "rollback"
+SESSION_DEPLOY_DIR = Path(__file__).parent / "session"
 
 
 def test_deploy_okay():
@@ -78,6 +87,178 @@ def test_deploy_okay():
     assert os.path.isfile(DEPLOY_DIR / ".nusexmeta")
 
 
+def test_deploy_compressed_okay():
+    os.makedirs(COMPRESSED_DEPLOY_DIR, exist_ok=True)
+
+    template = Template.from_dir(
+        "__test_deploy_z__",
+        Path(__file__).parent / "data/testarosa_py",
+    )
+    template.save(compress=True)
+    template = Template("__test_deploy_z__")
+    template.deploy(project_name="my_app", destination=COMPRESSED_DEPLOY_DIR)
+
+    for file in DEPLOY_DIR.rglob("*"):
+        if file.is_file() and file.name != ".nusexmeta":
+            other = COMPRESSED_DEPLOY_DIR / file.relative_to(DEPLOY_DIR)
+            assert file.read_bytes() == other.read_bytes()
+
+    template.delete()
+
+
+def test_deploy_unindexed_okay():
+    os.makedirs(UNINDEXED_DEPLOY_DIR, exist_ok=True)
+
+    # Files held in memory have no placeholder index, so they are
+    # searched instead.
+    template = Template("__test_deploy__")
+    template.data["files"] = dict(template.data["files"].items())
+    template.deploy(project_name="my_app", destination=UNINDEXED_DEPLOY_DIR)
+
+    for file in DEPLOY_DIR.rglob("*"):
+        if file.is_file() and file.name != ".nusexmeta":
+            other = UNINDEXED_DEPLOY_DIR / file.relative_to(DEPLOY_DIR)
+            assert file.read_bytes() == other.read_bytes()
+
+
+def test_deploy_parallel_okay():
+    template = Template("__test_deploy__")
+    template.deploy(
+        project_name="my_app", destination=PARALLEL_DEPLOY_DIR, jobs=4
+    )
+
+    for file in DEPLOY_DIR.rglob("*"):
+        other = PARALLEL_DEPLOY_DIR / file.relative_to(DEPLOY_DIR)
+        if file.is_dir():
+            assert other.is_dir()
+        elif file.name != ".nusexmeta":
+            assert file.read_bytes() == other.read_bytes()
+
+
+def test_deploy_rolls_back_on_failure(monkeypatch):
+    os.makedirs(ROLLBACK_DEPLOY_DIR, exist_ok=True)
+    (ROLLBACK_DEPLOY_DIR / "README.md").write_text("Mine\n")
+    (ROLLBACK_DEPLOY_DIR / "other.txt").write_text("Also mine\n")
+    template = Template("__test_deploy__")
+
+    # Fail partway through moving files into place.
+    replace = os.replace
+    calls = []
+
+    def failing_replace(src, dst):
+        calls.append(dst)
+        if len(calls) == 3:
+            raise OSError("No space left on device")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        template.deploy(project_name="my_app", destination=ROLLBACK_DEPLOY_DIR)
+    monkeypatch.undo()
+
+    assert sorted(p.name for p in ROLLBACK_DEPLOY_DIR.iterdir()) == [
+        "README.md",
+        "other.txt",
+    ]
+    assert (ROLLBACK_DEPLOY_DIR / "README.md").read_text() == "Mine\n"
+
+    template.deploy(
+        project_name="my_app", destination=ROLLBACK_DEPLOY_DIR, fsync=True
+    )
+    assert (ROLLBACK_DEPLOY_DIR / "README.md").read_bytes() == (
+        DEPLOY_DIR / "README.md"
+    ).read_bytes()
+    assert (ROLLBACK_DEPLOY_DIR / "other.txt").is_file()
+    assert not list(ROLLBACK_DEPLOY_DIR.glob(".nusex-*"))
+
+
+def test_deploy_session_okay():
+    with Session() as session:
+        template = session.template("__test_deploy__")
+        assert session.template("__test_deploy__") is template
+        assert session.profile() is session.profile()
+
+        def deploy(i):
+            session.deploy(
+                "__test_deploy__",
+                SESSION_DEPLOY_DIR / f"{i}",
+                "my_app",
+                {"author_name": f"Author {i}"} if i else None,
+            )
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(deploy, range(8)))
+
+        for file in DEPLOY_DIR.rglob("*"):
+            other = SESSION_DEPLOY_DIR / "0" / file.relative_to(DEPLOY_DIR)
+            if file.is_file() and file.name != ".nusexmeta":
+                assert file.read_bytes() == other.read_bytes()
+
+        for i in range(1, 8):
+            with open(SESSION_DEPLOY_DIR / f"{i}" / "pyproject.toml") as f:
+                assert f'authors = ["Author {i} <' in f.read()
+
+        with pytest.raises(DoesNotExist):
+            session.deploy("__test_missing__", SESSION_DEPLOY_DIR / "x")
+        with pytest.raises(ProfileError):
+            session.deploy(
+                template, SESSION_DEPLOY_DIR / "x", overrides={"nope": ""}
+            )
+
+
+@pytest.mark.skipif(
+    not os.path.isdir("/proc/self/fd"), reason="needs /proc/self/fd"
+)
+def test_session_closes_replaced_templates(monkeypatch):
+    path = TEMPLATE_DIR / "__test_session__.nsx"
+    dest = SESSION_DEPLOY_DIR / "rebuilt"
+    data = NSXSpecIO().defaults
+
+    def rebuild(i):
+        # Templates are replaced, not rewritten in place, as a build
+        # would.
+        data["files"] = {"README.md": b"PROJECTNAME\n" * i}
+        NSXSpecIO().write(f"{path}.tmp", data)
+        os.replace(f"{path}.tmp", path)
+
+    def open_fds():
+        return len(os.listdir("/proc/self/fd"))
+
+    rebuild(1)
+    with Session() as session:
+        session.deploy("__test_session__", dest, "my_app")
+        before = open_fds()
+
+        # Replaced templates are closed even if something still holds
+        # on to them.
+        held = [session.template("__test_session__")]
+        for i in range(2, 20):
+            rebuild(i)
+            session.deploy("__test_session__", dest, "my_app")
+            held.append(session.template("__test_session__"))
+            assert open_fds() <= before
+        assert (dest / "README.md").read_bytes() == b"my_app\n" * 19
+
+        # A template replaced during a deployment stays open until the
+        # deployment finishes.
+        deploy = Template.deploy
+
+        def rebuilding_deploy(self, **kwargs):
+            rebuild(20)
+            assert session.template("__test_session__") is not self
+            deploy(self, **kwargs)
+
+        monkeypatch.setattr(Template, "deploy", rebuilding_deploy)
+        session.deploy("__test_session__", dest, "my_app")
+        monkeypatch.undo()
+
+        assert (dest / "README.md").read_bytes() == b"my_app\n" * 19
+        assert open_fds() <= before
+
+    assert open_fds() < before
+    path.unlink()
+
+
 def test_init_file_okay():
     profile = Profile.current()
 
@@ -271,6 +452,33 @@ def test_requirements_file_okay():
     assert lines[0] == f"git+{profile['git_profile_url']}/my_app"
 
 
+def test_substituter_prefers_longest_placeholder():
+    sub = Substituter(
+        {
+            b"PROJECTAUTHOR": "Jane Doe",
+            b"PROJECTAUTHOREMAIL": "jane@example.com",
+        }
+    )
+    assert sub.sub(b"PROJECTAUTHOR <PROJECTAUTHOREMAIL>") == (
+        b"Jane Doe <jane@example.com>"
+    )
+
+
+def test_substituter_stream_matches_whole_body():
+    sub = Substituter(
+        {
+            b"PROJECTNAME": "my_app",
+            b"PROJECTAUTHOR": "Jane Doe",
+            b"PROJECTAUTHOREMAIL": "jane@example.com",
+        }
+    )
+    body = b"x PROJECTAUTHOREMAIL PROJECTNAME.PROJECTAUTHOR PROJECTNAM" * 50
+
+    for size in (1, 5, 17, 18, 19, 64, len(body)):
+        chunks = (body[i : i + size] for i in range(0, len(body), size))
+        assert b"".join(sub.sub_stream(chunks)) == sub.sub(body)
+
+
 @pytest.mark.skipif(
     python_implementation() == "PyPy",
     reason="Dependency installs do not work with PyPy",
@@ -294,3 +502,8 @@ def test_installs_okay():
 def test_clean_up():
     shutil.rmtree(DEPLOY_DIR)
     shutil.rmtree(CALVER_DEPLOY_DIR)
+    shutil.rmtree(COMPRESSED_DEPLOY_DIR)
+    shutil.rmtree(UNINDEXED_DEPLOY_DIR)
+    shutil.rmtree(PARALLEL_DEPLOY_DIR)
+    shutil.rmtree(ROLLBACK_DEPLOY_DIR)
+    shutil.rmtree(SESSION_DEPLOY_DIR)
@@ -0,0 +1,140 @@
+# Copyright (c) 2021, Ethan Henderson
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import datetime as dt
+import os
+import time
+
+import pytest  # type: ignore
+
+from nusex.cli import cli, updates
+from nusex.errors import DownloadError
+from nusex.spec import NSCSpecIO, nsc
+from nusex.utils import downloader
+
+TODAY = dt.date.today().strftime("%y%m%d")
+
+
+@pytest.fixture()
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(nsc, "CONFIG_FILE", tmp_path / "config.nsc")
+    monkeypatch.setattr(cli, "CONFIG_FILE", tmp_path / "config.nsc")
+    monkeypatch.setattr(updates, "STAMP_FILE", tmp_path / ".update-check")
+    monkeypatch.setattr(
+        updates, "DOWNLOAD_STAMP_FILE", tmp_path / ".update-download"
+    )
+
+    data = NSCSpecIO().defaults
+    data["last_update"] = "210101"
+    NSCSpecIO().write(data)
+    return data
+
+
+@pytest.fixture()
+def latest(tmp_path, monkeypatch):
+    path = tmp_path / "lastupdate.txt"
+    monkeypatch.setattr(updates, "LAST_UPDATE_URL", path.as_uri())
+    return path
+
+
+def test_due(config):
+    assert updates.due(config)
+
+    # Checks are only retried once RETRY_AFTER has passed.
+    updates.STAMP_FILE.touch()
+    assert not updates.due(config)
+    old = time.time() - updates.RETRY_AFTER - 1
+    os.utime(updates.STAMP_FILE, (old, old))
+    assert updates.due(config)
+
+    assert not updates.due({**config, "last_update": TODAY})
+    assert updates.due({**config, "last_update": "broken"})
+
+
+def test_check_finds_update(config, latest):
+    latest.write_text("220101\n")
+    assert updates.check()
+
+    data = NSCSpecIO().read()
+    assert data["update_available"]
+    assert data["last_update"] == TODAY
+
+    # Later checks find nothing new, but leave the flag alone.
+    assert updates.check()
+    assert NSCSpecIO().read()["update_available"]
+
+
+def test_check_finds_nothing(config, latest):
+    latest.write_text("200101\n")
+    assert updates.check()
+
+    data = NSCSpecIO().read()
+    assert not data["update_available"]
+    assert data["last_update"] == TODAY
+
+
+@pytest.mark.parametrize("body", [None, "not a date\n"])
+def test_check_fails_quietly(config, latest, body):
+    if body is not None:
+        latest.write_text(body)
+
+    assert not updates.check()
+    assert NSCSpecIO().read() == config
+
+
+def test_auto_update_offline(config, monkeypatch, capsys):
+    NSCSpecIO().write(
+        {**config, "auto_update": True, "update_available": True}
+    )
+    monkeypatch.setattr(updates, "due", lambda data: False)
+    attempts = []
+
+    def offline(self, **kwargs):
+        attempts.append((self.retries, self.timeout))
+        raise DownloadError("Could not connect")
+
+    monkeypatch.setattr(downloader.Downloader, "download", offline)
+    cli._check_for_updates()
+    assert "Could not download asset updates" in capsys.readouterr().out
+    assert NSCSpecIO().read()["update_available"]
+    # Commands wait on the download, so nothing is retried.
+    assert attempts == [(0, updates.CHECK_TIMEOUT)]
+
+    # Failed downloads are not attempted again until RETRY_AFTER has
+    # passed.
+    cli._check_for_updates()
+    assert not capsys.readouterr().out
+    assert len(attempts) == 1
+
+    # The flag is only cleared once the download succeeds.
+    old = time.time() - updates.RETRY_AFTER - 1
+    os.utime(updates.DOWNLOAD_STAMP_FILE, (old, old))
+    monkeypatch.setattr(downloader.Downloader, "download", lambda *a, **k: 0)
+    cli._check_for_updates()
+    assert not NSCSpecIO().read()["update_available"]
+    assert not updates.DOWNLOAD_STAMP_FILE.exists()